@@ -0,0 +1,67 @@
+"""Benchmark decoding API responses with each available JSON decoder.
+
+Decodes the valid API testcases (pages of illustrations, comments, tags, ...) repeatedly and
+reports the time per page for:
+    response.json: The previous behavior, requests.Response.json() on a response holding the page.
+    stdlib: The standard library decoder, given the raw bytes.
+    orjson: orjson, given the raw bytes (skipped when it is not installed).
+
+Only orjson is faster than response.json; the standard library decodes the bytes to a str itself,
+so it takes about as long, and the decoder only speeds up installs with orjson.
+
+Usage:
+    python benchmarks/decode_benchmark.py [repeat]
+
+"""
+
+import glob
+import json
+import os
+import sys
+import timeit
+
+import requests
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_TESTCASE_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'unit', 'api_testcases')
+
+
+def _response(content: bytes) -> requests.Response:
+    """Create a response holding a body, as requests builds it for a JSON response."""
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['Content-Type'] = 'application/json; charset=utf-8'
+    response.encoding = 'utf-8'
+    response._content = content  # pylint: disable=protected-access
+    return response
+
+
+def main(repeat: int = 200):
+    """Run the benchmark and print the time per page of each decoder."""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(_TESTCASE_DIR, '*_valid.json'))):
+        with open(path, 'rb') as testcase:
+            pages.extend(line for line in testcase.read().splitlines() if line)
+    size = sum(len(page) for page in pages)
+    print(f'{len(pages)} pages, {size / len(pages) / 1024:.1f} KiB per page on average')
+
+    responses = [_response(page) for page in pages]
+    decoders = [('response.json', lambda: [response.json() for response in responses]),
+                ('stdlib', lambda: [json.loads(page) for page in pages])]
+    if orjson is not None:
+        decoders.append(('orjson', lambda: [orjson.loads(page) for page in pages]))
+
+    baseline = None
+    for name, decode_pages in decoders:
+        seconds = min(timeit.repeat(decode_pages, number=repeat, repeat=3))
+        per_page = seconds / repeat / len(pages)
+        baseline = baseline or per_page
+        print(f'{name:>14}: {per_page * 1e6:8.1f} us per page  {baseline / per_page:5.2f}x')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,19 @@
+"""python-pixiv analytics package initialization."""
+
+from .columnar import (
+    IllustColumns,
+    StringDictionary,
+    to_columns
+)
+
+from .sketches import (
+    TagStats,
+    TopK,
+    CountMinSketch
+)
+
+from .trends import (
+    RankingTracker,
+    Movement,
+    Mover
+)
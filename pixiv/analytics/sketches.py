@@ -0,0 +1,266 @@
+"""Approximate tag frequency and co-occurrence statistics in bounded memory.
+
+Counting every tag, and every pair of tags appearing together, with a Counter grows with the number
+of distinct tags (and with its square for pairs).  TagStats instead keeps two sketches each for
+tags and for pairs, sized from a memory budget:
+    TopK: Heavy hitters (the mergeable variant of the Misra-Gries summary), keeping exact-ish
+        counts of the most frequent keys.  A count is never over-estimated, and is under-estimated
+        by at most total / (capacity + 1).
+    CountMinSketch: Estimated count of any key, never under-estimated, and over-estimated by at
+        most 2 * total / width with a probability of 1 - 1/2^depth.
+
+Every sketch is deterministic (the hashes do not depend on the process) and mergeable: the sketches
+of several sharded workers, built with the same budget, can be merged into the sketch of all of
+their input.
+
+Example:
+    >>> stats = TagStats(memory_budget=64 * 2**20)
+    >>> stats.add_illusts(api.get_rankings(token))
+    >>> stats.top_tags(10), stats.top_pairs(10)
+
+"""
+
+import hashlib
+import itertools
+from array import array
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from pixiv.analytics.columnar import IllustColumns
+
+_MASK_64 = (1 << 64) - 1
+
+# Rough number of bytes taken by each counter of a TopK: the dictionary slot, the count and the
+# key (a tag name, or a tuple of two tag names for a pair).
+_COUNTER_BYTES = 200
+
+
+def _hash(value: str) -> int:
+    """Hash a string to 64 bits, the same in every process."""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _mix(first: int, second: int) -> int:
+    """Combine two 64 bit hashes into the hash of the ordered pair (splitmix64 finalizer)."""
+    value = (first * 0x9E3779B97F4A7C15 + second) & _MASK_64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return value ^ (value >> 31)
+
+
+class CountMinSketch:
+    """Count-min sketch of the counts of hashed keys.
+
+    Attributes:
+        width: Number of counters per row.
+        depth: Number of rows.
+        total: Sum of every count added.
+
+    """
+
+    def __init__(self, width: int, depth: int = 4):
+        """Init an empty CountMinSketch."""
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._table = array('Q', bytes(8 * width * depth))
+
+    @classmethod
+    def from_budget(cls, nbytes: int, depth: int = 4) -> 'CountMinSketch':
+        """Create the widest sketch fitting in a number of bytes."""
+        return cls(max(1, nbytes // (8 * depth)), depth)
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes taken by the counters."""
+        return 8 * len(self._table)
+
+    def _slots(self, key_hash: int) -> Iterable[int]:
+        """Get the counter of each row for a key hash (double hashing)."""
+        first, second = key_hash & 0xFFFFFFFF, (key_hash >> 32) | 1
+        width = self.width
+        return [row * width + (first + row * second) % width for row in range(self.depth)]
+
+    def add_hash(self, key_hash: int, count: int = 1):
+        """Add to the count of a key by its 64 bit hash."""
+        table = self._table
+        for slot in self._slots(key_hash):
+            table[slot] += count
+        self.total += count
+
+    def estimate_hash(self, key_hash: int) -> int:
+        """Estimate the count of a key by its 64 bit hash."""
+        table = self._table
+        return min(table[slot] for slot in self._slots(key_hash))
+
+    def add(self, key: str, count: int = 1):
+        """Add to the count of a key."""
+        self.add_hash(_hash(key), count)
+
+    def estimate(self, key: str) -> int:
+        """Estimate the count of a key, never less than its true count."""
+        return self.estimate_hash(_hash(key))
+
+    def merge(self, other: 'CountMinSketch'):
+        """Add the counts of a sketch with the same dimensions into this sketch."""
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError('Only sketches with the same width and depth can be merged.')
+        table = self._table
+        for slot, count in enumerate(other._table):  # pylint: disable=protected-access
+            if count:
+                table[slot] += count
+        self.total += other.total
+
+
+class TopK:
+    """Heavy hitters summary keeping the counts of at most 2 * capacity keys.
+
+    Counts are exact until more than 2 * capacity distinct keys have been added.  From then on,
+    each time the summary is full, the (capacity + 1)-th largest count is subtracted from every
+    count and the keys left without a count are dropped.
+
+    Attributes:
+        capacity: Number of keys whose counts are guaranteed to be kept if they are frequent.
+        total: Sum of every count added.
+
+    """
+
+    def __init__(self, capacity: int):
+        """Init an empty TopK."""
+        self.capacity = capacity
+        self.total = 0
+        self._counts: Dict[Hashable, int] = {}
+
+    @classmethod
+    def from_budget(cls, nbytes: int) -> 'TopK':
+        """Create the largest summary fitting (roughly) in a number of bytes."""
+        return cls(max(1, nbytes // (2 * _COUNTER_BYTES)))
+
+    @property
+    def error(self) -> int:
+        """Largest amount by which a count may be under-estimated."""
+        return self.total // (self.capacity + 1)
+
+    def add(self, key: Hashable, count: int = 1):
+        """Add to the count of a key."""
+        counts = self._counts
+        counts[key] = counts.get(key, 0) + count
+        self.total += count
+        if len(counts) > 2 * self.capacity:
+            self._reduce()
+
+    def _reduce(self):
+        """Subtract the (capacity + 1)-th largest count, dropping the keys left at zero."""
+        values = sorted(self._counts.values(), reverse=True)
+        if len(values) <= self.capacity:
+            return
+        cut = values[self.capacity]
+        self._counts = {key: count - cut for key, count in self._counts.items() if count > cut}
+
+    def estimate(self, key: Hashable) -> int:
+        """Estimate the count of a key, never more than its true count."""
+        return self._counts.get(key, 0)
+
+    def top(self, number: Optional[int] = None) -> List[Tuple[Hashable, int]]:
+        """Get the keys with the largest counts, with their estimated counts."""
+        ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:self.capacity if number is None else min(number, self.capacity)]
+
+    def merge(self, other: 'TopK'):
+        """Add the counts of another summary into this summary."""
+        for key, count in other._counts.items():  # pylint: disable=protected-access
+            self._counts[key] = self._counts.get(key, 0) + count
+        self.total += other.total
+        if len(self._counts) > 2 * self.capacity:
+            self._reduce()
+
+
+class TagStats:
+    """Approximate tag frequencies and tag co-occurrences within a memory budget.
+
+    Half of the budget goes to the heavy hitter summaries and half to the count-min sketches,
+    with a quarter of each for tags and three quarters for pairs of tags.
+
+    Attributes:
+        illusts: Number of illustrations added.
+        tags: Heavy hitters of tags.
+        pairs: Heavy hitters of pairs of tags, each pair an alphabetically ordered tuple.
+        tag_sketch: Count-min sketch of tags.
+        pair_sketch: Count-min sketch of pairs of tags.
+
+    """
+
+    def __init__(self, memory_budget: int = 16 * 2**20, depth: int = 4):
+        """Init empty TagStats sized from a memory budget in bytes."""
+        self.memory_budget = memory_budget
+        self.illusts = 0
+        self.tags = TopK.from_budget(memory_budget // 8)
+        self.pairs = TopK.from_budget(memory_budget * 3 // 8)
+        self.tag_sketch = CountMinSketch.from_budget(memory_budget // 8, depth)
+        self.pair_sketch = CountMinSketch.from_budget(memory_budget * 3 // 8, depth)
+        self._hashes: Dict[str, int] = {}
+
+    def _hash(self, tag: str) -> int:
+        """Hash a tag, caching the hashes of the tags of the heavy hitter summary."""
+        tag_hash = self._hashes.get(tag)
+        if tag_hash is None:
+            tag_hash = _hash(tag)
+            if len(self._hashes) < 2 * self.tags.capacity:
+                self._hashes[tag] = tag_hash
+        return tag_hash
+
+    def add_tags(self, tags: Iterable[str], count: int = 1):
+        """Add the tags of a single illustration, counted 'count' times."""
+        tags = sorted(set(tags))
+        hashes = [self._hash(tag) for tag in tags]
+        for tag, tag_hash in zip(tags, hashes):
+            self.tags.add(tag, count)
+            self.tag_sketch.add_hash(tag_hash, count)
+        for (first, first_hash), (second, second_hash) in itertools.combinations(
+                zip(tags, hashes), 2):
+            self.pairs.add((first, second), count)
+            self.pair_sketch.add_hash(_mix(first_hash, second_hash), count)
+        self.illusts += count
+
+    def add_illusts(self, illusts: Iterable[Dict[str, Any]]):
+        """Add the tags of every illustration of a stream, i.e. an API generator."""
+        for illust in illusts:
+            self.add_tags(tag['name'] for tag in illust.get('tags') or ())
+
+    def add_columns(self, chunk: IllustColumns):
+        """Add the tags of every illustration of a chunk of columns (see to_columns)."""
+        dictionary, offsets, codes = chunk.dictionary, chunk.tag_offsets, chunk.tag_codes
+        for index in range(len(chunk)):
+            self.add_tags(dictionary[code] for code in codes[offsets[index]:offsets[index + 1]])
+
+    def add_bookmark_tags(self, bookmark_tags: Iterable[Dict[str, Any]]):
+        """Add tag counts from get_bookmark_tags, each tag counted as many times as it is used."""
+        for bookmark_tag in bookmark_tags:
+            self.tags.add(bookmark_tag['name'], bookmark_tag['count'])
+            self.tag_sketch.add_hash(self._hash(bookmark_tag['name']), bookmark_tag['count'])
+
+    def top_tags(self, number: int = 10) -> List[Tuple[str, int]]:
+        """Get the most frequent tags with their (under-)estimated counts."""
+        return self.tags.top(number)
+
+    def top_pairs(self, number: int = 10) -> List[Tuple[Tuple[str, str], int]]:
+        """Get the most frequent pairs of tags with their (under-)estimated counts."""
+        return self.pairs.top(number)
+
+    def tag_count(self, tag: str) -> int:
+        """Estimate the number of illustrations with a tag, never less than the true count."""
+        return self.tag_sketch.estimate_hash(_hash(tag))
+
+    def pair_count(self, first: str, second: str) -> int:
+        """Estimate the number of illustrations with both tags, never less than the true count."""
+        first, second = sorted((first, second))
+        return self.pair_sketch.estimate_hash(_mix(_hash(first), _hash(second)))
+
+    def merge(self, other: 'TagStats'):
+        """Add the statistics of another TagStats, created with the same budget, into these."""
+        if other.memory_budget != self.memory_budget:
+            raise ValueError('Only TagStats with the same memory budget can be merged.')
+        self.tags.merge(other.tags)
+        self.pairs.merge(other.pairs)
+        self.tag_sketch.merge(other.tag_sketch)
+        self.pair_sketch.merge(other.pair_sketch)
+        self.illusts += other.illusts
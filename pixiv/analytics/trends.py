@@ -0,0 +1,381 @@
+"""Incremental tracking of ranking movements.
+
+RankingTracker records each poll of the rankings as a compact snapshot in a SQLite database: the
+ranked illustration IDs in rank order with their view and bookmark counts, encoded as variable
+length integers.  IDs are delta-encoded against the previous ID of the snapshot, and the counts of
+an illustration already in the previous snapshot of the same mode against its counts there.  Every
+'keyframe_interval' snapshots, one is stored without a previous snapshot, so decoding any snapshot
+takes at most that many snapshots.
+
+As each snapshot comes in, the movement of every illustration since the previous snapshot (rank
+change, and bookmarks and views gained per hour) is computed and summed into one row per mode,
+day and illustration.  Top movers over the last N days are then read from those daily rows,
+without decoding any snapshot.
+
+Example:
+    >>> with RankingTracker('rankings.db') as tracker:
+    ...     tracker.poll(token, modes=[RANK_MODE.DAY, RANK_MODE.WEEK])
+    ...     tracker.top_movers(RANK_MODE.DAY, days=7, by='bookmark_gain')
+
+"""
+
+import datetime
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pixiv.api import api
+from pixiv.api.data import FILTER, RANK_MODE
+from pixiv.common.data import AuthToken
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id          INTEGER PRIMARY KEY,
+    mode        TEXT NOT NULL,
+    taken_at    REAL NOT NULL,
+    base_id     INTEGER,
+    data        BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_mode ON snapshots (mode, id);
+CREATE TABLE IF NOT EXISTS movement (
+    mode            TEXT NOT NULL,
+    day             TEXT NOT NULL,
+    illust_id       INTEGER NOT NULL,
+    first_rank      INTEGER NOT NULL,
+    last_rank       INTEGER NOT NULL,
+    best_rank       INTEGER NOT NULL,
+    rank_gain       INTEGER NOT NULL,
+    bookmark_gain   INTEGER NOT NULL,
+    view_gain       INTEGER NOT NULL,
+    PRIMARY KEY (mode, day, illust_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS movement_day ON movement (mode, day);
+"""
+
+# An UPDATE of every row of a snapshot, followed by an INSERT OR IGNORE of every row, which only
+# adds the rows the UPDATE did not find, rather than an INSERT ... ON CONFLICT DO UPDATE which
+# needs SQLite 3.24.
+_UPDATE_MOVEMENT = """
+UPDATE movement SET
+    last_rank = ?,
+    best_rank = min(best_rank, ?),
+    rank_gain = rank_gain + ?,
+    bookmark_gain = bookmark_gain + ?,
+    view_gain = view_gain + ?
+WHERE mode = ? AND day = ? AND illust_id = ?
+"""
+
+_INSERT_MOVEMENT = """
+INSERT OR IGNORE INTO movement (mode, day, illust_id, first_rank, last_rank, best_rank,
+                                rank_gain, bookmark_gain, view_gain)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_MOVER_ORDER = ('rank_gain', 'bookmark_gain', 'view_gain')
+
+# Counts of an illustration in a snapshot: (rank, total_view, total_bookmarks)
+_Entry = Tuple[int, int, int]
+
+
+def _write_varint(out: bytearray, value: int):
+    """Append a signed integer as a zigzag encoded variable length integer."""
+    value = (value << 1) ^ (value >> 63)
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varints(data: bytes) -> List[int]:
+    """Decode every zigzag encoded variable length integer of a buffer."""
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append((value >> 1) ^ -(value & 1))
+        value = shift = 0
+    return values
+
+
+def encode_snapshot(entries: List[Tuple[int, int, int]],
+                    base: Optional[Dict[int, _Entry]] = None) -> bytes:
+    """Encode a snapshot, delta-encoded against the previous snapshot.
+
+    Args:
+        entries: (illust ID, total views, total bookmarks) of each illustration in rank order.
+        base: The decoded previous snapshot, None to encode the snapshot on its own.
+
+    Returns:
+        The encoded snapshot.
+
+    """
+    out = bytearray()
+    _write_varint(out, len(entries))
+    previous_id = 0
+    for illust_id, views, bookmarks in entries:
+        _write_varint(out, illust_id - previous_id)
+        previous_id = illust_id
+        _, base_views, base_bookmarks = (base or {}).get(illust_id, (0, 0, 0))
+        _write_varint(out, views - base_views)
+        _write_varint(out, bookmarks - base_bookmarks)
+    return bytes(out)
+
+
+def decode_snapshot(data: bytes, base: Optional[Dict[int, _Entry]] = None) -> Dict[int, _Entry]:
+    """Decode a snapshot encoded by encode_snapshot against the same base.
+
+    Returns:
+        Each illustration ID mapped to its (rank, total views, total bookmarks), in rank order.
+
+    """
+    values = _read_varints(data)
+    snapshot = {}
+    illust_id = 0
+    for rank in range(1, values[0] + 1):
+        id_delta, views, bookmarks = values[3 * rank - 2:3 * rank + 1]
+        illust_id += id_delta
+        _, base_views, base_bookmarks = (base or {}).get(illust_id, (0, 0, 0))
+        snapshot[illust_id] = (rank, base_views + views, base_bookmarks + bookmarks)
+    return snapshot
+
+
+class Movement:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
+    """Represent the movement of an illustration between two snapshots of a ranking.
+
+    Attributes:
+        illust_id: The illustration ID.
+        rank: Rank in the new snapshot.
+        previous_rank: Rank in the previous snapshot, None if it was not ranked.
+        rank_change: Number of ranks gained (negative when falling).  An illustration entering
+            the ranking is counted as coming from just below the last rank of the previous
+            snapshot.
+        bookmark_velocity: Bookmarks gained per hour, None if it was not ranked.
+        view_velocity: Views gained per hour, None if it was not ranked.
+
+    """
+
+    __slots__ = ['illust_id', 'rank', 'previous_rank', 'rank_change', 'bookmark_velocity',
+                 'view_velocity']
+    def __init__(self, illust_id: int, rank: int, previous_rank: Optional[int], rank_change: int,
+                 bookmark_velocity: Optional[float], view_velocity: Optional[float]):
+        """Init Movement with the ranks and velocities of an illustration."""
+        self.illust_id = illust_id
+        self.rank = rank
+        self.previous_rank = previous_rank
+        self.rank_change = rank_change
+        self.bookmark_velocity = bookmark_velocity
+        self.view_velocity = view_velocity
+
+
+class Mover:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
+    """Represent the total movement of an illustration over a number of days.
+
+    Attributes:
+        illust_id: The illustration ID.
+        rank_gain: Number of ranks gained.
+        bookmark_gain: Bookmarks gained while ranked.
+        view_gain: Views gained while ranked.
+        best_rank: Best rank reached.
+        last_rank: Rank in the last snapshot it was ranked in.
+
+    """
+
+    __slots__ = ['illust_id', 'rank_gain', 'bookmark_gain', 'view_gain', 'best_rank', 'last_rank']
+    def __init__(self, illust_id: int, rank_gain: int, bookmark_gain: int, view_gain: int,
+                 best_rank: int, last_rank: int):
+        """Init Mover with the totals of an illustration."""
+        self.illust_id = illust_id
+        self.rank_gain = rank_gain
+        self.bookmark_gain = bookmark_gain
+        self.view_gain = view_gain
+        self.best_rank = best_rank
+        self.last_rank = last_rank
+
+
+class RankingTracker:
+    """SQLite store of ranking snapshots and of the daily movement of each ranked illustration.
+
+    Attributes:
+        keyframe_interval: Number of snapshots of a mode between two snapshots stored without a
+            base.
+
+    """
+
+    def __init__(self, path: str, keyframe_interval: int = 32):
+        """Init RankingTracker, creating the database and its schema if they do not exist."""
+        self.keyframe_interval = keyframe_interval
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.executescript(_SCHEMA)
+        # Per mode: (snapshot ID, time taken, decoded snapshot, snapshots since the keyframe)
+        self._latest: Dict[str, Tuple[int, float, Dict[int, _Entry], int]] = {}
+
+    def __enter__(self) -> 'RankingTracker':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the database."""
+        self._db.close()
+
+    def _chain(self, snapshot_id: int) -> Tuple[Dict[int, _Entry], int]:
+        """Decode a snapshot, and count the snapshots since its keyframe."""
+        chain = []
+        while snapshot_id is not None:
+            snapshot_id, data = self._db.execute(
+                'SELECT base_id, data FROM snapshots WHERE id = ?', (snapshot_id,)).fetchone()
+            chain.append(data)
+        snapshot = None
+        for data in reversed(chain):
+            snapshot = decode_snapshot(data, snapshot)
+        return snapshot, len(chain)
+
+    def _previous(self, mode: str) -> Optional[Tuple[int, float, Dict[int, _Entry], int]]:
+        """Get the latest snapshot of a mode, decoding it from the database on first use."""
+        if mode not in self._latest:
+            row = self._db.execute(
+                'SELECT id, taken_at FROM snapshots WHERE mode = ? ORDER BY id DESC LIMIT 1',
+                (mode,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._latest[mode] = (row[0], row[1], *self._chain(row[0]))
+        return self._latest[mode]
+
+    def snapshot(self, snapshot_id: int) -> Dict[int, _Entry]:
+        """Decode a stored snapshot.
+
+        Returns:
+            Each illustration ID mapped to its (rank, total views, total bookmarks), in rank order.
+
+        """
+        return self._chain(snapshot_id)[0]
+
+    def snapshots(self, mode: str) -> List[Tuple[int, float]]:
+        """Get the (snapshot ID, epoch time taken) of every stored snapshot of a mode."""
+        return self._db.execute(
+            'SELECT id, taken_at FROM snapshots WHERE mode = ? ORDER BY id', (mode,)).fetchall()
+
+    def add_snapshot(self, mode: str, illusts: Iterable[Dict[str, Any]],
+                     taken_at: Optional[float] = None) -> List[Movement]:
+        """Record a poll of a ranking and compute the movement since the previous poll.
+
+        Args:
+            mode: The ranking mode (see RANK_MODE).
+            illusts: The ranked illustrations in rank order, each with at least 'id',
+                'total_view' and 'total_bookmarks'.
+            taken_at: Epoch time of the poll, now by default.
+
+        Returns:
+            The movement of each illustration of the snapshot, in rank order.
+
+        """
+        taken_at = time.time() if taken_at is None else taken_at
+        entries = [
+            (illust['id'], illust.get('total_view') or 0, illust.get('total_bookmarks') or 0)
+            for illust in illusts
+        ]
+        previous = self._previous(mode)
+        if previous is None or previous[3] >= self.keyframe_interval:
+            base_id, base, since_keyframe = None, None, 1
+        else:
+            base_id, base, since_keyframe = previous[0], previous[2], previous[3] + 1
+        data = encode_snapshot(entries, base)
+
+        prior = {} if previous is None else previous[2]
+        hours = None if previous is None else max(taken_at - previous[1], 1.0) / 3600
+        entering_rank = len(prior) + 1
+        day = datetime.datetime.fromtimestamp(taken_at, datetime.timezone.utc).date().isoformat()
+        movements = []
+        rows = []
+        for rank, (illust_id, views, bookmarks) in enumerate(entries, 1):
+            if illust_id in prior:
+                previous_rank, previous_views, previous_bookmarks = prior[illust_id]
+                view_gain, bookmark_gain = views - previous_views, bookmarks - previous_bookmarks
+                movements.append(Movement(illust_id, rank, previous_rank, previous_rank - rank,
+                                          bookmark_gain / hours, view_gain / hours))
+            else:
+                view_gain = bookmark_gain = 0
+                movements.append(Movement(
+                    illust_id, rank, None, 0 if previous is None else entering_rank - rank,
+                    None, None
+                ))
+            rows.append((mode, day, illust_id, rank, rank, rank, movements[-1].rank_change,
+                         bookmark_gain, view_gain))
+
+        with self._db:
+            cursor = self._db.execute(
+                'INSERT INTO snapshots (mode, taken_at, base_id, data) VALUES (?, ?, ?, ?)',
+                (mode, taken_at, base_id, data)
+            )
+            # The first rank of a day is kept, the rest of the row is merged.
+            self._db.executemany(_UPDATE_MOVEMENT, [row[4:] + row[:3] for row in rows])
+            self._db.executemany(_INSERT_MOVEMENT, rows)
+        snapshot = {illust_id: (rank, views, bookmarks)
+                    for rank, (illust_id, views, bookmarks) in enumerate(entries, 1)}
+        self._latest[mode] = (cursor.lastrowid, taken_at, snapshot, since_keyframe)
+        return movements
+
+    def poll(self, auth_token: AuthToken, modes: Iterable[str] = (RANK_MODE.DAY,),
+             filter: str = FILTER.FOR_ANDROID) -> Dict[str, List[Movement]]:  # pylint: disable=redefined-builtin
+        """Take a snapshot of the rankings of each mode.
+
+        Args:
+            auth_token: OAuth bearer token, or an AccountPool.
+            modes: The ranking modes to poll.
+            filter: Filter option.
+
+        Returns:
+            Each mode mapped to the movement of its ranked illustrations.
+
+        """
+        return {
+            mode: self.add_snapshot(mode, api.get_rankings(
+                auth_token, filter=filter, mode=mode, fields=['id', 'total_view', 'total_bookmarks']
+            ))
+            for mode in modes
+        }
+
+    def top_movers(self, mode: str, days: int = 1, by: str = 'rank_gain', limit: int = 10,
+                   until: Optional[float] = None) -> List[Mover]:
+        """Get the illustrations which moved the most over the last days.
+
+        Args:
+            mode: The ranking mode.
+            days: Number of days, counting the day of 'until'.
+            by: Order of the movers, one of 'rank_gain', 'bookmark_gain' or 'view_gain'.
+            limit: Maximum number of movers.
+            until: Epoch time of the last day, now by default.
+
+        Returns:
+            The movers, from the largest gain.
+
+        """
+        if by not in _MOVER_ORDER:
+            raise ValueError(f"Unknown mover order '{by}'.")
+        until = time.time() if until is None else until
+        last_day = datetime.datetime.fromtimestamp(until, datetime.timezone.utc).date()
+        first_day = (last_day - datetime.timedelta(days=days - 1)).isoformat()
+        rows = self._db.execute(
+            f"""
+            SELECT illust_id, sum(rank_gain) AS rank_gain, sum(bookmark_gain) AS bookmark_gain,
+                   sum(view_gain) AS view_gain, min(best_rank),
+                   (SELECT last_rank FROM movement AS latest
+                    WHERE latest.mode = movement.mode AND latest.illust_id = movement.illust_id
+                      AND latest.day <= ?
+                    ORDER BY latest.day DESC LIMIT 1)
+            FROM movement
+            WHERE mode = ? AND day BETWEEN ? AND ?
+            GROUP BY illust_id
+            ORDER BY {by} DESC, illust_id
+            LIMIT ?
+            """,
+            (last_day.isoformat(), mode, first_day, last_day.isoformat(), limit)
+        ).fetchall()
+        return [Mover(*row) for row in rows]
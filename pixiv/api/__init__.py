@@ -7,12 +7,41 @@ from .api import (
     get_recommended,
     get_articles,
     get_related,
-    get_rankings
+    get_rankings,
+    search_illust,
+    get_following,
+    get_followers,
+    get_comment_replies
+)
+
+from .crawl import (
+    search_illust_partitioned,
+    get_comment_threads,
+    get_comment_threads_many,
+    crawl_articles
+)
+
+from .graph import (
+    FollowGraphCrawler
+)
+
+from .sharding import (
+    CrawlTask,
+    crawl_sharded
 )
 
 from .data import (
     RESTRICT,
     FILTER,
     ARTICLE_CATEGORY,
-    RANK_MODE
+    RANK_MODE,
+    SEARCH_TARGET,
+    SEARCH_SORT,
+    ON_DEADLINE
+)
+
+from .jobs import (
+    JobQueue,
+    Worker,
+    JOB_STATE
 )
@@ -3,20 +3,65 @@
 Layer above the models module for repeatedly making an API call to retrieve the next chunk of data
 and extracts the data of interest from the JSON response.
 
+Every function accepts an auth.AccountPool in place of an AuthToken, in which case each request is
+made with one of the healthy accounts in the pool.
+
+Functions with a record class accept as_records=True to yield compact records (see the records
+module) instead of dictionaries.  Every function accepts fields=[...] to keep only the listed
+fields of each item, i.e. fields=['id', 'title', 'user.id'], dropping the rest of each response as
+soon as it is received.  Every function accepts stream=True to yield each item while its
+response is still being downloaded, and pages=True to yield each response as a single Page of items
+instead, i.e. for bulk inserts.  Passing the 'next_url' of a page as cursor=... resumes a listing
+from the page after it.  Passing deadline=... bounds the time of the whole listing, including
+retries and token renewals, after which it stops (or raises, see ON_DEADLINE).
+
 """
 
 import urllib.parse as urlparse
 from typing import Optional, Iterator, Dict, List, Callable, Any
 
-from pixiv.api import models
-from pixiv.api.decors import generate_data
+from pixiv.api import models, records, schemas
+from pixiv.api.decors import generate_data, resume_cursor
 from pixiv.api.data import (
     RESTRICT,
     ARTICLE_CATEGORY,
     FILTER,
-    RANK_MODE
+    RANK_MODE,
+    SEARCH_TARGET,
+    SEARCH_SORT
 )
 from pixiv.common.data import AuthToken
+from pixiv.common.stream import StreamedResponse
+
+
+def _next_url(
+        json: Dict[str, Any],
+        kwargs: Dict[str, Any],
+        param_keys: List[str]
+    ) -> Optional[str]:
+    """Get the 'next_url' of a JSON response, setting its query parameters to the kwargs.
+
+    Args:
+        json: The JSON response.
+        kwargs: api_model arguments, updated with the parameters for the next API request.
+        param_keys: Keys within the 'next_url' query to be extracted.
+
+    Returns:
+        The 'next_url' of the response.
+
+    """
+    # If next_url key not in the response, set to None to stop next iteration.
+    # Makes the fn more flexible in case the json schema changes in the future.
+    if 'next_url' not in json.keys():
+        json['next_url'] = None
+    next_url = json['next_url']
+
+    # If requires any parameter from the JSON response, set it to the kwargs
+    if next_url is not None and next_url != "":
+        parsed = urlparse.urlparse(next_url)
+        for param_key in param_keys:
+            kwargs[param_key] = urlparse.parse_qs(parsed.query)[param_key][0]
+    return next_url
 
 
 def _call_api(
@@ -38,7 +83,11 @@ def _call_api(
             that is in your bookmarks.
 
     The JSON response is returned so the API function may perform validation, raise API specific
-    errors if a key is missing, and yield each item in the list.
+    errors if a key is missing, and yield each item in the list.  A StreamedResponse (see the
+    pixiv.common.stream module) is returned as is, and its 'next_url' read once it was iterated.
+
+    When started within a resuming block (see pixiv.api.decors), the query parameters of its cursor
+    are parsed first, so the first API request is for the page following the cursor's.
 
     Using the 'next_url' key in the JSON response, the query parameters in the URL are parsed and
     makes another API request. The function continues this loop until the 'next_url' key is
@@ -59,31 +108,32 @@ def _call_api(
 
     """
     try:
-        json = {'next_url': 'first_run'}
+        next_url = 'first_run'
+        cursor = resume_cursor()
+        if cursor:
+            next_url = _next_url({'next_url': cursor}, kwargs, param_keys)
 
-        while json['next_url'] is not None or json['next_url'] != "":
+        while next_url is not None and next_url != "":
 
             # Get raw JSON response
             json = api_model(**kwargs)
 
-            # If next_url key not in the response, set to None to stop next iteration.
-            # Makes the fn more flexible in case the json schema changes in the future.
-            if 'next_url' not in json.keys():
-                json['next_url'] = None
-
-            # If requires any parameter from the JSON response, set it to the kwargs
-            if json['next_url'] is not None and json['next_url'] != "" and json['next_url'] != 'first_run':
-                parsed = urlparse.urlparse(json['next_url'])
-                for param_key in param_keys:
-                    kwargs[param_key] = urlparse.parse_qs(parsed.query)[param_key][0]
-            yield json
+            if isinstance(json, StreamedResponse):
+                # The next_url key follows the list, so it is only parsed once the list was read.
+                yield json
+                next_url = _next_url(json.rest, kwargs, param_keys)
+            else:
+                # Kept apart from the response, which the caller may release once it is yielded.
+                next_url = _next_url(json, kwargs, param_keys)
+                yield json
+            del json
     except StopIteration:
         return
     except Exception as ex:
         raise ex
 
 
-@generate_data(list_key='bookmark_tags')
+@generate_data(list_key='bookmark_tags', schema=schemas.BOOKMARK_TAGS, record=records.BookmarkTag)
 def get_bookmark_tags(
         auth_token: AuthToken,
         user_id: str,
@@ -118,7 +168,7 @@ def get_bookmark_tags(
     )
 
 
-@generate_data(list_key='illusts')
+@generate_data(list_key='illusts', schema=schemas.ILLUSTS, record=records.Illust)
 def get_bookmarks(
         auth_token: AuthToken,
         user_id: str,
@@ -154,7 +204,7 @@ def get_bookmarks(
     )
 
 
-@generate_data(list_key='comments')
+@generate_data(list_key='comments', schema=schemas.COMMENTS, record=records.Comment)
 def get_illust_comments(
         auth_token: AuthToken,
         illust_id: str,
@@ -178,14 +228,14 @@ def get_illust_comments(
         api_model=models.get_illust_comments,
         kwargs={
             'illust_id': illust_id,
-            'offset': str(offset),
+            'offset': None if offset is None else str(offset),
             'auth_token': auth_token
         },
         param_keys=['offset']
     )
 
 
-@generate_data(list_key='illusts')
+@generate_data(list_key='illusts', schema=schemas.RECOMMENDED, record=records.Illust)
 def get_recommended(
         auth_token: AuthToken,
         filter: str = FILTER.FOR_ANDROID,
@@ -236,11 +286,12 @@ def get_recommended(
     )
 
 
-@generate_data(list_key='spotlight_articles')
+@generate_data(list_key='spotlight_articles', schema=schemas.ARTICLES, record=records.Article)
 def get_articles(
         auth_token: AuthToken,
         filter: str = FILTER.FOR_ANDROID,
-        category: str = ARTICLE_CATEGORY.ALL
+        category: str = ARTICLE_CATEGORY.ALL,
+        offset: Optional[str] = None
     ) -> Iterator[Dict[str, Any]]:
     """Retrieve Pixiv articles for a particular category.
 
@@ -248,6 +299,7 @@ def get_articles(
         auth_token: OAuth bearer token.
         filter: Filter option.
         category: Option which specifies the category to retrieve articles from.
+        offset: Offset from the start of a list containing all of the articles in the category.
 
     Yields:
         The next article in JSON format.
@@ -261,13 +313,14 @@ def get_articles(
         kwargs={
             'filter': filter,
             'category': category,
+            'offset': offset,
             'auth_token': auth_token
         },
         param_keys=['offset']
     )
 
 
-@generate_data(list_key='illusts')
+@generate_data(list_key='illusts', schema=schemas.ILLUSTS, record=records.Illust)
 def get_related(
         auth_token: AuthToken,
         illust_id: str,
@@ -300,7 +353,7 @@ def get_related(
     )
 
 
-@generate_data(list_key='illusts')
+@generate_data(list_key='illusts', schema=schemas.ILLUSTS, record=records.Illust)
 def get_rankings(
         auth_token: AuthToken,
         filter: str = FILTER.FOR_ANDROID,
@@ -332,3 +385,155 @@ def get_rankings(
         },
         param_keys=['mode', 'offset', 'filter']
     )
+
+
+@generate_data(list_key='illusts', schema=schemas.ILLUSTS, record=records.Illust)
+def search_illust(
+        auth_token: AuthToken,
+        word: str,
+        search_target: str = SEARCH_TARGET.PARTIAL_MATCH_FOR_TAGS,
+        sort: str = SEARCH_SORT.DATE_DESC,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        filter: str = FILTER.FOR_ANDROID,
+        offset: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+    """Search for illustrations matching a query.
+
+    Pixiv refuses to return results past a maximum offset (see crawl.MAX_SEARCH_OFFSET), so a broad
+    query cannot be fully enumerated by paging alone.  Use crawl.search_illust_partitioned to
+    retrieve every result of such a query.
+
+    Args:
+        auth_token: OAuth bearer token.
+        word: The search query, i.e. a tag.
+        search_target: Search target option.
+        sort: Search sort option.
+        start_date: Optional parameter specifying the earliest upload date (YYYY-MM-DD).
+        end_date: Optional parameter specifying the latest upload date (YYYY-MM-DD).
+        filter: Filter option.
+        offset: Offset from the start of a list containing all of the search results.
+
+    Yields:
+        The next illustration matching the search query in JSON format.
+
+    Raises:
+        ApiError: An exception occurred while making the API request.
+
+    """
+    return _call_api(
+        api_model=models.search_illust,
+        kwargs={
+            'word': word,
+            'search_target': search_target,
+            'sort': sort,
+            'start_date': start_date,
+            'end_date': end_date,
+            'filter': filter,
+            'offset': offset,
+            'auth_token': auth_token
+        },
+        param_keys=['offset']
+    )
+
+
+@generate_data(list_key='user_previews', schema=schemas.USER_PREVIEWS)
+def get_following(
+        auth_token: AuthToken,
+        user_id: str,
+        restrict: str = RESTRICT.PUBLIC,
+        offset: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+    """Retrieve the users that a specified user is following.
+
+    Args:
+        auth_token: OAuth bearer token.
+        user_id: Pixiv user ID.
+        restrict: Work restriction option.
+        offset: Optional parameter specifying the offset into the user's complete list of
+            followed users.
+
+    Yields:
+        The next followed user, including a preview of their works, in JSON format.
+
+    Raises:
+        ApiError: An exception occurred while making the API request.
+
+    """
+    return _call_api(
+        api_model=models.get_following,
+        kwargs={
+            'user_id': user_id,
+            'restrict': restrict,
+            'offset': offset,
+            'auth_token': auth_token
+        },
+        param_keys=['offset']
+    )
+
+
+@generate_data(list_key='user_previews', schema=schemas.USER_PREVIEWS)
+def get_followers(
+        auth_token: AuthToken,
+        user_id: str,
+        filter: str = FILTER.FOR_ANDROID,
+        offset: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+    """Retrieve the users following a specified user.
+
+    Args:
+        auth_token: OAuth bearer token.
+        user_id: Pixiv user ID.
+        filter: Filter option.
+        offset: Optional parameter specifying the offset into the user's complete list of
+            followers.
+
+    Yields:
+        The next follower, including a preview of their works, in JSON format.
+
+    Raises:
+        ApiError: An exception occurred while making the API request.
+
+    """
+    return _call_api(
+        api_model=models.get_followers,
+        kwargs={
+            'user_id': user_id,
+            'filter': filter,
+            'offset': offset,
+            'auth_token': auth_token
+        },
+        param_keys=['offset']
+    )
+
+
+@generate_data(list_key='comments', schema=schemas.COMMENTS, record=records.Comment)
+def get_comment_replies(
+        auth_token: AuthToken,
+        comment_id: str,
+        offset: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+    """Retrieve the replies to a comment on an illustration.
+
+    Args:
+        auth_token: OAuth bearer token.
+        comment_id: Pixiv comment ID.
+        offset: Optional parameter specifying the offset into a comment's complete list of
+            replies.
+
+    Yields:
+        The next reply to a particular comment in JSON format.
+
+    Raises:
+        ApiError: An exception occurred while making the API request.
+
+    """
+    return _call_api(
+        api_model=models.get_comment_replies,
+        kwargs={
+            'comment_id': comment_id,
+            'offset': offset,
+            'auth_token': auth_token
+        },
+        param_keys=['offset']
+    )
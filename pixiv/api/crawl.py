@@ -0,0 +1,274 @@
+"""Concurrent crawls built on top of the API functions.
+
+The API functions retrieve a single listing one page at a time.  The functions in this module
+combine many of those listings, running them on a pool of threads, to retrieve data sets which
+cannot be reached (or reached quickly enough) by paging through a single listing.
+
+"""
+
+import collections
+import datetime
+import warnings
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional, Iterable, Iterator, Dict, List, Tuple, Any
+
+from pixiv.api import api
+from pixiv.api.data import FILTER, ARTICLE_CATEGORY, SEARCH_TARGET, SEARCH_SORT
+from pixiv.common.concurrency import run_tasks
+from pixiv.common.data import AuthToken
+from pixiv.common.idset import IdSet
+
+# Pixiv rejects search requests with an offset above this value.
+MAX_SEARCH_OFFSET = 5000
+
+_ONE_DAY = datetime.timedelta(days=1)
+
+# Every article category, except for ARTICLE_CATEGORY.ALL which overlaps with all of them.
+_ARTICLE_CATEGORIES = (
+    ARTICLE_CATEGORY.SPOTLIGHT,
+    ARTICLE_CATEGORY.ILLUST,
+    ARTICLE_CATEGORY.MANGA,
+    ARTICLE_CATEGORY.COSPLAY
+)
+
+
+def _upload_date(illust: Dict[str, Any]) -> datetime.date:
+    """Get the upload date of an illustration from its 'create_date' (ISO 8601) value."""
+    return datetime.datetime.strptime(illust['create_date'][:10], '%Y-%m-%d').date()
+
+
+def _split_window(start: datetime.date, end: datetime.date,
+                  parts: int) -> Iterator[Tuple[datetime.date, datetime.date]]:
+    """Split an inclusive date window into at most 'parts' non-overlapping windows."""
+    days = (end - start).days + 1
+    parts = max(1, min(parts, days))
+    for i in range(parts):
+        window_start = start + datetime.timedelta(days=days * i // parts)
+        window_end = start + datetime.timedelta(days=days * (i + 1) // parts) - _ONE_DAY
+        yield window_start, window_end
+
+
+def search_illust_partitioned(
+        auth_token: AuthToken,
+        word: str,
+        start_date: datetime.date,
+        end_date: Optional[datetime.date] = None,
+        search_target: str = SEARCH_TARGET.PARTIAL_MATCH_FOR_TAGS,
+        filter: str = FILTER.FOR_ANDROID,
+        max_workers: int = 4
+    ) -> Iterator[Dict[str, Any]]:
+    """Retrieve every illustration matching a search query within a date range.
+
+    The date range is split into windows which are searched in parallel, newest illustration
+    first.  Once a window reaches MAX_SEARCH_OFFSET results, the part of the window that has not
+    been retrieved yet (everything uploaded before the oldest illustration seen so far) is split in
+    half and both halves are searched.  This repeats until every window fits under the offset cap.
+    Illustrations returned by more than one window are only yielded once.
+
+    A single day with more results than MAX_SEARCH_OFFSET cannot be split any further, so only the
+    newest MAX_SEARCH_OFFSET illustrations of that day are retrieved and a warning is issued.
+
+    Args:
+        auth_token: OAuth bearer token.
+        word: The search query, i.e. a tag.
+        start_date: The earliest upload date to search.
+        end_date: The latest upload date to search, defaults to today.
+        search_target: Search target option.
+        filter: Filter option.
+        max_workers: Maximum number of windows searched at the same time.
+
+    Yields:
+        The next illustration matching the search query in JSON format, in no particular order.
+
+    Raises:
+        ApiError: An exception occurred while making the API request.
+
+    """
+    end_date = end_date or datetime.date.today()
+    seen = IdSet()
+
+    def crawl_window(window, emit, submit):
+        start, end = window
+        count = 0
+        oldest = end
+        illusts = api.search_illust(
+            auth_token, word,
+            search_target=search_target,
+            sort=SEARCH_SORT.DATE_DESC,
+            start_date=start.isoformat(),
+            end_date=end.isoformat(),
+            filter=filter
+        )
+        for illust in illusts:
+            count += 1
+            oldest = min(oldest, _upload_date(illust))
+            if seen.add(illust['id']):
+                emit(illust)
+            if count >= MAX_SEARCH_OFFSET:
+                break
+        else:
+            return
+
+        # The window was cut off by the offset cap. Results are newest first, so everything
+        # uploaded after the oldest illustration has been retrieved already.
+        if oldest >= end:
+            warnings.warn(
+                f"More than {MAX_SEARCH_OFFSET} results for '{word}' on {end.isoformat()}, "
+                "results for that day are incomplete."
+            )
+            oldest = end - _ONE_DAY
+        if oldest >= start:
+            for remaining in _split_window(start, oldest, 2):
+                submit(remaining)
+
+    return run_tasks(
+        tasks=_split_window(start_date, end_date, max_workers),
+        worker=crawl_window,
+        max_workers=max_workers
+    )
+
+
+def _comment_threads(auth_token: AuthToken, illust_id: str, executor: Executor,
+                     window: int) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """Retrieve the comment threads of an illustration, fetching replies on an executor.
+
+    Top-level comments are retrieved by the calling thread while the replies of up to 'window'
+    comments are retrieved on the executor.  A thread is yielded once its replies have arrived and
+    every thread before it has been yielded.  Replies which have yet to be retrieved are cancelled
+    if the iteration stops early.
+
+    """
+    pending = collections.deque()
+
+    def replies_of(comment):
+        return list(api.get_comment_replies(auth_token, str(comment['id'])))
+
+    def head_ready():
+        future = pending[0][1]
+        return len(pending) > window or future is None or future.done()
+
+    try:
+        for comment in api.get_illust_comments(auth_token, illust_id):
+            future = executor.submit(replies_of, comment) if comment.get('has_replies') else None
+            pending.append((comment, future))
+            while pending and head_ready():
+                head, future = pending.popleft()
+                yield head, ([] if future is None else future.result())
+        while pending:
+            head, future = pending.popleft()
+            yield head, ([] if future is None else future.result())
+    finally:
+        for _, future in pending:
+            if future is not None:
+                future.cancel()
+
+
+def get_comment_threads(
+        auth_token: AuthToken,
+        illust_id: str,
+        max_workers: int = 4
+    ) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """Retrieve the comments on an illustration together with their replies.
+
+    The replies of every comment that has replies are retrieved concurrently while the pages of
+    top-level comments continue to be retrieved.  Threads are yielded in the same order as the
+    comments are returned by get_illust_comments.
+
+    Args:
+        auth_token: OAuth bearer token.
+        illust_id: Pixiv illustration ID.
+        max_workers: Maximum number of reply lists retrieved at the same time.
+
+    Yields:
+        The next thread as a (comment, replies) tuple, with the replies in JSON format.
+
+    Raises:
+        ApiError: An exception occurred while making the API request.
+
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        yield from _comment_threads(auth_token, illust_id, executor, window=max_workers * 4)
+    finally:
+        executor.shutdown(wait=False)
+
+
+def get_comment_threads_many(
+        auth_token: AuthToken,
+        illust_ids: Iterable[str],
+        max_workers: int = 4
+    ) -> Iterator[Tuple[str, Dict[str, Any], List[Dict[str, Any]]]]:
+    """Retrieve the comment threads of many illustrations concurrently.
+
+    Up to 'max_workers' illustrations are processed at the same time, sharing a pool of
+    'max_workers' threads for retrieving replies.  The threads of each illustration are yielded in
+    order, but threads of different illustrations are interleaved.
+
+    Args:
+        auth_token: OAuth bearer token.
+        illust_ids: Pixiv illustration IDs.
+        max_workers: Maximum number of illustrations, and of reply lists, retrieved at the same
+            time.
+
+    Yields:
+        The next thread as an (illust_id, comment, replies) tuple.
+
+    Raises:
+        ApiError: An exception occurred while making the API request.
+
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def crawl_illust(illust_id, emit, submit):  # Ignore Reason: Worker signature | pylint: disable=unused-argument
+        for comment, replies in _comment_threads(auth_token, illust_id, executor,
+                                                 window=max_workers * 4):
+            emit((illust_id, comment, replies))
+
+    try:
+        yield from run_tasks(tasks=illust_ids, worker=crawl_illust, max_workers=max_workers)
+    finally:
+        executor.shutdown(wait=False)
+
+
+def crawl_articles(
+        auth_token: AuthToken,
+        categories: Optional[Iterable[str]] = None,
+        last_seen: Optional[int] = None,
+        filter: str = FILTER.FOR_ANDROID,
+        max_workers: int = 4
+    ) -> Iterator[Dict[str, Any]]:
+    """Retrieve the articles of several categories concurrently.
+
+    Each category is paged through on its own thread.  Articles are listed newest first, so for an
+    incremental refresh pass the highest article ID retrieved by the previous crawl as 'last_seen';
+    each category then stops at the first article that is not newer than it.  Articles listed in
+    more than one category are only yielded once.
+
+    Args:
+        auth_token: OAuth bearer token.
+        categories: Article categories to crawl, defaults to every category.
+        last_seen: Optional article ID at which each category stops.
+        filter: Filter option.
+        max_workers: Maximum number of categories crawled at the same time.
+
+    Yields:
+        The next article in JSON format, in no particular order.
+
+    Raises:
+        ApiError: An exception occurred while making the API request.
+
+    """
+    seen = IdSet()
+
+    def crawl_category(category, emit, submit):  # Ignore Reason: Worker signature | pylint: disable=unused-argument
+        for article in api.get_articles(auth_token, filter=filter, category=category):
+            if last_seen is not None and article['id'] <= last_seen:
+                return
+            if seen.add(article['id']):
+                emit(article)
+
+    return run_tasks(
+        tasks=_ARTICLE_CATEGORIES if categories is None else categories,
+        worker=crawl_category,
+        max_workers=max_workers
+    )
@@ -20,6 +20,9 @@ class ARTICLE_CATEGORY:  # Ignore Reason: Dataclass | pylint: disable=too-few-pu
 
     ALL = 'all'             # All of the articles across all categories
     SPOTLIGHT = 'spotlight' # Spotlight articles, featured Pixiv articles
+    ILLUST = 'illust'       # Articles featuring illustrations
+    MANGA = 'manga'         # Articles featuring manga
+    COSPLAY = 'cosplay'     # Articles featuring cosplay
 
 
 class RANK_MODE:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods,invalid-name
@@ -32,3 +35,26 @@ class RANK_MODE:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-me
     # Time and gender based modes.
     DAY_MALE = DAY+'_male'      # The most popular rankings for today amongst males.
     DAY_FEMALE = DAY+'_female'  # The most popular rankings for today amongst females.
+
+
+class SEARCH_TARGET:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods,invalid-name
+    """Options for how a search query is matched against an illustration."""
+
+    PARTIAL_MATCH_FOR_TAGS = 'partial_match_for_tags'   # Query is part of a tag.
+    EXACT_MATCH_FOR_TAGS = 'exact_match_for_tags'       # Query is exactly a tag.
+    TITLE_AND_CAPTION = 'title_and_caption'             # Query is in the title or caption.
+
+
+class SEARCH_SORT:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods,invalid-name
+    """Sort options for search results."""
+
+    DATE_DESC = 'date_desc'         # Newest illustrations first.
+    DATE_ASC = 'date_asc'           # Oldest illustrations first.
+    POPULAR_DESC = 'popular_desc'   # Most popular illustrations first (premium only).
+
+
+class ON_DEADLINE:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods,invalid-name
+    """Options for what an API function does once its deadline has passed."""
+
+    STOP = 'stop'       # End the iteration, as if the last page was reached.
+    RAISE = 'raise'     # Raise an ApiError from DeadlineExceeded.
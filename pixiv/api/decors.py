@@ -1,42 +1,223 @@
 """API decorator functions."""
 
+import contextlib
+import threading
+import time
 from functools import wraps
-from typing import Iterator, Dict, Any, Callable
+from typing import Optional, Iterator, Dict, Any, Callable, List, Tuple
 
+from pixiv.api.data import ON_DEADLINE
 from pixiv.api.exceptions import ApiError
-from pixiv.common.exceptions import PixivError
-from pixiv.common import validate
+from pixiv.common.data import Page, ResponseInfo
+from pixiv.common.decors import last_response
+from pixiv.common.exceptions import DeadlineExceeded, PixivError
+from pixiv.common.validate import Schema
+from pixiv.common.stream import StreamedResponse, streaming
+from pixiv.common.timeouts import deadline_at, remaining
 
 
-def generate_data(list_key: str) -> Iterator[Dict[str, Any]]:
+def compile_fields(fields: List[str]) -> Callable[[Any], Any]:
+    """Compile a list of field paths into a function projecting an item onto those fields.
+
+    A field path names a key of the item, or a key of a nested object by joining the keys with
+    dots, i.e. 'user.id'.  A path through a list applies to every element of the list, i.e.
+    'tags.name' keeps the name of each tag.  Keys missing from an item are left out of the result.
+
+    Args:
+        fields: The field paths to keep.
+
+    Returns:
+        Function returning a new, trimmed copy of an item.
+
+    """
+    tree: Dict[str, Any] = {}
+    for field in fields:
+        node = tree
+        *parents, leaf = field.split('.')
+        for key in parents:
+            # A parent kept whole already includes the child, i.e. 'user' and 'user.id'.
+            if node.get(key, {}) is None:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[leaf] = None
+
+    def project(value: Any, node: Dict[str, Any]) -> Any:
+        if isinstance(value, list):
+            return [project(element, node) for element in value]
+        if not isinstance(value, dict):
+            return value
+        return {
+            key: value[key] if child is None else project(value[key], child)
+            for key, child in node.items() if key in value
+        }
+
+    return lambda item: project(item, tree)
+
+
+# Cursor of the resuming block each thread is in.
+_resuming = threading.local()
+
+
+@contextlib.contextmanager
+def resuming(cursor: Optional[str]):
+    """Make the api call started in the block begin at a cursor instead of the first page."""
+    previous = getattr(_resuming, 'cursor', None)
+    _resuming.cursor = cursor
+    try:
+        yield
+    finally:
+        _resuming.cursor = previous
+
+
+def resume_cursor() -> Optional[str]:
+    """Get the cursor of the enclosing resuming block, None outside of one."""
+    return getattr(_resuming, 'cursor', None)
+
+
+def _responses(
+        api_call: Iterator[Any],
+        list_key: str,
+        stream: bool,
+        cursor: Optional[str] = None,
+        expires: Optional[float] = None
+    ) -> Iterator[Tuple[Any, Optional[ResponseInfo]]]:
+    """Iterate over the responses of an api call, streaming each one if stream is set.
+
+    The streaming, resuming and deadline_at blocks only surround the model call itself, so they
+    never apply to the code consuming the responses.
+
+    Raises:
+        DeadlineExceeded: The deadline has passed before the next response.
+
+    Yields:
+        Each response, with the info on its transfer or None if no request was made for it.
+
+    """
+    while True:
+        # Also checked here since a page may be returned without sending a request.
+        remaining(expires)
+        before = last_response()
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(deadline_at(expires))
+            if stream:
+                stack.enter_context(streaming(list_key))
+            if cursor is not None:
+                # Only the first call starts the api call, which reads the cursor.
+                stack.enter_context(resuming(cursor))
+                cursor = None
+            response = next(api_call, None)
+        if response is None:
+            return
+        info = last_response()
+        yield response, (None if info is before else info)
+
+
+def generate_data(
+        list_key: str,
+        schema: Optional[Schema] = None,
+        record: Optional[type] = None
+    ) -> Iterator[Dict[str, Any]]:
     """Generate individual pieces of data from the wrapped function.
 
     Takes the generator api call object returned by the wrapped function to continuously generate
-    the next JSON response.  Each response is validated to contain a list_key and if the key
-    exists, each item in the list is yielded.  This process repeats until the api call object
-    can no longer retrieve data from the model API function (likely due to yielding all data).
+    the next JSON response.  Each response is validated against the schema of the endpoint (which
+    at least requires the list_key to be mapped to a list) and each item in the list is yielded.
+    This process repeats until the api call object can no longer retrieve data from the model API
+    function (likely due to yielding all data).
+
+    The wrapped function accepts seven extra keyword arguments:
+        as_records: When set to True, each item is converted into the record class before it is
+            yielded.
+        fields: Optional list of field paths (see compile_fields), i.e. ['id', 'user.id'].  Each
+            item is trimmed to these fields as soon as its response is received and the rest of
+            the response is released before any item is yielded, so only the trimmed items of a
+            response are kept in memory.
+        stream: When set to True, each response is streamed and every item is yielded as soon as
+            it has been downloaded, rather than once the whole response has been (see the
+            pixiv.common.stream module).  The rest of the response is validated once it is
+            complete, so a response missing the list_key only raises after its items were yielded.
+        pages: When set to True, each response is yielded as a single Page (see pixiv.common.data)
+            holding its list of items, its 'next_url', and the time taken and bytes received to
+            download it.  Cannot be combined with stream.
+        cursor: Optional 'next_url' of an earlier page (see Page.next_url) to resume from, i.e.
+            after a restart, instead of starting from the first page.
+        deadline: Optional number of seconds the whole iteration may take, covering every request
+            made for it: retries, token renewals and each page.  Requests are sent with their
+            timeouts shortened to the time left, and none is sent once it has passed.  The time
+            spent by the caller between items counts towards it.
+        on_deadline: Option (see ON_DEADLINE) of what happens once the deadline has passed, by
+            default the iteration stops cleanly after the last item received in full.
 
     Args:
         list_key: Key that is mapped to some list of data to be yielded.
+        schema: Optional schema of the responses (see pixiv.common.validate), by default a
+            schema only requiring the list_key.
+        record: Optional record class (see the records module) the items can be converted into.
 
     Yields:
-        Each element in the the list.
+        Each element in the the list, or each page of elements.
 
     Raises:
-        ApiError: An exception occurred while making the API call.
+        ApiError: An exception occurred while making the API call, or the deadline has passed with
+            on_deadline set to ON_DEADLINE.RAISE.
 
     """
+    if schema is None:
+        schema = Schema({list_key: [object]})
+
     def decorator(function: Callable):
         @wraps(function)
-        def wrapper(*args, **kwargs):
+        def wrapper(*args, as_records: bool = False, fields: Optional[List[str]] = None,
+                    stream: bool = False, pages: bool = False, cursor: Optional[str] = None,
+                    deadline: Optional[float] = None, on_deadline: str = ON_DEADLINE.STOP,
+                    **kwargs):
+            if as_records and record is None:
+                raise TypeError(f"'{function.__name__}' does not support as_records.")
+            if pages and stream:
+                raise TypeError('pages and stream cannot be combined.')
+            project = None if fields is None else compile_fields(fields)
+            expires = None if deadline is None else time.monotonic() + deadline
+
+            def convert(items):
+                return map(record, items) if as_records else items
+
+            def streamed_items(response):
+                for json_data in response:
+                    schema.validate_item(list_key, json_data)
+                    yield json_data if project is None else project(json_data)
+
             # Generator object used to repeatedly make API calls.
             api_call = function(*args, **kwargs)
             try:
-                for response in api_call:
-                    validate.response_contains_key(response, list_key)
-                    validate.response_key_mapping(response, list_key, list)
-                    for json_data in response[list_key]:
-                        yield json_data
+                for response, info in _responses(api_call, list_key, stream, cursor, expires):
+                    if isinstance(response, StreamedResponse):
+                        yield from convert(streamed_items(response))
+                        schema(response.rest)
+                        continue
+
+                    schema(response)
+                    next_url = response.get('next_url')
+                    items = response[list_key]
+                    if project is not None:
+                        items = [project(json_data) for json_data in items]
+                        # Release the raw response, the api call only needs the next query.
+                        response.clear()
+                    del response
+                    if pages:
+                        yield Page(
+                            list(convert(items)), next_url,
+                            None if info is None else info.elapsed,
+                            None if info is None else info.size
+                        )
+                    else:
+                        yield from convert(items)
+            except DeadlineExceeded as ex:
+                if on_deadline == ON_DEADLINE.STOP:
+                    return
+                raise ApiError(
+                    f"The deadline of the API call '{function.__name__}' was exceeded."
+                ) from ex
             except PixivError as ex:
                 raise ApiError(
                     f"An error occured while trying to make the API call '{function.__name__}.'"
@@ -0,0 +1,237 @@
+"""Follow graph crawler.
+
+Walks the following (or follower) lists of users breadth-first, starting from a set of seed users.
+The frontier, the set of visited users and the discovered edges are kept in a SQLite database
+rather than in memory, so memory use does not grow with the size of the graph and a crawl which is
+interrupted can be resumed by creating a new crawler on the same database file.
+
+"""
+
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
+
+from pixiv.api import api
+from pixiv.api.data import RESTRICT
+from pixiv.api.exceptions import ApiError
+from pixiv.common.data import AuthToken
+
+# Crawl state of a user in the 'users' table.
+_PENDING = 0
+_CLAIMED = 1
+_DONE = 2
+_FAILED = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    depth   INTEGER NOT NULL,
+    state   INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_frontier ON users (state, depth);
+CREATE TABLE IF NOT EXISTS edges (
+    source INTEGER NOT NULL,
+    target INTEGER NOT NULL,
+    PRIMARY KEY (source, target)
+) WITHOUT ROWID;
+"""
+
+
+class FollowGraphCrawler:
+    """Breadth-first crawler over the follow graph with a persistent frontier.
+
+    Seed users are at depth 0.  Users discovered through a user at depth d are at depth d + 1, or
+    lower if a shorter path to them is found later, and only users at a depth lower than max_depth
+    have their lists retrieved.  Users at max_depth are recorded, so raising max_depth and
+    crawling again on the same database continues the crawl from where it stopped.
+
+    Users whose list could not be retrieved (i.e. deleted accounts) are marked as failed and
+    skipped instead of stopping the crawl.
+
+    Attributes:
+        auth_token: OAuth bearer token.
+        max_depth: Maximum depth of the crawl.
+        max_workers: Maximum number of lists retrieved at the same time.
+        followers: Walk the follower lists instead of the following lists.
+        restrict: Work restriction option, only used for following lists.
+
+    """
+
+    def __init__(self, auth_token: AuthToken, path: str, max_depth: int = 1,
+                 max_workers: int = 4, followers: bool = False,
+                 restrict: str = RESTRICT.PUBLIC):
+        """Init FollowGraphCrawler with a token and the path of the crawl database."""
+        self.auth_token = auth_token
+        self.max_depth = max_depth
+        self.max_workers = max_workers
+        self.followers = followers
+        self.restrict = restrict
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+        # Users which were being crawled when a previous crawl stopped are crawled again.
+        self._db.execute('UPDATE users SET state = ? WHERE state = ?', (_PENDING, _CLAIMED))
+        self._db.commit()
+
+    def add_seeds(self, user_ids: Iterable[str]):
+        """Add seed users to the frontier at depth 0, crawling visited users again if deeper.
+
+        Args:
+            user_ids: Pixiv user IDs to start crawling from.
+
+        """
+        self._discover([int(user_id) for user_id in user_ids], 0)
+        self._db.commit()
+
+    def pending(self) -> int:
+        """Count the users in the frontier that have yet to be crawled."""
+        return self._db.execute(
+            'SELECT COUNT(*) FROM users WHERE state = ? AND depth < ?',
+            (_PENDING, self.max_depth)
+        ).fetchone()[0]
+
+    def edges(self) -> Iterator[Tuple[int, int]]:
+        """Iterate over every edge discovered so far, as (source, target) user IDs."""
+        return iter(self._db.execute('SELECT source, target FROM edges'))
+
+    def close(self):
+        """Close the crawl database."""
+        self._db.close()
+
+    def _discover(self, user_ids: List[int], depth: int) -> List[int]:
+        """Add users to the frontier at a depth, or lower their depth if they were found deeper.
+
+        A user that was already crawled from a greater depth is crawled again, so the users it
+        follows get their lower depth as well.  Supports SQLite versions without upserts.
+
+        Returns:
+            The users whose depth was lowered.
+
+        """
+        self._db.executemany(
+            'INSERT OR IGNORE INTO users (user_id, depth) VALUES (?, ?)',
+            ((user_id, depth) for user_id in user_ids)
+        )
+        lowered = []
+        for user_id in user_ids:
+            cursor = self._db.execute(
+                'UPDATE users SET depth = ?, state = CASE state WHEN ? THEN ? ELSE state END '
+                'WHERE user_id = ? AND depth > ?',
+                (depth, _DONE, _PENDING, user_id, depth)
+            )
+            if cursor.rowcount:
+                lowered.append(user_id)
+        return lowered
+
+    def _fetch(self, user_id: int, stop: threading.Event, results: queue.Queue):
+        """Retrieve a user's list in a worker thread, sending each page to the crawl loop."""
+        def put(message):
+            while not stop.is_set():
+                try:
+                    results.put(message, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        try:
+            if self.followers:
+                users = api.get_followers(self.auth_token, str(user_id))
+            else:
+                users = api.get_following(self.auth_token, str(user_id), self.restrict)
+            batch = []
+            for preview in users:
+                batch.append(int(preview['user']['id']))
+                if len(batch) == 30:
+                    if stop.is_set():
+                        return
+                    put(('page', user_id, batch))
+                    batch = []
+            put(('page', user_id, batch))
+            put(('done', user_id, _DONE))
+        except ApiError:
+            put(('done', user_id, _FAILED))
+        except Exception as ex:  # Ignore Reason: Re-raised by the crawl loop | pylint: disable=broad-except
+            put(('error', user_id, ex))
+
+    def _claim(self, limit: int) -> Iterator[Tuple[int, int]]:
+        """Move up to 'limit' of the shallowest pending users to the claimed state."""
+        rows = self._db.execute(
+            'SELECT user_id, depth FROM users WHERE state = ? AND depth < ? '
+            'ORDER BY depth LIMIT ?',
+            (_PENDING, self.max_depth, limit)
+        ).fetchall()
+        self._db.executemany(
+            'UPDATE users SET state = ? WHERE user_id = ?',
+            ((_CLAIMED, user_id) for user_id, _ in rows)
+        )
+        return rows
+
+    def crawl(self) -> Iterator[Tuple[int, int]]:
+        """Crawl the graph until the frontier is empty.
+
+        Edges are committed to the database before they are yielded, and each edge is only yielded
+        once.  Stopping the iteration early leaves the crawl in a state which a later call (or a new
+        crawler on the same database) resumes from.
+
+        Yields:
+            The next newly discovered edge as a (source, target) tuple of user IDs.  With
+            followers=True, the source is the follower.
+
+        Raises:
+            Exception: An unexpected exception occurred in a worker thread.
+
+        """
+        results = queue.Queue(maxsize=self.max_workers * 4)
+        stop = threading.Event()
+        depths = {}
+        futures = []
+        # Users being crawled whose depth was lowered meanwhile, crawled again once done.
+        lowered = set()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while True:
+                for user_id, depth in self._claim(self.max_workers - len(depths)):
+                    depths[user_id] = depth
+                    futures.append(executor.submit(self._fetch, user_id, stop, results))
+                self._db.commit()
+                if not depths:
+                    return
+
+                kind, user_id, value = results.get()
+                if kind == 'error':
+                    raise value
+                if kind == 'done':
+                    del depths[user_id]
+                    if user_id in lowered:
+                        lowered.discard(user_id)
+                        value = _PENDING
+                    self._db.execute(
+                        'UPDATE users SET state = ? WHERE user_id = ?', (value, user_id))
+                    futures = [future for future in futures if not future.done()]
+                    continue
+
+                edges = [
+                    (target, user_id) if self.followers else (user_id, target)
+                    for target in value
+                ]
+                new_edges = []
+                for edge in edges:
+                    cursor = self._db.execute(
+                        'INSERT OR IGNORE INTO edges (source, target) VALUES (?, ?)', edge)
+                    if cursor.rowcount:
+                        new_edges.append(edge)
+                depth = depths[user_id] + 1
+                for target in self._discover(value, depth):
+                    if target in depths:
+                        depths[target] = depth
+                        lowered.add(target)
+                self._db.commit()
+                yield from new_edges
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+            self._db.execute('UPDATE users SET state = ? WHERE state = ?', (_PENDING, _CLAIMED))
+            self._db.commit()
@@ -0,0 +1,421 @@
+"""Persistent crawl job queue and worker.
+
+A JobQueue is a SQLite database of crawl jobs, each an API function with its arguments and a
+cursor: the 'next_url' of the last page handled (see the cursor argument of the API functions).
+Workers claim a job by taking a lease on it for a number of seconds, handle its pages one at a
+time, and checkpoint the cursor (renewing the lease) after each page.  A worker that stops for any
+reason, including the machine restarting, leaves its jobs to be claimed again once their lease
+expires, and they resume from their last checkpoint.  Failed jobs are retried with exponential
+backoff until they run out of attempts.
+
+Any number of Worker threads and processes on a host can share the same queue: claims are atomic
+and a checkpoint from a worker whose lease was taken over is refused.  A page handled just before
+a worker stops may be handled again by the next worker, so handlers should be idempotent (i.e.
+upserts, see pixiv.store).
+
+Example:
+    >>> jobs = JobQueue('crawl.db')
+    >>> for user_id in user_ids:
+    ...     jobs.submit(api.get_bookmarks, user_id)
+    >>> with SqliteStore('pixiv.db') as store:
+    ...     Worker(jobs, token, lambda job, page: store.add_illusts(page), concurrency=4).run()
+
+"""
+
+import importlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from pixiv.api.exceptions import ApiError
+from pixiv.common.data import AuthToken, Page
+
+
+class JOB_STATE:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods,invalid-name
+    """States of a job in the queue."""
+
+    PENDING = 'pending'     # Waiting to be claimed, possibly after a failed attempt.
+    RUNNING = 'running'     # Leased by a worker.
+    DONE = 'done'           # Every page was handled.
+    FAILED = 'failed'       # Every attempt failed.
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              INTEGER PRIMARY KEY,
+    function        TEXT NOT NULL,
+    args            TEXT NOT NULL,
+    kwargs          TEXT NOT NULL,
+    cursor          TEXT,
+    state           TEXT NOT NULL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    max_attempts    INTEGER NOT NULL,
+    items           INTEGER NOT NULL DEFAULT 0,
+    run_after       REAL NOT NULL,
+    lease_owner     TEXT,
+    lease_expires   REAL,
+    error           TEXT,
+    created         REAL NOT NULL,
+    updated         REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, run_after);
+"""
+
+
+class LeaseLost(ApiError):
+    """Raised when a worker updates a job whose lease it no longer holds."""
+
+
+class Job:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
+    """Represent a job claimed by a worker.
+
+    Attributes:
+        id: ID of the job in the queue.
+        function: Import path of the API function, as 'module:name'.
+        args: Positional arguments following the auth token.
+        kwargs: Keyword arguments.
+        cursor: The 'next_url' of the last page handled, None to start from the first page.
+        attempts: Number of attempts, including the current one.
+        items: Number of items handled so far.
+        owner: Lease token of the claim, the worker's name followed by a unique suffix.
+
+    """
+
+    __slots__ = ['id', 'function', 'args', 'kwargs', 'cursor', 'attempts', 'items', 'owner']
+    def __init__(self, id: int, function: str, args: List[Any], kwargs: Dict[str, Any],  # pylint: disable=redefined-builtin
+                 cursor: Optional[str], attempts: int, items: int, owner: str):
+        """Init Job with the columns of its row."""
+        self.id = id    # pylint: disable=invalid-name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.cursor = cursor
+        self.attempts = attempts
+        self.items = items
+        self.owner = owner
+
+    def resolve(self) -> Callable[..., Any]:
+        """Import the API function of the job."""
+        module, name = self.function.split(':')
+        return getattr(importlib.import_module(module), name)
+
+
+def _function_path(function: Callable[..., Any]) -> str:
+    """Get the import path of a module level function, checking that it can be imported back."""
+    path = f'{function.__module__}:{function.__qualname__}'
+    module = importlib.import_module(function.__module__)
+    if getattr(module, function.__qualname__, None) is not function:
+        raise ValueError(f"'{path}' is not a module level function.")
+    return path
+
+
+class JobQueue:
+    """SQLite queue of crawl jobs shared by workers.
+
+    Each thread uses its own connection, so a JobQueue can be shared by the threads of a Worker.
+
+    Attributes:
+        path: Path of the database.
+        lease_seconds: Duration of a lease, renewed by each checkpoint.
+        retry_delay: Delay before the first retry of a failed job, doubled for each attempt.
+
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300.0, retry_delay: float = 30.0):
+        """Init JobQueue, creating the database and its schema if they do not exist."""
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self._local = threading.local()
+        self._db.executescript(_SCHEMA)
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """Connection of the current thread."""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = NORMAL')
+        return db
+
+    def close(self):
+        """Close the connection of the current thread."""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def submit(self, function: Callable[..., Any], *args: Any, max_attempts: int = 5,
+               **kwargs: Any) -> int:
+        """Add a job to the queue.
+
+        Args:
+            function: API function (or any module level function taking a token first and
+                accepting pages=True and cursor=...).
+            args: Positional arguments following the auth token, JSON serializable.
+            max_attempts: Number of attempts before the job is marked as failed.
+            kwargs: Keyword arguments, JSON serializable.
+
+        Returns:
+            The ID of the job.
+
+        """
+        now = time.time()
+        cursor = self._db.execute(
+            """
+            INSERT INTO jobs (function, args, kwargs, state, max_attempts, run_after, created,
+                              updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (_function_path(function), json.dumps(args), json.dumps(kwargs), JOB_STATE.PENDING,
+             max_attempts, now, now, now)
+        )
+        return cursor.lastrowid
+
+    def claim(self, owner: str) -> Optional[Job]:
+        """Lease the next ready job: a pending job, or a running job whose lease expired.
+
+        Each claim holds the lease under its own token, so a stale claim of the same worker, i.e.
+        from another of its threads, cannot update the job once it has been claimed again.
+
+        Returns:
+            The job, None if no job is ready.
+
+        """
+        db = self._db
+        now = time.time()
+        owner = f'{owner}:{uuid.uuid4().hex}'
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                """
+                SELECT id, function, args, kwargs, cursor, attempts, items FROM jobs
+                WHERE (state = ? AND run_after <= ?) OR (state = ? AND lease_expires <= ?)
+                ORDER BY run_after, id LIMIT 1
+                """,
+                (JOB_STATE.PENDING, now, JOB_STATE.RUNNING, now)
+            ).fetchone()
+            if row is None:
+                db.execute('COMMIT')
+                return None
+            db.execute(
+                """
+                UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?,
+                                lease_expires = ?, updated = ?
+                WHERE id = ?
+                """,
+                (JOB_STATE.RUNNING, owner, now + self.lease_seconds, now, row[0])
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        job_id, function, args, kwargs, cursor, attempts, items = row
+        return Job(job_id, function, json.loads(args), json.loads(kwargs), cursor, attempts + 1,
+                   items, owner)
+
+    def _update_leased(self, job: Job, assignments: str, values: tuple):
+        """Update a job if its lease is still held by the claim the job came from.
+
+        Raises:
+            LeaseLost: The lease expired and the job was claimed again.
+
+        """
+        cursor = self._db.execute(
+            f'UPDATE jobs SET {assignments}, updated = ? '
+            'WHERE id = ? AND state = ? AND lease_owner = ?',
+            (*values, time.time(), job.id, JOB_STATE.RUNNING, job.owner)
+        )
+        if cursor.rowcount == 0:
+            raise LeaseLost(f'The lease on job {job.id} is no longer held by {job.owner}.')
+
+    def checkpoint(self, job: Job, cursor: Optional[str], items: int):
+        """Record the progress of a job and renew its lease.
+
+        Args:
+            job: The job.
+            cursor: The 'next_url' of the last page handled.
+            items: Number of items handled since the previous checkpoint.
+
+        Raises:
+            LeaseLost: The lease expired and the job was claimed by another worker.
+
+        """
+        self._update_leased(job, 'cursor = ?, items = items + ?, lease_expires = ?',
+                            (cursor, items, time.time() + self.lease_seconds))
+        job.cursor = cursor
+        job.items += items
+
+    def complete(self, job: Job, items: int = 0):
+        """Mark a job as done and release its lease.
+
+        Args:
+            job: The job.
+            items: Number of items handled since the last checkpoint.
+
+        """
+        self._update_leased(
+            job, 'state = ?, items = items + ?, lease_owner = NULL, lease_expires = NULL',
+            (JOB_STATE.DONE, items)
+        )
+        job.items += items
+
+    def release(self, job: Job):
+        """Give a job back to the queue without counting the attempt, i.e. on shutdown."""
+        self._update_leased(
+            job, 'state = ?, attempts = attempts - 1, run_after = ?, lease_owner = NULL',
+            (JOB_STATE.PENDING, time.time())
+        )
+
+    def fail(self, job: Job, error: str):
+        """Release a job after a failed attempt, to be retried after a delay or marked as failed.
+
+        The job keeps its cursor, so a retry resumes from the last checkpoint.
+
+        """
+        (max_attempts,) = self._db.execute(
+            'SELECT max_attempts FROM jobs WHERE id = ?', (job.id,)).fetchone()
+        if job.attempts >= max_attempts:
+            self._update_leased(job, 'state = ?, error = ?, lease_owner = NULL',
+                                (JOB_STATE.FAILED, error))
+        else:
+            run_after = time.time() + self.retry_delay * 2 ** (job.attempts - 1)
+            self._update_leased(job, 'state = ?, error = ?, run_after = ?, lease_owner = NULL',
+                                (JOB_STATE.PENDING, error, run_after))
+
+    def retry_failed(self) -> int:
+        """Make every failed job pending again, with a new set of attempts.
+
+        Returns:
+            Number of jobs made pending.
+
+        """
+        return self._db.execute(
+            'UPDATE jobs SET state = ?, attempts = 0, run_after = ?, updated = ? WHERE state = ?',
+            (JOB_STATE.PENDING, time.time(), time.time(), JOB_STATE.FAILED)
+        ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Count the jobs in each state."""
+        counts = dict.fromkeys((JOB_STATE.PENDING, JOB_STATE.RUNNING, JOB_STATE.DONE,
+                                JOB_STATE.FAILED), 0)
+        counts.update(self._db.execute('SELECT state, count(*) FROM jobs GROUP BY state'))
+        return counts
+
+    def get(self, job_id: int) -> Dict[str, Any]:
+        """Get every column of a job."""
+        cursor = self._db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise KeyError(job_id)
+        return dict(zip((column[0] for column in cursor.description), row))
+
+
+class Worker:
+    """Run the jobs of a queue on a number of threads until stopped.
+
+    For each job the API function is called with pages=True, starting from the job's cursor, and
+    the handler is called as handler(job, page) for each page before the job is checkpointed.
+
+    Attributes:
+        jobs: The job queue.
+        auth_token: OAuth bearer token, or an AccountPool, passed to every API function.
+        handler: Function handling each page of items.
+        concurrency: Number of jobs run at the same time.
+        poll_interval: Seconds to wait before looking for a job again when none is ready.
+        owner: Name of the worker in the leases it holds.
+
+    """
+
+    def __init__(self, jobs: JobQueue, auth_token: AuthToken,
+                 handler: Callable[[Job, Page], None], concurrency: int = 4,
+                 poll_interval: float = 1.0, owner: Optional[str] = None):
+        """Init Worker with a queue, a token and the handler of each page."""
+        self.jobs = jobs
+        self.auth_token = auth_token
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Stop claiming jobs, letting each running job finish its current page."""
+        self._stop.set()
+
+    def run_job(self, job: Job) -> bool:
+        """Run a claimed job to completion, or until the worker is stopped.
+
+        Returns:
+            Whether the job completed.
+
+        """
+        function = job.resolve()
+        pages = function(self.auth_token, *job.args, pages=True, cursor=job.cursor, **job.kwargs)
+        try:
+            for page in pages:
+                self.handler(job, page)
+                if page.next_url is None:
+                    break
+                self.jobs.checkpoint(job, page.next_url, len(page))
+                if self._stop.is_set():
+                    self.jobs.release(job)
+                    return False
+            else:
+                page = ()
+            self.jobs.complete(job, len(page))
+            return True
+        finally:
+            pages.close()
+
+    def _run(self, stop_when_idle: bool):
+        """Claim and run jobs on the current thread."""
+        try:
+            while not self._stop.is_set():
+                job = self.jobs.claim(self.owner)
+                if job is None:
+                    if stop_when_idle:
+                        return
+                    self._stop.wait(self.poll_interval)
+                    continue
+                try:
+                    self.run_job(job)
+                except LeaseLost:
+                    continue
+                except Exception:  # Ignore Reason: Recorded in the queue | pylint: disable=broad-except
+                    try:
+                        self.jobs.fail(job, traceback.format_exc())
+                    except LeaseLost:
+                        continue
+        finally:
+            self.jobs.close()
+
+    def run(self, stop_when_idle: bool = False):
+        """Run jobs on 'concurrency' threads until stopped.
+
+        Args:
+            stop_when_idle: Return once no job is ready, instead of waiting for new jobs.
+
+        """
+        threads = [
+            threading.Thread(target=self._run, args=(stop_when_idle,),
+                             name=f'pixiv-worker-{index}', daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
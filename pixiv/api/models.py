@@ -12,10 +12,10 @@ from requests import Request
 from pixiv.auth import renew_auth_token
 from pixiv.common.data import AuthToken
 from pixiv.common.decors import request, retry
-from pixiv.common.exceptions import InvalidStatusCode
+from pixiv.common.exceptions import InvalidStatusCode, RequestTimeout
 
 
-@retry(times=2, on_exceptions=[InvalidStatusCode])
+@retry(times=2, on_exceptions=[InvalidStatusCode, RequestTimeout])
 @request(expected_code=200)
 def get_bookmark_tags(user_id: str, restrict: str, offset: str,
                       auth_token: AuthToken) -> Dict[str, Any]:
@@ -47,7 +47,7 @@ def get_bookmark_tags(user_id: str, restrict: str, offset: str,
     )
 
 
-@retry(times=2, on_exceptions=[InvalidStatusCode])
+@retry(times=2, on_exceptions=[InvalidStatusCode, RequestTimeout])
 @request(expected_code=200)
 def get_bookmarks(user_id: str, restrict: str, max_bookmark_id: str, tag: str,
                   auth_token: AuthToken) -> Dict[str, Any]:
@@ -81,7 +81,7 @@ def get_bookmarks(user_id: str, restrict: str, max_bookmark_id: str, tag: str,
     )
 
 
-@retry(times=2, on_exceptions=[InvalidStatusCode])
+@retry(times=2, on_exceptions=[InvalidStatusCode, RequestTimeout])
 @request(expected_code=200)
 def get_illust_comments(illust_id: str, offset: str, auth_token: AuthToken) -> Dict[str, Any]:
     """Retrieve the comments on a specified illustration.
@@ -110,7 +110,7 @@ def get_illust_comments(illust_id: str, offset: str, auth_token: AuthToken) -> D
     )
 
 
-@retry(times=2, on_exceptions=[InvalidStatusCode])
+@retry(times=2, on_exceptions=[InvalidStatusCode, RequestTimeout])
 @request(expected_code=200)
 def get_recommended(filter: str, include_ranked: str, include_privacy: str,
                     min_bookmark_id_for_recent_illust: str, max_bookmark_id_for_recommend: str,
@@ -157,14 +157,16 @@ def get_recommended(filter: str, include_ranked: str, include_privacy: str,
     )
 
 
-@retry(times=2, on_exceptions=[InvalidStatusCode])
+@retry(times=2, on_exceptions=[InvalidStatusCode, RequestTimeout])
 @request(expected_code=200)
-def get_articles(filter: str, category: str, auth_token: AuthToken) -> Dict[str, Any]:
+def get_articles(filter: str, category: str, offset: str,
+                 auth_token: AuthToken) -> Dict[str, Any]:
     """Retrieve Pixiv articles from a particular category.
 
     Args:
         filter: A filter option.
         category: The article category to retrieve from.
+        offset: Offset from the start of a list containing all of the articles in the category.
         auth_token: OAuth bearer token.
 
     Returns:
@@ -177,7 +179,8 @@ def get_articles(filter: str, category: str, auth_token: AuthToken) -> Dict[str,
         url='https://app-api.pixiv.net/v1/spotlight/articles',
         params={
             'filter': filter,
-            'category': category
+            'category': category,
+            'offset': offset
         },
         headers={
             'authorization': f'Bearer {auth_token.access_token}'
@@ -185,7 +188,7 @@ def get_articles(filter: str, category: str, auth_token: AuthToken) -> Dict[str,
     )
 
 
-@retry(times=2, on_exceptions=[InvalidStatusCode])
+@retry(times=2, on_exceptions=[InvalidStatusCode, RequestTimeout])
 @request(expected_code=200)
 def get_related(filter: str, illust_id: str, auth_token: AuthToken) -> Dict[str, Any]:
     """Retrieve illustrations related to the one provided.
@@ -213,7 +216,7 @@ def get_related(filter: str, illust_id: str, auth_token: AuthToken) -> Dict[str,
     )
 
 
-@retry(times=2, on_exceptions=[InvalidStatusCode])
+@retry(times=2, on_exceptions=[InvalidStatusCode, RequestTimeout])
 @request(expected_code=200)
 def get_rankings(filter: str, mode: str, offset: str, auth_token: AuthToken) -> Dict[str, Any]:
     """Retrieve the top ranked illustrations for some mode.
@@ -241,3 +244,135 @@ def get_rankings(filter: str, mode: str, offset: str, auth_token: AuthToken) ->
             'authorization': f'Bearer {auth_token.access_token}'
         }
     )
+
+
+@retry(times=2, on_exceptions=[InvalidStatusCode, RequestTimeout])
+@request(expected_code=200)
+def search_illust(word: str, search_target: str, sort: str, start_date: str, end_date: str,
+                  filter: str, offset: str, auth_token: AuthToken) -> Dict[str, Any]:
+    """Search for illustrations matching a query.
+
+    Args:
+        word: The search query.
+        search_target: Determines how the query is matched against an illustration.
+        sort: Order of the search results.
+        start_date: Optional parameter specifying the earliest upload date (YYYY-MM-DD).
+        end_date: Optional parameter specifying the latest upload date (YYYY-MM-DD).
+        filter: A filter option.
+        offset: Offset from the start of a list containing all of the search results.
+        auth_token: OAuth bearer token.
+
+    Returns:
+        A JSON response containing illustrations matching the search query.
+
+    """
+    auth_token = renew_auth_token(auth_token)
+    return Request(
+        method='GET',
+        url='https://app-api.pixiv.net/v1/search/illust',
+        params={
+            'word': word,
+            'search_target': search_target,
+            'sort': sort,
+            'start_date': start_date,
+            'end_date': end_date,
+            'filter': filter,
+            'offset': offset
+        },
+        headers={
+            'authorization': f'Bearer {auth_token.access_token}'
+        }
+    )
+
+
+@retry(times=2, on_exceptions=[InvalidStatusCode, RequestTimeout])
+@request(expected_code=200)
+def get_following(user_id: str, restrict: str, offset: str,
+                  auth_token: AuthToken) -> Dict[str, Any]:
+    """Retrieve the users that a specified user is following.
+
+    Args:
+        user_id: Pixiv user ID.
+        restrict: Work restriction option.
+        offset: Optional parameter specifying the offset into the user's complete list of
+            followed users.
+        auth_token: OAuth bearer token.
+
+    Returns:
+        A JSON response containing users followed by a particular user.
+
+    """
+    auth_token = renew_auth_token(auth_token)
+    return Request(
+        method='GET',
+        url='https://app-api.pixiv.net/v1/user/following',
+        params={
+            'user_id': user_id,
+            'restrict': restrict,
+            'offset': offset
+        },
+        headers={
+            'authorization': f'Bearer {auth_token.access_token}'
+        }
+    )
+
+
+@retry(times=2, on_exceptions=[InvalidStatusCode, RequestTimeout])
+@request(expected_code=200)
+def get_followers(user_id: str, filter: str, offset: str,
+                  auth_token: AuthToken) -> Dict[str, Any]:
+    """Retrieve the users following a specified user.
+
+    Args:
+        user_id: Pixiv user ID.
+        filter: A filter option.
+        offset: Optional parameter specifying the offset into the user's complete list of
+            followers.
+        auth_token: OAuth bearer token.
+
+    Returns:
+        A JSON response containing users following a particular user.
+
+    """
+    auth_token = renew_auth_token(auth_token)
+    return Request(
+        method='GET',
+        url='https://app-api.pixiv.net/v1/user/follower',
+        params={
+            'user_id': user_id,
+            'filter': filter,
+            'offset': offset
+        },
+        headers={
+            'authorization': f'Bearer {auth_token.access_token}'
+        }
+    )
+
+
+@retry(times=2, on_exceptions=[InvalidStatusCode, RequestTimeout])
+@request(expected_code=200)
+def get_comment_replies(comment_id: str, offset: str, auth_token: AuthToken) -> Dict[str, Any]:
+    """Retrieve the replies to a comment on an illustration.
+
+    Args:
+        comment_id: Pixiv comment ID.
+        offset: Optional parameter specifying the offset into a comment's complete list of
+            replies.
+        auth_token: OAuth bearer token.
+
+    Returns:
+        A JSON response containing replies to a particular comment.
+
+    """
+    auth_token = renew_auth_token(auth_token)
+    return Request(
+        method='GET',
+        url='https://app-api.pixiv.net/v2/illust/comment/replies',
+        params={
+            'comment_id': comment_id,
+            'offset': offset
+        },
+        headers={
+            'authorization': f'Bearer {auth_token.access_token}'
+        }
+    )
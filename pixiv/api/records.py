@@ -0,0 +1,209 @@
+"""Compact record classes for the data yielded by the API functions.
+
+The API functions yield each item as the nested dictionary decoded from the JSON response, which
+is convenient but costly to keep in memory: every item carries a dictionary per sub-object and a
+copy of every string.  The record classes use __slots__ instead of a dictionary, intern strings
+that repeat across items (tag names, user names, image URLs, ...) and keep nested sub-objects
+packed as JSON bytes until one of them is first accessed.
+
+Pass as_records=True to an API function to have it yield records instead of dictionaries.
+
+Example:
+    >>> for illust in api.get_rankings(token, as_records=True):
+    ...     illust.total_bookmarks, illust.user.name
+
+"""
+
+import json
+import sys
+import threading
+from typing import Any, Callable, Dict, Optional
+
+# Marks a nested field that has not been unpacked yet.
+_PACKED = object()
+
+# Held while the nested fields of a record are published, so each is only set once.
+_UNPACK_LOCK = threading.Lock()
+
+
+def _intern(value: Any) -> Any:
+    """Intern a string, leaving any other value as is."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _intern_values(value: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Intern the string values of a flat dictionary, i.e. a dictionary of image URLs."""
+    if value is None:
+        return None
+    return {sys.intern(key): _intern(item) for key, item in value.items()}
+
+
+def _identity(value: Any) -> Any:
+    """Leave a value as is."""
+    return value
+
+
+class _Lazy:
+    """Descriptor for a nested field which is unpacked on first access."""
+
+    def __init__(self, decode: Callable[[Any], Any] = _identity,
+                 encode: Callable[[Any], Any] = _identity):
+        """Init _Lazy with the functions converting between the JSON and the field value."""
+        self.decode = decode
+        self.encode = encode
+        self.slot = None
+
+    def __set_name__(self, owner: type, name: str):
+        self.slot = '_' + name
+
+    def __get__(self, instance: Any, owner: type) -> Any:
+        if instance is None:
+            return self
+        value = getattr(instance, self.slot)
+        if value is _PACKED:
+            instance._unpack()  # pylint: disable=protected-access
+            value = getattr(instance, self.slot)
+        return value
+
+
+class Record:
+    """Base class of the record classes.
+
+    Subclasses list their plain fields in '_fields', the fields whose strings are interned in
+    '_interned', and declare each nested field as a _Lazy class attribute with a matching
+    '_<name>' slot.
+
+    """
+
+    __slots__ = ['_packed']
+    _fields: tuple = ()
+    _interned: frozenset = frozenset()
+    _nested: Dict[str, _Lazy] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._nested = {
+            name: attribute for name, attribute in vars(cls).items()
+            if isinstance(attribute, _Lazy)
+        }
+
+    def __init__(self, data: Dict[str, Any]):
+        """Init the record from an item in JSON format."""
+        for name in self._fields:
+            value = data.get(name)
+            setattr(self, name, _intern(value) if name in self._interned else value)
+        nested = {name: data[name] for name in self._nested if name in data}
+        self._packed = json.dumps(nested, separators=(',', ':')).encode('utf-8') if nested else b''
+        for lazy in self._nested.values():
+            setattr(self, lazy.slot, _PACKED)
+
+    def _unpack(self):
+        """Decode every nested field from the packed JSON.
+
+        Safe to call from several threads at once: the fields are decoded into local variables,
+        then published together under a lock unless another thread already did.
+
+        """
+        packed = self._packed
+        nested = json.loads(packed) if packed else {}
+        values = []
+        for name, lazy in self._nested.items():
+            value = nested.get(name)
+            values.append((lazy.slot, None if value is None else lazy.decode(value)))
+        with _UNPACK_LOCK:
+            if getattr(self, values[0][0]) is not _PACKED:
+                return
+            for slot, value in values:
+                setattr(self, slot, value)
+            self._packed = b''
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the record back into the JSON format it was created from."""
+        data = {name: getattr(self, name) for name in self._fields}
+        for name, lazy in self._nested.items():
+            value = getattr(self, name)
+            data[name] = None if value is None else lazy.encode(value)
+        return data
+
+    def __eq__(self, other: Any) -> bool:
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self._fields[:2])
+        return f'{type(self).__name__}({fields})'
+
+
+def _records_of(record: type) -> _Lazy:
+    """Create a nested field holding a list of records."""
+    return _Lazy(
+        decode=lambda items: [record(item) for item in items],
+        encode=lambda items: [item.to_dict() for item in items]
+    )
+
+
+def _record_of(record: type) -> _Lazy:
+    """Create a nested field holding a single record."""
+    return _Lazy(decode=record, encode=lambda item: item.to_dict())
+
+
+class Tag(Record):
+    """Tag of an illustration."""
+
+    __slots__ = ['name', 'translated_name']
+    _fields = ('name', 'translated_name')
+    _interned = frozenset(_fields)
+
+
+class User(Record):
+    """Pixiv user."""
+
+    __slots__ = ['id', 'name', 'account', 'is_followed', '_profile_image_urls']
+    _fields = ('id', 'name', 'account', 'is_followed')
+    _interned = frozenset(('name', 'account'))
+    profile_image_urls = _Lazy(decode=_intern_values)
+
+
+class Illust(Record):
+    """Pixiv illustration, i.e. from get_rankings, get_bookmarks or get_recommended."""
+
+    __slots__ = ['id', 'title', 'type', 'caption', 'restrict', 'x_restrict', 'sanity_level',
+                 'create_date', 'page_count', 'width', 'height', 'total_view', 'total_bookmarks',
+                 'is_bookmarked', 'visible', 'is_muted', '_user', '_tags', '_tools',
+                 '_image_urls', '_meta_single_page', '_meta_pages', '_series']
+    _fields = ('id', 'title', 'type', 'caption', 'restrict', 'x_restrict', 'sanity_level',
+               'create_date', 'page_count', 'width', 'height', 'total_view', 'total_bookmarks',
+               'is_bookmarked', 'visible', 'is_muted')
+    _interned = frozenset(('type',))
+    user = _record_of(User)
+    tags = _records_of(Tag)
+    tools = _Lazy(decode=lambda tools: [_intern(tool) for tool in tools])
+    image_urls = _Lazy(decode=_intern_values)
+    meta_single_page = _Lazy()
+    meta_pages = _Lazy()
+    series = _Lazy()
+
+
+class Comment(Record):
+    """Comment on an illustration, or reply to a comment."""
+
+    __slots__ = ['id', 'comment', 'date', 'has_replies', '_user']
+    _fields = ('id', 'comment', 'date', 'has_replies')
+    user = _record_of(User)
+
+
+class BookmarkTag(Record):
+    """Tag in a user's bookmarks, with the number of bookmarks using it."""
+
+    __slots__ = ['name', 'count']
+    _fields = ('name', 'count')
+    _interned = frozenset(('name',))
+
+
+class Article(Record):
+    """Pixivision spotlight article."""
+
+    __slots__ = ['id', 'title', 'pure_title', 'thumbnail', 'article_url', 'publish_date',
+                 'category', 'subcategory_label']
+    _fields = ('id', 'title', 'pure_title', 'thumbnail', 'article_url', 'publish_date',
+               'category', 'subcategory_label')
+    _interned = frozenset(('category', 'subcategory_label'))
@@ -0,0 +1,78 @@
+"""Response schemas of the API endpoints.
+
+Each page schema is compiled once (see pixiv.common.validate) and checked against every response
+of its endpoints by generate_data.  The lenient mode only checks the keys the API functions rely
+on; the strict mode also checks every item of a page against the item schemas below.
+
+"""
+
+from typing import Any
+
+from pixiv.common.validate import Schema, optional
+
+USER = {
+    'id': int,
+    'name': str,
+    'account': str,
+    'profile_image_urls': optional(dict)
+}
+
+TAG = {
+    'name': str,
+    'translated_name': optional(str)
+}
+
+ILLUST = {
+    'id': int,
+    'title': str,
+    'type': str,
+    'image_urls': dict,
+    'user': USER,
+    'tags': [TAG],
+    'create_date': str,
+    'page_count': int,
+    'width': int,
+    'height': int,
+    'total_view': optional(int),
+    'total_bookmarks': optional(int),
+    'meta_pages': optional(list)
+}
+
+BOOKMARK_TAG = {
+    'name': str,
+    'count': int
+}
+
+COMMENT = {
+    'id': int,
+    'comment': str,
+    'date': str,
+    'user': optional(USER),
+    'has_replies': optional(bool)
+}
+
+ARTICLE = {
+    'id': int,
+    'title': str,
+    'article_url': str,
+    'publish_date': str,
+    'category': str
+}
+
+USER_PREVIEW = {
+    'user': USER,
+    'illusts': optional([ILLUST])
+}
+
+
+def _page(list_key: str, item: Any, **other_keys: Any) -> Schema:
+    """Create the schema of a page holding a list of items under list_key."""
+    return Schema({list_key: [item], 'next_url': optional(str), **other_keys})
+
+
+BOOKMARK_TAGS = _page('bookmark_tags', BOOKMARK_TAG)
+ILLUSTS = _page('illusts', ILLUST)
+RECOMMENDED = _page('illusts', ILLUST, ranking_illusts=optional([ILLUST]))
+COMMENTS = _page('comments', COMMENT)
+ARTICLES = _page('spotlight_articles', ARTICLE)
+USER_PREVIEWS = _page('user_previews', USER_PREVIEW)
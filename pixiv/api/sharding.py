@@ -0,0 +1,187 @@
+"""Process pool orchestrator for large crawls.
+
+Decoding and validating responses is CPU-bound, so a single Python process making API calls runs
+out of CPU long before it runs out of network.  crawl_sharded splits a list of crawl tasks across a
+pool of worker processes.  Each worker has its own token and connection pool (an AccountPool of one
+account) and sends the items it retrieves back to the calling process in batches over a shared,
+bounded result queue.  The queues are served by a multiprocessing.Manager, so they can be passed to
+the workers with each task.
+
+Example:
+    >>> tasks = [CrawlTask(api.get_bookmarks, user_id) for user_id in user_ids]
+    >>> for index, illust in crawl_sharded(tasks, tokens, processes=8):
+    ...
+
+"""
+
+import multiprocessing
+import pickle
+import queue
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pixiv.auth.pool import AccountPool
+from pixiv.common.data import AuthToken
+
+# Message kinds passed from the worker processes to the calling process.
+_ITEMS = 0
+_ERROR = 1
+_DONE = 2
+
+# Account pool of the worker process, set by its first task.
+_WORKER_POOL = None
+
+
+class _Cancelled(Exception):
+    """Raised inside a worker process once the calling process has stopped iterating."""
+
+
+def _put(results, stop, message):
+    """Put a message on the bounded result queue, giving up once the iteration has stopped."""
+    while not stop.is_set():
+        try:
+            results.put(message, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+    raise _Cancelled()
+
+
+class CrawlTask:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
+    """Represent a single API call to be made by a worker process.
+
+    The function is called as function(auth_token, *args, **kwargs), so it must be an API function
+    (or any other picklable, module level function taking a token first) returning an iterator.
+
+    Attributes:
+        function: The API function to call.
+        args: Positional arguments following the auth token.
+        kwargs: Keyword arguments.
+
+    """
+
+    __slots__ = ['function', 'args', 'kwargs']
+    def __init__(self, function: Callable[..., Iterator[Any]], *args: Any, **kwargs: Any):
+        """Init CrawlTask with the API function and its arguments, except for the token."""
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+
+def _run_task(index: int, pickled_task: bytes, tokens, results, stop, batch_size: int):
+    """Run a pickled crawl task in a worker process, sending its items back in batches.
+
+    The first task run by a worker process takes a token for it from the token queue.
+
+    """
+    global _WORKER_POOL  # pylint: disable=global-statement
+    if _WORKER_POOL is None:
+        _WORKER_POOL = AccountPool([tokens.get()])
+    task = pickle.loads(pickled_task)
+    try:
+        batch = []
+        for item in task.function(_WORKER_POOL, *task.args, **task.kwargs):
+            batch.append(item)
+            if len(batch) == batch_size:
+                _put(results, stop, (_ITEMS, index, batch))
+                batch = []
+        if batch:
+            _put(results, stop, (_ITEMS, index, batch))
+        _put(results, stop, (_DONE, index, None))
+    except _Cancelled:
+        return
+    except Exception as ex:  # Ignore Reason: Re-raised by the calling process | pylint: disable=broad-except
+        try:
+            _put(results, stop, (_ERROR, index, ex))
+        except _Cancelled:
+            return
+
+
+def crawl_sharded(
+        tasks: Sequence[CrawlTask],
+        tokens: List[AuthToken],
+        processes: Optional[int] = None,
+        ordered: bool = False,
+        batch_size: int = 100,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> Iterator[Tuple[int, Any]]:
+    """Run crawl tasks on a pool of worker processes and yield every item they retrieve.
+
+    Tokens are handed out to the workers in turn, so with fewer tokens than processes some workers
+    share an account (but not a connection pool or renewal state).
+
+    With ordered=False, items are yielded as soon as they arrive.  With ordered=True, all items of
+    a task are yielded before any item of the next task, which requires buffering the items of
+    tasks that finish ahead of their turn.
+
+    Args:
+        tasks: The crawl tasks.
+        tokens: Auth bearer tokens for the worker processes.
+        processes: Number of worker processes, defaults to the number of CPUs.
+        ordered: Yield items in task order.
+        batch_size: Number of items sent back from a worker at once.
+        progress: Optional callback, called as progress(finished_tasks, total_tasks) each time a
+            task finishes.
+
+    Yields:
+        The next item as a (task index, item) tuple.
+
+    Raises:
+        Exception: The exception raised by a task, re-raised in the calling process.
+        PicklingError: A task could not be sent to a worker process.
+        BrokenProcessPool: A worker process died while running a task.
+
+    """
+    processes = processes or multiprocessing.cpu_count()
+    manager = multiprocessing.Manager()
+    token_queue = manager.Queue()
+    for i in range(processes):
+        token_queue.put(tokens[i % len(tokens)])
+    results = manager.Queue(maxsize=processes * 4)
+    stop = manager.Event()
+    executor = ProcessPoolExecutor(processes)
+
+    def forward_failure(index: int, future: Future):
+        # A task whose process died never reports back by itself.
+        if not future.cancelled() and future.exception() is not None:
+            try:
+                _put(results, stop, (_ERROR, index, future.exception()))
+            except _Cancelled:
+                return
+
+    buffered: Dict[int, List[Any]] = {}
+    finished = set()
+    next_index = 0
+    futures = []
+    try:
+        for index, task in enumerate(tasks):
+            # Pickled here, as before Python 3.7 a task the pool fails to pickle never completes.
+            futures.append(executor.submit(
+                _run_task, index, pickle.dumps(task), token_queue, results, stop, batch_size))
+            futures[-1].add_done_callback(
+                lambda future, index=index: forward_failure(index, future))
+        while len(finished) < len(tasks):
+            kind, index, value = results.get()
+            if kind == _ERROR:
+                raise value
+            if kind == _ITEMS:
+                if not ordered or index == next_index:
+                    for item in value:
+                        yield index, item
+                else:
+                    buffered.setdefault(index, []).extend(value)
+                continue
+
+            finished.add(index)
+            if progress is not None:
+                progress(len(finished), len(tasks))
+            while ordered and next_index in finished:
+                next_index += 1
+                for item in buffered.pop(next_index, []):
+                    yield next_index, item
+    finally:
+        stop.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        manager.shutdown()
@@ -4,3 +4,8 @@ from .auth import (
     get_auth_token,
     renew_auth_token
 )
+
+from .pool import (
+    AccountPool,
+    POOL_STRATEGY
+)
@@ -6,35 +6,10 @@ Layer above the models module for extracting particular data from the JSON respo
 
 import time
 
-from pixiv.auth import models
+from pixiv.auth import models, schemas
 from pixiv.auth.exceptions import AuthError
-from pixiv.common.exceptions import PixivError
+from pixiv.common.exceptions import DeadlineExceeded, PixivError
 from pixiv.common.data import AuthToken
-from pixiv.common import validate
-
-
-def _validate_auth_response(res_json):
-    """Validate raw JSON response of auth function.
-
-    Args:
-        res_json: The raw response JSON.
-
-    Raises:
-        DataNotFound: Validation failed due to missing data or unexpected data.
-
-    """
-
-    # Ensure sub-dictionary exists
-    validate.response_contains_key(res_json, 'response')
-    validate.response_key_mapping(res_json, 'response', dict)
-    # Ensure the sub-dictionary contains the required keys
-    validate.response_contains_key(res_json['response'], 'access_token')
-    validate.response_contains_key(res_json['response'], 'refresh_token')
-    validate.response_contains_key(res_json['response'], 'expires_in')
-    # Ensure the type of those keys is correct
-    validate.response_key_mapping(res_json['response'], 'access_token', str)
-    validate.response_key_mapping(res_json['response'], 'refresh_token', str)
-    validate.response_key_mapping(res_json['response'], 'expires_in', int)
 
 
 def get_auth_token(email: str, password: str) -> AuthToken:
@@ -57,12 +32,14 @@ def get_auth_token(email: str, password: str) -> AuthToken:
     """
     try:
         json = models.get_auth_token(email, password)
-        _validate_auth_response(json)
+        schemas.AUTH_RESPONSE(json)
         return AuthToken(
             access_token=json['response']['access_token'],      # pylint: disable=unsubscriptable-object
             refresh_token=json['response']['refresh_token'],    # pylint: disable=unsubscriptable-object
             ttl=json['response']['expires_in']                  # pylint: disable=unsubscriptable-object
         )
+    except DeadlineExceeded:
+        raise
     except PixivError as ex:
         raise AuthError(
             "An error occured while trying to make the Auth call 'get_auth_token.'"
@@ -94,13 +71,16 @@ def renew_auth_token(auth_token: AuthToken) -> AuthToken:
         # Check if the token has expired.
         if time.time() >= auth_token.expires_at:
             json = models.renew_auth_token(auth_token)
-            _validate_auth_response(json)
+            schemas.AUTH_RESPONSE(json)
             return AuthToken(
                 access_token=json['response']['access_token'],      # pylint: disable=unsubscriptable-object
                 refresh_token=json['response']['refresh_token'],    # pylint: disable=unsubscriptable-object
                 ttl=json['response']['expires_in']                  # pylint: disable=unsubscriptable-object
             )
         return auth_token
+    except DeadlineExceeded:
+        # Ends the API call the token was renewed for, which shares the deadline.
+        raise
     except PixivError as ex:
         raise AuthError(
             "An error occured while trying to make the Auth call 'renew_auth_token.'"
@@ -0,0 +1,190 @@
+"""Pool of Pixiv accounts used to spread API requests across several auth tokens.
+
+Pixiv throttles requests per account, so the throughput of a single token is capped no matter how
+many requests are made concurrently.  An AccountPool holds several accounts, each with its own
+token, token renewal, connection pool (requests.Session) and rate-limit state, and can be passed
+to any API or model function in place of an AuthToken.  Every request is then made with one of the
+healthy accounts in the pool.
+
+Example:
+    >>> pool = AccountPool.from_credentials([('user1', 'pass1'), ('user2', 'pass2')])
+    >>> for illust in api.get_rankings(pool):
+    ...
+
+"""
+
+import itertools
+import threading
+import time
+from typing import Any, Iterable, List, Optional, Tuple
+
+import requests
+
+from pixiv.auth.auth import get_auth_token, renew_auth_token
+from pixiv.auth.exceptions import AuthError
+from pixiv.common.data import AuthToken, TokenLease, TokenProvider
+
+
+class POOL_STRATEGY:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods,invalid-name
+    """Options for choosing the account that makes the next request."""
+
+    ROUND_ROBIN = 'round_robin'     # Take turns between the healthy accounts.
+    LEAST_LOADED = 'least_loaded'   # Use the healthy account with the fewest requests in flight.
+
+
+class Account:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
+    """State of a single account in an AccountPool.
+
+    Attributes:
+        token: The account's current auth bearer token.
+        session: Session holding the account's connection pool.
+        in_flight: Number of requests currently being made with the account.
+        quarantined_until: Epoch time until which the account is not used.
+        next_request_at: Earliest epoch time of the account's next request.
+        requests: Total number of requests made with the account.
+        throttled: Total number of requests made with the account that were throttled.
+
+    """
+
+    __slots__ = ['token', 'session', 'lock', 'in_flight', 'quarantined_until', 'next_request_at',
+                 'requests', 'throttled']
+    def __init__(self, token: AuthToken):
+        """Init Account with its auth bearer token."""
+        self.token = token
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.quarantined_until = 0.0
+        self.next_request_at = 0.0
+        self.requests = 0
+        self.throttled = 0
+
+
+def _is_throttled(response: Any) -> bool:
+    """Check whether a response indicates that the account has been rate limited."""
+    if response.status_code == 429:
+        return True
+    if response.status_code == 403:
+        return b'Rate Limit' in (response.content or b'')
+    return False
+
+
+class AccountPool(TokenProvider):
+    """Spread requests across several accounts.
+
+    Accounts which get throttled are quarantined for 'quarantine' seconds, during which no requests
+    are made with them.  If every account is quarantined, requests wait for the first account to
+    become available again.  Each account can also be limited to one request per 'min_interval'
+    seconds.
+
+    Attributes:
+        accounts: The accounts in the pool.
+        strategy: Pool strategy option.
+        quarantine: Seconds an account is not used for after being throttled.
+        min_interval: Minimum number of seconds between two requests made with an account.
+
+    """
+
+    def __init__(self, tokens: Iterable[AuthToken], strategy: str = POOL_STRATEGY.ROUND_ROBIN,
+                 quarantine: float = 300.0, min_interval: float = 0.0):
+        """Init AccountPool with the auth bearer token of each account."""
+        self.accounts = [Account(token) for token in tokens]
+        if not self.accounts:
+            raise ValueError('An AccountPool requires at least one account.')
+        self.strategy = strategy
+        self.quarantine = quarantine
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._turns = itertools.cycle(range(len(self.accounts)))
+
+    @classmethod
+    def from_credentials(cls, credentials: Iterable[Tuple[str, str]], **kwargs) -> 'AccountPool':
+        """Create a pool by logging into each account.
+
+        Args:
+            credentials: The (username, password) of each account.
+            kwargs: Other AccountPool arguments.
+
+        Returns:
+            A pool containing every account.
+
+        Raises:
+            AuthError: Logging into one of the accounts failed.
+
+        """
+        return cls([get_auth_token(email, password) for email, password in credentials], **kwargs)
+
+    def healthy(self) -> List[Account]:
+        """Get the accounts which are not quarantined."""
+        now = time.time()
+        return [account for account in self.accounts if account.quarantined_until <= now]
+
+    def _choose(self) -> Optional[Account]:
+        """Choose the next account, or None if every account is quarantined."""
+        healthy = self.healthy()
+        if not healthy:
+            return None
+        if self.strategy == POOL_STRATEGY.LEAST_LOADED:
+            return min(healthy, key=lambda account: account.in_flight)
+        for _ in range(len(self.accounts)):
+            account = self.accounts[next(self._turns)]
+            if account in healthy:
+                return account
+        return healthy[0]
+
+    def acquire(self) -> TokenLease:
+        """Lease the token and session of a healthy account for a single request.
+
+        Blocks while every account is quarantined or has to wait for its minimum interval.  The
+        account's token is renewed first if it has expired.
+
+        Returns:
+            The lease, to be handed back to release once the request completes.
+
+        Raises:
+            AuthError: None of the tokens could be renewed.
+
+        """
+        while True:
+            with self._lock:
+                account = self._choose()
+                if account is None:
+                    wait = min(other.quarantined_until for other in self.accounts) - time.time()
+                else:
+                    account.in_flight += 1
+                    wait = account.next_request_at - time.time()
+                    account.next_request_at = max(account.next_request_at, time.time())
+                    account.next_request_at += self.min_interval
+            if account is None:
+                time.sleep(max(wait, 0.0))
+                continue
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                with account.lock:
+                    account.token = renew_auth_token(account.token)
+            except AuthError:
+                with self._lock:
+                    account.in_flight -= 1
+                    account.quarantined_until = time.time() + self.quarantine
+                    if not self.healthy():
+                        raise
+                continue
+            return TokenLease(account.token, account.session, account)
+
+    def release(self, lease: TokenLease, response: Optional[Any]):
+        """Record the outcome of a request, quarantining the account if it was throttled.
+
+        Args:
+            lease: The lease returned by acquire.
+            response: The response received, or None if the request failed without one.
+
+        """
+        account = lease.owner
+        with self._lock:
+            account.in_flight -= 1
+            account.requests += 1
+            if response is not None and _is_throttled(response):
+                account.throttled += 1
+                account.quarantined_until = time.time() + self.quarantine
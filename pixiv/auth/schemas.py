@@ -0,0 +1,11 @@
+"""Response schemas of the authentication endpoints (see pixiv.common.validate)."""
+
+from pixiv.common.validate import Schema
+
+AUTH_RESPONSE = Schema({
+    'response': {
+        'access_token': str,
+        'refresh_token': str,
+        'expires_in': int
+    }
+})
@@ -0,0 +1,300 @@
+"""Helpers for running blocking API calls concurrently.
+
+The API functions are plain generators which block on each request.  The helpers in this module run
+them on a pool of threads and stream whatever they produce back to a single consuming generator,
+so a caller can iterate over the combined output as if it were one API call.
+
+tee and broadcast go the other way: they hand the output of a single API call to several consumers,
+each running at its own pace on its own thread, while every page is retrieved only once.
+
+"""
+
+import collections
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List
+
+# Message kinds passed from the worker threads to the consumer.
+_ITEM = 0
+_ERROR = 1
+_DONE = 2
+
+
+class _Cancelled(Exception):
+    """Raised inside a worker thread once the consumer has stopped iterating."""
+
+
+def run_tasks(
+        tasks: Iterable[Any],
+        worker: Callable[[Any, Callable[[Any], None], Callable[[Any], None]], None],
+        max_workers: int,
+        buffer_size: int = 1000
+    ) -> Iterator[Any]:
+    """Run tasks on a thread pool and yield every item the tasks emit.
+
+    The worker is called as worker(task, emit, submit) for each task.  'emit' hands an item to the
+    consumer and 'submit' schedules a follow-up task on the same pool, which lets a task split
+    itself into smaller tasks.  Items are yielded in the order they are emitted, not in task order.
+
+    The output buffer is bounded, so workers block once the consumer falls 'buffer_size' items
+    behind.  If the consumer stops iterating early, the remaining tasks are cancelled.
+
+    Args:
+        tasks: The initial tasks.
+        worker: Function which processes a single task.
+        max_workers: Maximum number of tasks running at the same time.
+        buffer_size: Maximum number of emitted items waiting to be consumed.
+
+    Yields:
+        The next item emitted by any of the tasks.
+
+    Raises:
+        Exception: The first exception raised by a worker, re-raised in the consumer.
+
+    """
+    output = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Starts at one so the pool cannot look finished while the initial tasks are being submitted.
+    pending = [1]
+    # Tasks which have not completed, cancelled if the consumer stops early.
+    futures = set()
+
+    def put(message):
+        while not stop.is_set():
+            try:
+                output.put(message, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _Cancelled()
+
+    def emit(item):
+        put((_ITEM, item))
+
+    def finish():
+        with lock:
+            pending[0] -= 1
+            done = pending[0] == 0
+        if done:
+            put((_DONE, None))
+
+    def run(task):
+        try:
+            worker(task, emit, submit)
+        except _Cancelled:
+            return
+        except Exception as ex:  # Ignore Reason: Re-raised by the consumer | pylint: disable=broad-except
+            try:
+                put((_ERROR, ex))
+            except _Cancelled:
+                return
+        try:
+            finish()
+        except _Cancelled:
+            return
+
+    def submit(task):
+        with lock:
+            pending[0] += 1
+        future = executor.submit(run, task)
+        with lock:
+            futures.add(future)
+        future.add_done_callback(futures.discard)
+
+    try:
+        for task in tasks:
+            submit(task)
+        finish()
+        while True:
+            kind, value = output.get()
+            if kind == _DONE:
+                return
+            if kind == _ERROR:
+                raise value
+            yield value
+    finally:
+        stop.set()
+        with lock:
+            for future in list(futures):
+                future.cancel()
+        executor.shutdown(wait=False)
+
+
+class _SharedBuffer:
+    """Bounded buffer of the items of one iterator, read by several consumers.
+
+    An item is kept until every consumer still attached has read it.  The consumer that needs an
+    item nobody has read yet retrieves it from the iterator, unless the buffer already holds
+    'buffer_size' items, in which case it waits for the slowest consumer to catch up.
+
+    """
+
+    def __init__(self, items: Iterable[Any], consumers: int, buffer_size: int):
+        """Init _SharedBuffer with the iterator and the number of consumers."""
+        self._source = iter(items)
+        self._buffer = collections.deque()
+        self._start = 0                 # Index of the first buffered item in the iterator.
+        self._positions = dict.fromkeys(range(consumers), 0)
+        self._buffer_size = buffer_size
+        self._condition = threading.Condition()
+        self._fetching = False
+        self._end = None                # Index of the end of the iterator, once reached.
+        self._error = None
+
+    def get(self, consumer: int) -> Any:
+        """Get the next item of a consumer.
+
+        Raises:
+            StopIteration: The iterator is exhausted.
+            Exception: The exception raised by the iterator, re-raised in every consumer.
+
+        """
+        while True:
+            with self._condition:
+                while True:
+                    position = self._positions[consumer]
+                    if position < self._start + len(self._buffer):
+                        self._positions[consumer] = position + 1
+                        item = self._buffer[position - self._start]
+                        self._trim()
+                        return item
+                    if self._end is not None:
+                        if self._error is not None:
+                            raise self._error
+                        raise StopIteration
+                    if not self._fetching and len(self._buffer) < self._buffer_size:
+                        self._fetching = True
+                        break
+                    self._condition.wait()
+
+            # Retrieve the next item without holding the lock, so the other consumers can keep
+            # reading the buffered items in the meantime.
+            item = error = None
+            try:
+                item = next(self._source)
+            except StopIteration:
+                error = StopIteration
+            except Exception as ex:  # Ignore Reason: Re-raised by every consumer | pylint: disable=broad-except
+                error = ex
+            with self._condition:
+                self._fetching = False
+                if error is None:
+                    self._buffer.append(item)
+                else:
+                    self._end = self._start + len(self._buffer)
+                    self._error = None if error is StopIteration else error
+                self._condition.notify_all()
+
+    def detach(self, consumer: int):
+        """Stop holding items back for a consumer which stopped iterating."""
+        with self._condition:
+            self._positions.pop(consumer, None)
+            self._trim()
+
+    def _trim(self):
+        """Drop the items read by every consumer, waking up consumers waiting for space."""
+        oldest = min(self._positions.values(), default=self._start + len(self._buffer))
+        if oldest > self._start:
+            for _ in range(oldest - self._start):
+                self._buffer.popleft()
+            self._start = oldest
+            self._condition.notify_all()
+
+
+class _Consumer:
+    """Iterator over the items of a shared buffer as one of its consumers."""
+
+    def __init__(self, shared: _SharedBuffer, consumer: int):
+        """Init _Consumer with its shared buffer and consumer number."""
+        self._shared = shared
+        self._consumer = consumer
+        self._closed = False
+
+    def __iter__(self) -> '_Consumer':
+        return self
+
+    def __next__(self) -> Any:
+        if self._closed:
+            raise StopIteration
+        try:
+            return self._shared.get(self._consumer)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        """Stop iterating, so the other consumers are no longer held back by this one."""
+        if not self._closed:
+            self._closed = True
+            self._shared.detach(self._consumer)
+
+    def __del__(self):
+        self.close()
+
+
+def tee(items: Iterable[Any], consumers: int, buffer_size: int = 1000) -> List[Iterator[Any]]:
+    """Split one iterator, i.e. an API generator, into several independent iterators.
+
+    Unlike itertools.tee, the iterators can be consumed from different threads at the same time,
+    and the items held for the slowest iterator are bounded: once it falls 'buffer_size' items
+    behind the fastest, the fastest blocks until it catches up.  Each item, and so each page of an
+    API call, is retrieved only once.  An iterator which is closed (or garbage collected) before
+    the end no longer holds the others back.
+
+    Args:
+        items: The items to share.
+        consumers: Number of iterators.
+        buffer_size: Maximum number of items held for the slowest iterator.
+
+    Returns:
+        The iterators, each yielding every item.  An exception raised by 'items' is raised by
+        every iterator when it reaches it.
+
+    """
+    shared = _SharedBuffer(items, consumers, buffer_size)
+    return [_Consumer(shared, consumer) for consumer in range(consumers)]
+
+
+def broadcast(
+        items: Iterable[Any],
+        consumers: Iterable[Callable[[Iterator[Any]], Any]],
+        buffer_size: int = 1000
+    ) -> List[Any]:
+    """Feed one iterator, i.e. an API generator, to several consumers running on their own threads.
+
+    Each consumer is called with an iterator over every item (see tee) and runs on its own thread,
+    so a slow consumer (i.e. a downloader) only holds back the others once it is 'buffer_size'
+    items behind.
+
+    Example:
+        >>> store, stats = broadcast(api.get_rankings(token), [save_all, count_tags])
+
+    Args:
+        items: The items to share.
+        consumers: Functions taking an iterator over the items.
+        buffer_size: Maximum number of items held for the slowest consumer.
+
+    Returns:
+        The value returned by each consumer, in order.
+
+    Raises:
+        Exception: The first exception raised by a consumer (or by 'items'), once every consumer
+            has returned.
+
+    """
+    consumers = list(consumers)
+    iterators = tee(items, len(consumers), buffer_size)
+
+    def run(consumer, iterator):
+        try:
+            return consumer(iterator)
+        finally:
+            iterator.close()
+
+    with ThreadPoolExecutor(max_workers=max(1, len(consumers))) as executor:
+        futures = [executor.submit(run, consumer, iterator)
+                   for consumer, iterator in zip(consumers, iterators)]
+    return [future.result() for future in futures]
@@ -1,7 +1,8 @@
 """Common dataclasses used by the API and auth packages."""
 
+import abc
 import time
-from typing import Optional
+from typing import Any, Iterator, List, Optional
 
 
 class AuthToken:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
@@ -23,3 +24,85 @@ class AuthToken:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-
         self.refresh_token = refresh_token
         self.ttl = ttl
         self.expires_at = (expires_at, int(time.time()) + ttl)[expires_at is None]
+
+
+class TokenLease:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
+    """Represent an auth bearer token handed out by a TokenProvider for a single request.
+
+    Attributes:
+        token: A valid auth bearer token.
+        session: The requests.Session the request is sent with.
+        owner: Provider specific data identifying where the token came from.
+
+    """
+
+    __slots__ = ['token', 'session', 'owner']
+    def __init__(self, token: AuthToken, session: Any, owner: Any = None):
+        """Init TokenLease with a token, the session to use and its owner."""
+        self.token = token
+        self.session = session
+        self.owner = owner
+
+
+class TokenProvider(abc.ABC):
+    """Source of auth bearer tokens which can be passed to the models in place of an AuthToken.
+
+    Before each request the 'request' decorator acquires a lease from the provider, sends the
+    request with the leased token and session, and then releases the lease together with the
+    response so the provider can track the health of the token.
+
+    """
+
+    @abc.abstractmethod
+    def acquire(self) -> TokenLease:
+        """Lease a token for a single request."""
+
+    @abc.abstractmethod
+    def release(self, lease: TokenLease, response: Optional[Any]):
+        """Return a leased token along with the response, or None if no response was received."""
+
+
+class ResponseInfo:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
+    """Represent the transfer of a single response.
+
+    Attributes:
+        status_code: The status code of the response.
+        elapsed: Seconds from sending the request until the whole body was received.
+        size: Size of the body in bytes, None for a streamed response.
+
+    """
+
+    __slots__ = ['status_code', 'elapsed', 'size']
+    def __init__(self, status_code: int, elapsed: float, size: Optional[int]):
+        """Init ResponseInfo with the status code, transfer time and size of the response."""
+        self.status_code = status_code
+        self.elapsed = elapsed
+        self.size = size
+
+
+class Page:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
+    """Represent a single page of data retrieved by an API call.
+
+    Attributes:
+        items: The items of the page.
+        next_url: The 'next_url' of the response, None on the last page.
+        elapsed: Seconds from sending the request until the whole page was received, None if
+            unknown.
+        size: Size of the response body in bytes, None if unknown.
+
+    """
+
+    __slots__ = ['items', 'next_url', 'elapsed', 'size']
+    def __init__(self, items: List[Any], next_url: Optional[str],
+                 elapsed: Optional[float] = None, size: Optional[int] = None):
+        """Init Page with its items, the URL of the next page and transfer info."""
+        self.items = items
+        self.next_url = next_url
+        self.elapsed = elapsed
+        self.size = size
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.items)
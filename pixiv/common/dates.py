@@ -0,0 +1,17 @@
+"""Parsing of the dates in API responses."""
+
+import datetime
+from typing import Optional
+
+# Format of the dates in API responses, i.e. '2019-03-02T00:08:17+09:00'.
+_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
+
+
+def create_time(create_date: Optional[str]) -> int:
+    """Convert the 'create_date' of an illustration to epoch seconds, 0 if unknown."""
+    if not create_date:
+        return 0
+    # Before Python 3.7, %z does not accept a colon in the UTC offset.
+    if create_date[-3:-2] == ':':
+        create_date = create_date[:-3] + create_date[-2:]
+    return int(datetime.datetime.strptime(create_date, _DATE_FORMAT).timestamp())
@@ -0,0 +1,56 @@
+"""JSON decoder used for every model response.
+
+Decoding the JSON body is the largest CPU cost of an API call.  By default responses are decoded
+from the raw bytes of the body with orjson when it is installed, which takes about a third of the
+time of response.json() (see benchmarks/decode_benchmark.py).  Otherwise they are decoded with the
+standard library json module, which is about as fast as response.json(), so only installs with
+orjson are sped up.
+
+Any function taking the body as bytes and returning the decoded JSON can be used instead.
+
+Example:
+    >>> import ujson
+    >>> decoder.set_decoder(ujson.loads)
+    >>> decoder.set_decoder(None)   # Back to the default decoder.
+
+"""
+
+import json
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def stdlib_decode(content: bytes) -> Any:
+    """Decode JSON with the standard library, detecting the encoding of the bytes."""
+    return json.loads(content)
+
+
+DEFAULT_DECODER: Callable[[bytes], Any] = stdlib_decode if orjson is None else orjson.loads
+
+_decoder = DEFAULT_DECODER
+
+
+def set_decoder(decoder: Optional[Callable[[bytes], Any]]):
+    """Set the decoder used for every model response.
+
+    Args:
+        decoder: Function decoding the raw bytes of a response body, or None to restore the
+            default decoder.
+
+    """
+    global _decoder  # pylint: disable=global-statement
+    _decoder = DEFAULT_DECODER if decoder is None else decoder
+
+
+def get_decoder() -> Callable[[bytes], Any]:
+    """Get the decoder used for every model response."""
+    return _decoder
+
+
+def decode(content: bytes) -> Any:
+    """Decode the raw bytes of a response body with the current decoder."""
+    return _decoder(content)
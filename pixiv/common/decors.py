@@ -1,11 +1,49 @@
 """Python-Pixiv common decorator functions."""
 
-from functools import wraps
-from typing import Dict, Callable, List
+import inspect
+import threading
+import time
+from functools import partial, wraps
+from typing import Dict, Callable, List, Optional
 
 import requests
 
-from pixiv.common.exceptions import InvalidStatusCode, RetryError
+from pixiv.common import decoder, hedging, scheduler, stream, timeouts
+from pixiv.common.data import ResponseInfo, TokenProvider
+from pixiv.common.exceptions import (
+    DeadlineExceeded, InvalidStatusCode, RetryError
+)
+
+# Info on the last response received by each thread.
+_last_response = threading.local()
+
+# Bytes read at a time from the body of a response under a deadline.
+_CHUNK_SIZE = 16 * 1024
+
+
+def last_response() -> Optional[ResponseInfo]:
+    """Get the status, timing and size of the last response received by the calling thread.
+
+    Set by every model call once the body of the response has been received, or for a streamed
+    response, once its headers have been received (with a size of None).
+
+    """
+    return getattr(_last_response, 'info', None)
+
+
+def _content(response: requests.Response, expires: Optional[float]) -> bytes:
+    """Read the body of a response made with stream=True, raising once the deadline has passed."""
+    chunks = []
+    try:
+        for chunk in response.iter_content(_CHUNK_SIZE):
+            timeouts.remaining(expires)
+            chunks.append(chunk)
+    except requests.RequestException as ex:
+        timeouts.raise_if_timeout(ex, expires, 'Timed out while reading the body of the response.')
+        raise
+    finally:
+        response.close()
+    return b''.join(chunks)
 
 
 def request(expected_code: int) -> Dict:
@@ -15,30 +53,109 @@ def request(expected_code: int) -> Dict:
     via the requests module. After making the request, it checks the status code of the
     response and ensures that it matches the expected code.
 
+    If the wrapped function's 'auth_token' argument is a TokenProvider (i.e. an AccountPool), a
+    token is leased from it for this request only.  The request is sent with the session of the
+    lease and the response is handed back to the provider once the request completes.
+
+    If a scheduler is set in the scheduler module, the request then waits for a slot from it, held
+    until the response (or the headers of a streamed response) has been received.  The lease is
+    taken first, so a provider waiting for a token (i.e. on its min_interval) holds no slot.
+
+    The request is sent with the connect and read timeouts set in the timeouts module.  Inside a
+    timeouts.deadline_at block, they are shortened to the time left before the deadline, the body
+    is read in chunks so a slow body cannot outlast it, and no request is sent once it has passed.
+
+    If a hedging policy is set in the hedging module, the request is sent through it, so a slow
+    GET request is sent a second time on another connection and the first response is used.
+
+    The body of the response is decoded from its raw bytes with the decoder set in the decoder
+    module.  Inside a stream.streaming block, the body is instead streamed and a
+    stream.StreamedResponse is returned, which parses the list as the body is downloaded.
+
     Args:
         expected_code: The expected response status code.
 
     Returns:
-        The raw JSON response, if the API call was successful.
+        The raw JSON response (or a StreamedResponse when streaming), if the API call was
+        successful.
 
     Raises:
         InvalidStatusCode: The expected_code value does not match the response status code.
+        RequestTimeout: The server did not respond within the connect or read timeout.
+        DeadlineExceeded: The deadline of the enclosing timeouts.deadline_at block has passed.
 
     """
     def decorator(function: Callable):
-        @wraps(function)
-        def wrapper(*args, **kwargs):
+        signature = inspect.signature(function)
+
+        def send(args, kwargs, session, list_key):
             request_model = function(*args, **kwargs)
             prepared_request = request_model.prepare()
-            response = requests.Session().send(prepared_request)
+            timeout = timeouts.request_timeout()
+            expires = timeouts.current_deadline()
+            policy = hedging.get_hedging()
+            send_request = session.send if policy is None else \
+                partial(policy.send, session)
+            try:
+                if list_key is None and expires is None:
+                    return send_request(prepared_request, timeout=timeout)
+                return send_request(prepared_request, stream=True, timeout=timeout)
+            except requests.RequestException as ex:
+                # Raises DeadlineExceeded instead if the timeout was shortened by the deadline.
+                timeouts.raise_if_timeout(
+                    ex, expires,
+                    f'Timed out after {timeout} seconds | Function Call: {function.__name__}'
+                )
+                raise
 
+        def check(response, list_key, started):
             if response.status_code != expected_code:
                 raise InvalidStatusCode(
                     f'Expect Code: {expected_code} | Got: {response.status_code} | '+
                     f'Function Call: {function.__name__}\n'+
                     f'Response Body: {response.content}'
                 )
-            return response.json()
+            if list_key is not None:
+                _last_response.info = ResponseInfo(
+                    response.status_code, time.perf_counter() - started, None
+                )
+                return stream.StreamedResponse(response, list_key)
+            expires = timeouts.current_deadline()
+            content = response.content if expires is None else _content(response, expires)
+            _last_response.info = ResponseInfo(
+                response.status_code, time.perf_counter() - started, len(content)
+            )
+            return decoder.decode(content)
+
+        def schedule(args, kwargs, session, list_key):
+            request_scheduler = scheduler.get_scheduler()
+            if request_scheduler is None:
+                started = time.perf_counter()
+                return send(args, kwargs, session, list_key), started
+            with request_scheduler.slot():
+                started = time.perf_counter()
+                return send(args, kwargs, session, list_key), started
+
+        def call(args, kwargs, list_key):
+            bound = signature.bind(*args, **kwargs)
+            provider = bound.arguments.get('auth_token')
+            if not isinstance(provider, TokenProvider):
+                return schedule(args, kwargs, requests.Session(), list_key)
+
+            lease = provider.acquire()
+            bound.arguments['auth_token'] = lease.token
+            response = None
+            try:
+                response, started = schedule(bound.args, bound.kwargs, lease.session, list_key)
+            finally:
+                provider.release(lease, response)
+            return response, started
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            list_key = stream.streamed_list_key()
+            response, started = call(args, kwargs, list_key)
+            return check(response, list_key, started)
         return wrapper
     return decorator
 
@@ -56,6 +173,8 @@ def retry(times: int, on_exceptions: List[Exception]):
     Raises:
         Exception: The last exception raised after exceeding the number of retry times.
         RetryError: An unexpected exception occurred while making the function call.
+        DeadlineExceeded: The deadline of the call has passed, raised as is since a retry would
+            fail the same way.
 
     Example:
         >>> @retry(times = 2, on_exceptions = [InvalidStatusCode, InvalidJsonResponse])
@@ -72,6 +191,8 @@ def retry(times: int, on_exceptions: List[Exception]):
             for _ in range(times):
                 try:
                     return function(*args, **kwargs)
+                except DeadlineExceeded:
+                    raise
                 except Exception as ex:
                     raised.append(ex)
                     if type(ex) not in on_exceptions:
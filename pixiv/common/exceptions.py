@@ -1,5 +1,9 @@
 """python-pixiv common exception classes."""
 
+import reprlib
+from typing import Any
+
+
 class PixivError(Exception):
     """Generic exception when an error occurs."""
 
@@ -8,9 +12,63 @@ class InvalidStatusCode(PixivError):
     """Indicates that the status code in the response did not match the expected code."""
 
 
+class RequestTimeout(PixivError):
+    """Indicates that the server did not accept the connection or send data within the timeout."""
+
+
+class DeadlineExceeded(PixivError):
+    """Indicates that the deadline of a request was exceeded before it completed."""
+
+
 class RetryError(PixivError):
     """Indicates that the retry decorator was unable to continue due to an unexpected exception."""
 
 
 class DataNotFound(PixivError):
     """Indicates that data could not be found in the JSON response."""
+
+
+class SchemaMismatch(DataNotFound):
+    """Indicates that the JSON response does not match the schema of the endpoint.
+
+    The message, which includes an abbreviated copy of the response, is only built when the
+    exception is printed, so validation failures that are caught and retried cost next to nothing.
+
+    Attributes:
+        path: Path of the mismatching value in the response, i.e. 'illusts[].user.id'.
+        expected: The expected type(s), or None for a missing key.
+        value: The mismatching value, or None for a missing key.
+        response: The validated response.
+
+    """
+
+    payload_limit = 1000
+
+    def __init__(self, path: str, expected: Any, value: Any, response: Any):
+        """Init SchemaMismatch, without building the message."""
+        super().__init__(path)
+        self.path = path
+        self.expected = expected
+        self.value = value
+        self.response = response
+
+    def __str__(self) -> str:
+        if self.expected is None:
+            problem = f"Could not find key '{self.path}' in the JSON response."
+        else:
+            problem = (
+                f"Failed to find the expected type for key '{self.path}.'\n"+
+                f"Expected type: {self.expected} | Got type: {type(self.value)}."
+            )
+        payload = _PAYLOAD_REPR.repr(self.response)
+        if len(payload) > self.payload_limit:
+            payload = payload[:self.payload_limit] + '...'
+        return f'{problem}\nResponse: {payload}'
+
+
+_PAYLOAD_REPR = reprlib.Repr()
+_PAYLOAD_REPR.maxlevel = 4
+_PAYLOAD_REPR.maxdict = 10
+_PAYLOAD_REPR.maxlist = 3
+_PAYLOAD_REPR.maxstring = 80
+_PAYLOAD_REPR.maxother = 80
@@ -0,0 +1,197 @@
+"""Hedged requests.
+
+A small share of requests take many times the median latency, and a lookup made of a few requests
+is as slow as its slowest one.  With a HedgingPolicy set (see set_hedging), the request decorator
+sends each GET request through the policy: once the request has gone unanswered for longer than a
+percentile of the recent latencies (i.e. the 95th), a duplicate is sent on another connection.  The
+first response received is used, and the other request is cancelled if it has not started yet, or
+its response closed once it arrives, which frees its connection.
+
+Only GET requests are hedged since sending them twice has no side effect.  The volume of hedges
+is capped by a budget: each request adds 'max_ratio' of a hedge to it, up to 'burst' hedges, and
+each hedge spends one, so at most about max_ratio of the requests are sent twice even when the
+server is slow across the board.  A request is only sent from a thread of the policy while the
+budget holds a hedge for it, otherwise it is sent on the caller's thread.
+
+Example:
+    >>> set_hedging(HedgingPolicy(percentile=95, max_ratio=0.05))
+    >>> related = list(api.get_related(auth_token, illust_id))
+
+"""
+
+import math
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Optional
+
+import requests
+
+_policy = None
+
+
+def set_hedging(policy: Optional['HedgingPolicy']):
+    """Set the hedging policy of every model call, None to send each request once."""
+    global _policy  # pylint: disable=global-statement
+    _policy = policy
+
+
+def get_hedging() -> Optional['HedgingPolicy']:
+    """Get the hedging policy of every model call, None if there is none."""
+    return _policy
+
+
+def _close(future: Future):
+    """Close the response of a request which lost the race, once it arrives."""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class HedgingPolicy:
+    """Send a duplicate of a slow GET request and use whichever response comes first.
+
+    Attributes:
+        percentile: Percentile of the recent latencies after which a request is hedged.
+        min_delay: Minimum seconds to wait before hedging a request.
+        max_ratio: Maximum share of the requests which are hedged.
+        burst: Maximum number of hedges the budget can save up.
+        min_samples: Number of latencies to record before any request is hedged.
+        requests: Number of requests sent through the policy.
+        hedged: Number of requests for which a hedge was sent.
+        hedge_wins: Number of hedged requests answered first by the hedge.
+
+    """
+
+    def __init__(self, percentile: float = 95.0, min_delay: float = 0.05,
+                 max_ratio: float = 0.1, burst: float = 10.0, window: int = 1000,
+                 min_samples: int = 20, max_workers: int = 32):
+        """Init HedgingPolicy with its hedging delay and budget."""
+        if not 0 < percentile <= 100:
+            raise ValueError('percentile must be within (0, 100].')
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=window)
+        self._budget = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Idle sessions for the hedges, so a hedge never waits behind its own request.
+        self._sessions: queue.Queue = queue.Queue()
+
+    def delay(self) -> Optional[float]:
+        """Get the seconds after which a request is hedged, None until enough were recorded."""
+        with self._lock:
+            if len(self._latencies) < max(1, self.min_samples):
+                return None
+            latencies = sorted(self._latencies)
+        index = math.ceil(self.percentile / 100 * len(latencies)) - 1
+        return max(self.min_delay, latencies[index])
+
+    def record(self, seconds: float):
+        """Record the latency of a request."""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _spend(self) -> bool:
+        """Take a hedge from the budget, False if it is spent."""
+        with self._lock:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            self.hedged += 1
+            return True
+
+    def _affordable(self) -> bool:
+        """Whether the budget holds a hedge."""
+        with self._lock:
+            return self._budget >= 1
+
+    def _send_timed(self, session: requests.Session, prepared: requests.PreparedRequest,
+                    **kwargs) -> requests.Response:
+        """Send a request, recording its latency from the moment it is sent."""
+        started = time.perf_counter()
+        response = session.send(prepared, **kwargs)
+        # Recorded even if the request loses, so hedging does not lower its own percentile.
+        self.record(time.perf_counter() - started)
+        return response
+
+    def _send_hedge(self, prepared: requests.PreparedRequest, **kwargs) -> requests.Response:
+        """Send a request with an idle hedge session."""
+        try:
+            session = self._sessions.get_nowait()
+        except queue.Empty:
+            session = requests.Session()
+        try:
+            return session.send(prepared, **kwargs)
+        finally:
+            self._sessions.put(session)
+
+    def send(self, session: requests.Session, prepared: requests.PreparedRequest,
+             **kwargs) -> requests.Response:
+        """Send a request with a session, hedging it if it is a GET request that is slow to answer.
+
+        Args:
+            session: Session the request is sent with first.
+            prepared: The request.
+            kwargs: Other arguments of requests.Session.send, i.e. the timeout.
+
+        Returns:
+            The first response received.
+
+        Raises:
+            Exception: The exception raised by the request, if the hedge failed as well.
+
+        """
+        with self._lock:
+            self.requests += 1
+            self._budget = min(self.burst, self._budget + self.max_ratio)
+        delay = self.delay()
+        if prepared.method != 'GET' or delay is None or not self._affordable():
+            return self._send_timed(session, prepared, **kwargs)
+
+        # Sent from a thread of the policy so the caller can return the hedge's response first.
+        first = self._executor.submit(self._send_timed, session, prepared, **kwargs)
+        done, _ = wait([first], timeout=delay)
+        if done or not self._spend():
+            return first.result()
+
+        hedge = self._executor.submit(self._send_hedge, prepared.copy(), **kwargs)
+        pending = {first, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is not None:
+                break
+        else:
+            # Both failed, raise the error of the first request.
+            return first.result()
+
+        loser = hedge if winner is first else first
+        if winner is hedge:
+            with self._lock:
+                self.hedge_wins += 1
+        if not loser.cancel():
+            loser.add_done_callback(_close)
+        return winner.result()
+
+    def close(self):
+        """Stop the threads and close the sessions of the policy."""
+        self._executor.shutdown(wait=False)
+        while True:
+            try:
+                self._sessions.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __enter__(self) -> 'HedgingPolicy':
+        return self
+
+    def __exit__(self, *_: Any):
+        self.close()
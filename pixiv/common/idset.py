@@ -0,0 +1,361 @@
+"""Compact set of integer IDs.
+
+A Python set of ints takes about 70 bytes per ID.  IdSet splits each ID into its upper bits, which
+select a container, and its lower 16 bits, which are stored in the container:
+    Sparse containers (up to 4096 IDs) are sorted arrays of 16 bit values, 2 bytes per ID.
+    Dense containers are bitmaps of 65536 bits, 8 KiB whatever the number of IDs.
+Pixiv IDs are assigned sequentially, so the IDs of a crawl cluster into dense containers: 100M
+illustration IDs take at most about 16 MiB.
+
+Sets are combined with the usual operators (|, &, - and the in-place variants), are thread-safe
+for add and contains, and can be written to and read from disk.
+
+Example:
+    >>> seen = IdSet.load('seen.ids') if os.path.exists('seen.ids') else IdSet()
+    >>> for illust in dedup(api.get_related(token, illust_id), seen):
+    ...
+    >>> seen.save('seen.ids')
+
+"""
+
+import bisect
+import io
+import os
+import struct
+import sys
+import threading
+from array import array
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, Optional, Union
+
+_MAGIC = b'PXIDS001'
+# magic, number of containers
+_HEADER = struct.Struct('<8sQ')
+# container key, number of IDs in the container
+_CONTAINER = struct.Struct('<QI')
+
+_LOW_BITS = 16
+_LOW_MASK = (1 << _LOW_BITS) - 1
+_BITMAP_BYTES = (1 << _LOW_BITS) // 8
+# A sorted array is converted to a bitmap once it would take more memory.
+_ARRAY_MAX = _BITMAP_BYTES // 2
+
+# Number of set bits in each byte value.
+_POPCOUNT = bytes(bin(value).count('1') for value in range(256))
+
+_Container = Union[array, bytearray]
+
+
+def _to_bitmap(values: Iterable[int]) -> bytearray:
+    """Convert the low bits of a container into a bitmap."""
+    bitmap = bytearray(_BITMAP_BYTES)
+    for low in values:
+        bitmap[low >> 3] |= 1 << (low & 7)
+    return bitmap
+
+
+def _bitmap_values(bitmap: bytearray) -> Iterator[int]:
+    """Get the set bits of a bitmap in increasing order."""
+    for index, byte in enumerate(bitmap):
+        while byte:
+            lowest = byte & -byte
+            yield (index << 3) | (lowest.bit_length() - 1)
+            byte ^= lowest
+
+
+def _shrink(container: _Container) -> Optional[_Container]:
+    """Convert a container to its most compact form, None if it is empty."""
+    if isinstance(container, array):
+        return container or None
+    count = sum(_POPCOUNT[byte] for byte in container) if any(container) else 0
+    if count == 0:
+        return None
+    if count <= _ARRAY_MAX:
+        return array('H', _bitmap_values(container))
+    return container
+
+
+def _combine(first: _Container, second: _Container, operation: str) -> Optional[_Container]:
+    """Combine two containers with a set operation ('or', 'and' or 'sub')."""
+    if isinstance(first, array) and isinstance(second, array):
+        first_set, second_set = set(first), set(second)
+        if operation == 'or':
+            values = first_set | second_set
+        elif operation == 'and':
+            values = first_set & second_set
+        else:
+            values = first_set - second_set
+        if len(values) > _ARRAY_MAX:
+            return _to_bitmap(values)
+        return array('H', sorted(values)) or None
+    first_bits = int.from_bytes(first if isinstance(first, bytearray) else _to_bitmap(first),
+                                'little')
+    second_bits = int.from_bytes(second if isinstance(second, bytearray) else _to_bitmap(second),
+                                 'little')
+    if operation == 'or':
+        bits = first_bits | second_bits
+    elif operation == 'and':
+        bits = first_bits & second_bits
+    else:
+        bits = first_bits & ~second_bits
+    return _shrink(bytearray(bits.to_bytes(_BITMAP_BYTES, 'little')))
+
+
+class IdSet:
+    """Set of non-negative integer IDs, i.e. illustration or user IDs."""
+
+    def __init__(self, ids: Iterable[int] = ()):
+        """Init IdSet with optional initial IDs."""
+        self._containers: Dict[int, _Container] = {}
+        self._len = 0
+        self._lock = threading.Lock()
+        self.update(ids)
+
+    def add(self, value: int) -> bool:
+        """Add an ID to the set.
+
+        Returns:
+            Whether the ID was not in the set already.
+
+        """
+        key, low = value >> _LOW_BITS, value & _LOW_MASK
+        with self._lock:
+            container = self._containers.get(key)
+            if container is None:
+                self._containers[key] = array('H', [low])
+            elif isinstance(container, bytearray):
+                mask = 1 << (low & 7)
+                if container[low >> 3] & mask:
+                    return False
+                container[low >> 3] |= mask
+            else:
+                index = bisect.bisect_left(container, low)
+                if index < len(container) and container[index] == low:
+                    return False
+                if len(container) < _ARRAY_MAX:
+                    container.insert(index, low)
+                else:
+                    bitmap = self._containers[key] = _to_bitmap(container)
+                    bitmap[low >> 3] |= 1 << (low & 7)
+            self._len += 1
+            return True
+
+    def update(self, ids: Iterable[int]):
+        """Add every ID of an iterable to the set."""
+        for value in ids:
+            self.add(value)
+
+    def discard(self, value: int):
+        """Remove an ID from the set if it is in the set."""
+        key, low = value >> _LOW_BITS, value & _LOW_MASK
+        with self._lock:
+            container = self._containers.get(key)
+            if value not in self:
+                return
+            if isinstance(container, bytearray):
+                # Bitmaps are only converted back to arrays by the set operations.
+                container[low >> 3] &= ~(1 << (low & 7)) & 0xFF
+            else:
+                container.pop(bisect.bisect_left(container, low))
+                if not container:
+                    del self._containers[key]
+            self._len -= 1
+
+    def __contains__(self, value: Any) -> bool:
+        if not isinstance(value, int) or value < 0:
+            return False
+        container = self._containers.get(value >> _LOW_BITS)
+        if container is None:
+            return False
+        low = value & _LOW_MASK
+        if isinstance(container, bytearray):
+            return bool(container[low >> 3] & (1 << (low & 7)))
+        index = bisect.bisect_left(container, low)
+        return index < len(container) and container[index] == low
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterate over the IDs in increasing order."""
+        for key in sorted(self._containers):
+            container = self._containers[key]
+            values = _bitmap_values(container) if isinstance(container, bytearray) else container
+            base = key << _LOW_BITS
+            for low in values:
+                yield base | low
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, IdSet):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f'<IdSet of {len(self)} IDs, {self.nbytes} bytes>'
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes taken by the containers' values."""
+        return sum(
+            len(container) if isinstance(container, bytearray) else 2 * len(container)
+            for container in self._containers.values()
+        )
+
+    def _combine(self, other: 'IdSet', operation: str) -> 'IdSet':
+        """Combine with another set into a new set."""
+        # pylint: disable=protected-access
+        result = IdSet()
+        keys = set(self._containers)
+        if operation == 'or':
+            keys |= set(other._containers)
+        elif operation == 'and':
+            keys &= set(other._containers)
+        for key in keys:
+            first, second = self._containers.get(key), other._containers.get(key)
+            if first is None or second is None:
+                # Only in one of the sets: 'and' only iterates over keys in both sets, 'sub' only
+                # over keys in the first.
+                container = (first if second is None else second)[:]
+            else:
+                container = _combine(first, second, operation)
+            if container is not None:
+                result._containers[key] = container
+        result._len = sum(
+            sum(_POPCOUNT[byte] for byte in container) if isinstance(container, bytearray)
+            else len(container)
+            for container in result._containers.values()
+        )
+        return result
+
+    def union(self, other: 'IdSet') -> 'IdSet':
+        """Get the IDs in either set."""
+        return self._combine(other, 'or')
+
+    def intersection(self, other: 'IdSet') -> 'IdSet':
+        """Get the IDs in both sets."""
+        return self._combine(other, 'and')
+
+    def difference(self, other: 'IdSet') -> 'IdSet':
+        """Get the IDs in this set but not in the other."""
+        return self._combine(other, 'sub')
+
+    def _replace(self, other: 'IdSet') -> 'IdSet':
+        """Take the content of another set, for the in-place operators."""
+        with self._lock:
+            self._containers, self._len = other._containers, other._len  # pylint: disable=protected-access
+        return self
+
+    def __or__(self, other: 'IdSet') -> 'IdSet':
+        return self.union(other)
+
+    def __and__(self, other: 'IdSet') -> 'IdSet':
+        return self.intersection(other)
+
+    def __sub__(self, other: 'IdSet') -> 'IdSet':
+        return self.difference(other)
+
+    def __ior__(self, other: 'IdSet') -> 'IdSet':
+        return self._replace(self.union(other))
+
+    def __iand__(self, other: 'IdSet') -> 'IdSet':
+        return self._replace(self.intersection(other))
+
+    def __isub__(self, other: 'IdSet') -> 'IdSet':
+        return self._replace(self.difference(other))
+
+    def __getstate__(self) -> bytes:
+        return self.to_bytes()
+
+    def __setstate__(self, state: bytes):
+        self.__dict__.update(IdSet.from_bytes(state).__dict__)
+
+    def write(self, file: BinaryIO):
+        """Write the set to a binary file.
+
+        Each container is written as a bitmap if it holds more than 4096 IDs, otherwise as its
+        sorted array, so the number of IDs of a container tells how it is stored.
+
+        """
+        with self._lock:
+            containers = [(key, _shrink(container[:]))
+                          for key, container in sorted(self._containers.items())]
+        containers = [(key, container) for key, container in containers if container is not None]
+        file.write(_HEADER.pack(_MAGIC, len(containers)))
+        for key, container in containers:
+            if isinstance(container, bytearray):
+                file.write(_CONTAINER.pack(key, sum(_POPCOUNT[byte] for byte in container)))
+                file.write(container)
+            else:
+                file.write(_CONTAINER.pack(key, len(container)))
+                if sys.byteorder == 'big':
+                    container.byteswap()
+                container.tofile(file)
+
+    @classmethod
+    def read(cls, file: BinaryIO) -> 'IdSet':
+        """Read a set written by IdSet.write.
+
+        Raises:
+            ValueError: The file does not hold an IdSet.
+
+        """
+        # pylint: disable=protected-access
+        magic, count = _HEADER.unpack(file.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError('Not an IdSet file.')
+        result = cls()
+        for _ in range(count):
+            key, size = _CONTAINER.unpack(file.read(_CONTAINER.size))
+            if size > _ARRAY_MAX:
+                result._containers[key] = bytearray(file.read(_BITMAP_BYTES))
+            else:
+                container = array('H')
+                container.frombytes(file.read(2 * size))
+                if sys.byteorder == 'big':
+                    container.byteswap()
+                result._containers[key] = container
+            result._len += size
+        return result
+
+    def to_bytes(self) -> bytes:
+        """Serialize the set."""
+        buffer = io.BytesIO()
+        self.write(buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'IdSet':
+        """Deserialize a set serialized by IdSet.to_bytes."""
+        return cls.read(io.BytesIO(data))
+
+    def save(self, path: str):
+        """Write the set to a file, atomically replacing it."""
+        with open(path + '.tmp', 'wb') as file:
+            self.write(file)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path: str) -> 'IdSet':
+        """Read a set from a file written by IdSet.save."""
+        with open(path, 'rb') as file:
+            return cls.read(file)
+
+
+def dedup(items: Iterable[Any], seen: Optional[IdSet] = None,
+          key: Union[str, Callable[[Any], int]] = 'id') -> Iterator[Any]:
+    """Filter out items whose ID has already been seen, i.e. across API generators.
+
+    Args:
+        items: The items, i.e. an API generator of illustrations or users.
+        seen: The IDs already seen, updated with the ID of every item.  A new set by default; pass
+            the same set to several calls to dedup across them.
+        key: Key of the ID in each item, or a function getting the ID of an item.
+
+    Yields:
+        The next item whose ID had not been seen.
+
+    """
+    seen = IdSet() if seen is None else seen
+    get_id = key if callable(key) else lambda item: item[key]
+    for item in items:
+        if seen.add(get_id(item)):
+            yield item
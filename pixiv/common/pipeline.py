@@ -0,0 +1,372 @@
+"""Multi-stage pipelines over API generators.
+
+A Pipeline reads a source (i.e. an API generator) on its own thread and passes every item through
+a chain of stages.  Each stage runs on its own pool of threads and reads its input from a bounded
+queue, so a slow stage makes the stages before it block instead of buffering everything in
+memory.  Stages with more than one worker process their items out of order.
+
+Each stage keeps metrics (items processed, errors, time busy, input queue depth), readable from
+any thread while the pipeline runs: the bottleneck is the stage with the highest utilization and a
+full input queue, and is scaled by giving it more workers.
+
+Example:
+    >>> pipeline = (
+    ...     Pipeline(api.get_bookmarks(token, user_id))
+    ...     .filter(lambda illust: illust['total_bookmarks'] > 100)
+    ...     .map(fetch_user, workers=4, name='enrich')
+    ...     .map(download, workers=16, name='download')
+    ...     .sink(store.put)
+    ... )
+    >>> pipeline.run()
+    >>> for metrics in pipeline.metrics():
+    ...     print(metrics.name, metrics.throughput, metrics.utilization, metrics.queue_depth)
+
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+# Marks the end of the items in a queue.
+_DONE = object()
+
+
+class ON_ERROR:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods,invalid-name
+    """Options for what a stage does when its function raises an exception."""
+
+    RAISE = 'raise'     # Cancel the pipeline and raise the exception from run (or iteration).
+    SKIP = 'skip'       # Count the error and drop the item.
+
+
+class PipelineCancelled(Exception):
+    """Raised by run when the pipeline was cancelled before it finished."""
+
+
+class StageMetrics:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
+    """Snapshot of the metrics of a stage.
+
+    Attributes:
+        name: Name of the stage.
+        workers: Number of worker threads.
+        processed: Number of items processed (read from the source, for the source).
+        errors: Number of items whose function raised an exception.
+        busy: Total seconds spent in the stage's function, summed over its workers.
+        queue_depth: Number of items waiting in the input queue, None for the source.
+        queue_size: Capacity of the input queue, None for the source.
+        elapsed: Seconds since the pipeline started.
+
+    """
+
+    __slots__ = ['name', 'workers', 'processed', 'errors', 'busy', 'queue_depth', 'queue_size',
+                 'elapsed']
+    def __init__(self, name: str, workers: int, processed: int, errors: int, busy: float,
+                 queue_depth: Optional[int], queue_size: Optional[int], elapsed: float):
+        """Init StageMetrics with the counters of a stage."""
+        self.name = name
+        self.workers = workers
+        self.processed = processed
+        self.errors = errors
+        self.busy = busy
+        self.queue_depth = queue_depth
+        self.queue_size = queue_size
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self) -> float:
+        """Items processed per second."""
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def utilization(self) -> float:
+        """Share of the time the workers of the stage were busy, from 0 to 1."""
+        return min(1.0, self.busy / (self.elapsed * self.workers)) if self.elapsed else 0.0
+
+    def __repr__(self) -> str:
+        return (f'<StageMetrics {self.name}: {self.processed} items, {self.errors} errors, '
+                f'{self.throughput:.1f}/s, {self.utilization:.0%} busy, '
+                f'queue {self.queue_depth}/{self.queue_size}>')
+
+
+class _Stage:
+    """A stage of a pipeline and its counters."""
+
+    def __init__(self, name: str, function: Optional[Callable[[Any], Iterable[Any]]],
+                 workers: int, queue_size: Optional[int], on_error: str):
+        """Init _Stage with a function mapping an item to the items to pass on."""
+        if on_error not in (ON_ERROR.RAISE, ON_ERROR.SKIP):
+            raise ValueError(f"Unknown error option '{on_error}'.")
+        if workers < 1:
+            raise ValueError(f"Stage '{name}' needs at least one worker, got {workers}.")
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.on_error = on_error
+        self.input = None if queue_size is None else queue.Queue(maxsize=queue_size)
+        self.queue_size = queue_size
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.running = workers
+        self.lock = threading.Lock()
+
+
+class Pipeline:
+    """Chain of concurrent stages fed by a source iterator.
+
+    Stages are added with filter, map, flat_map and sink, each returning the pipeline.  A pipeline
+    ending with a sink is run with run; otherwise the output of its last stage is iterated over.
+    A pipeline can only be run once.
+
+    Attributes:
+        queue_size: Default capacity of the input queue of each stage.
+
+    """
+
+    def __init__(self, source: Iterable[Any], name: str = 'source', queue_size: int = 100):
+        """Init Pipeline with its source, i.e. an API generator."""
+        self.queue_size = queue_size
+        self._source = source
+        self._stages = [_Stage(name, None, 1, None, ON_ERROR.RAISE)]
+        self._output = None
+        self._stop = threading.Event()
+        self._error = None
+        self._started = None
+        self._finished = None
+        self._threads: List[threading.Thread] = []
+
+    def _add(self, name: Optional[str], function: Callable[[Any], Iterable[Any]], workers: int,
+             queue_size: Optional[int], on_error: str) -> 'Pipeline':
+        """Add a stage after the last one."""
+        if self._output is not None:
+            raise RuntimeError('Stages cannot be added after a sink or once the pipeline started.')
+        queue_size = self.queue_size if queue_size is None else queue_size
+        self._stages.append(_Stage(name, function, workers, queue_size, on_error))
+        return self
+
+    def filter(self, predicate: Callable[[Any], bool], workers: int = 1,
+               name: Optional[str] = None, queue_size: Optional[int] = None,
+               on_error: str = ON_ERROR.RAISE) -> 'Pipeline':
+        """Add a stage passing on the items for which a predicate is true."""
+        return self._add(name or f'filter-{len(self._stages)}',
+                         lambda item: (item,) if predicate(item) else (),
+                         workers, queue_size, on_error)
+
+    def map(self, function: Callable[[Any], Any], workers: int = 1, name: Optional[str] = None,
+            queue_size: Optional[int] = None, on_error: str = ON_ERROR.RAISE) -> 'Pipeline':
+        """Add a stage passing on the result of a function for each item (i.e. a download)."""
+        return self._add(name or f'map-{len(self._stages)}', lambda item: (function(item),),
+                         workers, queue_size, on_error)
+
+    def flat_map(self, function: Callable[[Any], Iterable[Any]], workers: int = 1,
+                 name: Optional[str] = None, queue_size: Optional[int] = None,
+                 on_error: str = ON_ERROR.RAISE) -> 'Pipeline':
+        """Add a stage passing on every item returned by a function for each item.
+
+        i.e. flat_map(lambda user: api.get_bookmarks(token, user['id'])) turns a stream of users
+        into the stream of their bookmarks.
+
+        """
+        return self._add(name or f'flat_map-{len(self._stages)}', function, workers, queue_size,
+                         on_error)
+
+    def sink(self, function: Callable[[Any], Any], workers: int = 1, name: Optional[str] = None,
+             queue_size: Optional[int] = None, on_error: str = ON_ERROR.RAISE) -> 'Pipeline':
+        """Add a final stage consuming each item (i.e. storing it), ending the pipeline."""
+        def consume(item):
+            function(item)
+            return ()
+        self._add(name or f'sink-{len(self._stages)}', consume, workers, queue_size, on_error)
+        self._output = False
+        return self
+
+    def _put(self, target: queue.Queue, item: Any) -> bool:
+        """Put an item in a queue, blocking while it is full, False once cancelled."""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: queue.Queue) -> Any:
+        """Get an item from a queue, blocking while it is empty, _DONE once cancelled."""
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, error: BaseException):
+        """Keep the first exception and cancel the pipeline."""
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _run_source(self, stage: _Stage, output: queue.Queue):
+        """Read the source into the first queue."""
+        try:
+            for item in self._source:
+                if not self._put(output, item):
+                    return
+                stage.processed += 1
+            self._put(output, _DONE)
+        except BaseException as ex:  # Ignore Reason: Re-raised by run | pylint: disable=broad-except
+            self._fail(ex)
+        finally:
+            # Close a generator on the thread which ran it, i.e. to release a streamed response.
+            close = getattr(self._source, 'close', None)
+            if close is not None:
+                close()
+
+    def _run_worker(self, stage: _Stage, output: queue.Queue):
+        """Process the items of a stage's input queue until it is done."""
+        while True:
+            item = self._get(stage.input)
+            if item is _DONE:
+                if self._stop.is_set():
+                    return
+                # Let the other workers of the stage see the end of the items too.
+                self._put(stage.input, _DONE)
+                break
+            busy = 0.0
+            try:
+                started = time.perf_counter()
+                results = iter(stage.function(item))
+                while True:
+                    try:
+                        result = next(results)
+                    except StopIteration:
+                        break
+                    busy += time.perf_counter() - started
+                    # Results are passed on as they are produced, i.e. page by page.
+                    if not self._put(output, result):
+                        return
+                    started = time.perf_counter()
+                busy += time.perf_counter() - started
+            except Exception as ex:  # Ignore Reason: Handled per stage | pylint: disable=broad-except
+                with stage.lock:
+                    stage.errors += 1
+                    stage.busy += busy + time.perf_counter() - started
+                if stage.on_error == ON_ERROR.RAISE:
+                    self._fail(ex)
+                    return
+                continue
+            with stage.lock:
+                stage.processed += 1
+                stage.busy += busy
+        with stage.lock:
+            stage.running -= 1
+            last = stage.running == 0
+        if last:
+            stage.input.get_nowait()    # The end marker put back for the other workers.
+            self._put(output, _DONE)
+
+    def start(self) -> 'Pipeline':
+        """Start every stage's threads without waiting for them."""
+        if self._started is not None:
+            raise RuntimeError('A pipeline can only be run once.')
+        if len(self._stages) == 1:
+            raise RuntimeError('A pipeline needs at least one stage.')
+        self._started = time.perf_counter()
+        final = queue.Queue(maxsize=self.queue_size)
+        outputs = [stage.input for stage in self._stages[1:]] + [final]
+        if self._output is None:
+            self._output = final
+        self._threads.append(threading.Thread(
+            target=self._run_source, args=(self._stages[0], outputs[0]),
+            name=f'pipeline-{self._stages[0].name}', daemon=True
+        ))
+        for stage, output in zip(self._stages[1:], outputs[1:]):
+            self._threads.extend(
+                threading.Thread(target=self._run_worker, args=(stage, output),
+                                 name=f'pipeline-{stage.name}-{worker}', daemon=True)
+                for worker in range(stage.workers)
+            )
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait for every stage to finish.
+
+        Returns:
+            Whether every stage finished within the timeout.
+
+        Raises:
+            Exception: The first exception raised by the source, or by a stage set to raise.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                return False
+        self._finished = self._finished or time.perf_counter()
+        if self._error is not None:
+            raise self._error
+        return True
+
+    def run(self) -> List[StageMetrics]:
+        """Run a pipeline ending with a sink until every item has gone through it.
+
+        Returns:
+            The final metrics of each stage.
+
+        Raises:
+            PipelineCancelled: The pipeline was cancelled.
+            Exception: The first exception raised by the source, or by a stage set to raise.
+
+        """
+        if self._output is not False:
+            raise RuntimeError('Only a pipeline ending with a sink can be run, iterate over it.')
+        self.start()
+        try:
+            self.join()
+        except BaseException:
+            self.cancel()
+            raise
+        if self._stop.is_set():
+            raise PipelineCancelled('The pipeline was cancelled before it finished.')
+        return self.metrics()
+
+    def __iter__(self) -> Iterator[Any]:
+        """Run a pipeline not ending with a sink, yielding the output of its last stage.
+
+        Stopping the iteration early cancels the pipeline.
+
+        """
+        if self._output is False:
+            raise RuntimeError('A pipeline ending with a sink cannot be iterated over, run it.')
+        self.start()
+        try:
+            while True:
+                item = self._get(self._output)
+                if item is _DONE:
+                    break
+                yield item
+            self.join()
+            if self._stop.is_set():
+                raise PipelineCancelled('The pipeline was cancelled before it finished.')
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        """Stop every stage as soon as its current item is processed."""
+        self._stop.set()
+
+    def metrics(self) -> List[StageMetrics]:
+        """Get the current metrics of each stage, the source first."""
+        if self._started is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._finished or time.perf_counter()) - self._started
+        return [
+            StageMetrics(
+                stage.name, stage.workers, stage.processed, stage.errors, stage.busy,
+                None if stage.input is None else stage.input.qsize(), stage.queue_size, elapsed
+            )
+            for stage in self._stages
+        ]
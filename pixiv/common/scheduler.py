@@ -0,0 +1,208 @@
+"""Priority and fair-share scheduling of requests.
+
+Without a scheduler every model call is sent as soon as it is made, so when a bulk crawl keeps an
+AccountPool busy, an interactive lookup waits behind every request already queued in the pool.
+With a RequestScheduler set (see set_scheduler), the request decorator first waits for a slot: at
+most 'max_concurrent' requests are in flight (and optionally at most 'rate' are started per
+second), and when a slot frees up it goes to the waiting request that comes first by:
+    1. Priority class (see PRIORITY).  A request loses one class for every 'aging' seconds it has
+        waited, so lower classes are delayed but never starved.
+    2. Weighted fair share between the jobs of the class: the job which has been granted the
+        fewest slots relative to its weight goes first, so a job with thousands of queued requests
+        cannot crowd out another job.
+    3. Arrival order.
+
+The priority class, job and weight of the requests made in a block are set with scheduling.
+
+Example:
+    >>> set_scheduler(RequestScheduler(max_concurrent=8))
+    >>> with scheduling(PRIORITY.BULK, job='backfill'):
+    ...     for user_id in user_ids:
+    ...         store.add_illusts(api.get_bookmarks(pool, user_id))
+    >>> with scheduling(PRIORITY.INTERACTIVE):    # Another thread, served first.
+    ...     related = list(api.get_related(pool, illust_id))
+
+"""
+
+import contextlib
+import itertools
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Hashable, Iterator, List, Optional
+
+
+class PRIORITY:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods,invalid-name
+    """Priority classes of requests, the lowest value served first."""
+
+    INTERACTIVE = 0     # Latency sensitive, i.e. a single lookup for a user.
+    NORMAL = 1
+    BULK = 2            # Throughput oriented, i.e. a backfill.
+
+
+_DEFAULT_SCHEDULE = (PRIORITY.NORMAL, None, 1.0)
+
+# (priority, job, weight) of the scheduling block each thread is in.
+_schedule = threading.local()
+
+_scheduler = None
+
+
+def set_scheduler(scheduler: Optional['RequestScheduler']):
+    """Set the scheduler every model call waits on, None to send requests right away."""
+    global _scheduler  # pylint: disable=global-statement
+    _scheduler = scheduler
+
+
+def get_scheduler() -> Optional['RequestScheduler']:
+    """Get the scheduler every model call waits on, None if there is none."""
+    return _scheduler
+
+
+@contextlib.contextmanager
+def scheduling(priority: int = PRIORITY.NORMAL, job: Optional[Hashable] = None,
+               weight: float = 1.0):
+    """Set the priority class, job and weight of the requests made in the block.
+
+    Args:
+        priority: Priority class option.
+        job: Any hashable naming the job the requests belong to, for fair sharing.  Requests
+            outside of a job share the None job.
+        weight: Share of the slots of the job relative to the other jobs of its class.
+
+    """
+    previous = getattr(_schedule, 'current', _DEFAULT_SCHEDULE)
+    _schedule.current = (priority, job, weight)
+    try:
+        yield
+    finally:
+        _schedule.current = previous
+
+
+class _Waiter:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
+    """A request waiting for a slot."""
+
+    __slots__ = ['priority', 'job', 'weight', 'enqueued', 'sequence', 'event']
+    def __init__(self, priority: int, job: Hashable, weight: float, sequence: int):
+        self.priority = priority
+        self.job = job
+        self.weight = weight
+        self.enqueued = time.monotonic()
+        self.sequence = sequence
+        self.event = threading.Event()
+
+
+class RequestScheduler:
+    """Grant request slots by priority class and weighted fair share between jobs.
+
+    Attributes:
+        max_concurrent: Maximum number of requests in flight.
+        rate: Optional maximum number of requests started per second.
+        aging: Seconds of waiting after which a request moves up one priority class.
+        granted: Number of slots granted to each job.
+
+    """
+
+    def __init__(self, max_concurrent: int = 4, rate: Optional[float] = None,
+                 aging: float = 10.0):
+        """Init RequestScheduler with its concurrency and rate limits."""
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.aging = aging
+        self.granted: Counter = Counter()
+        self._lock = threading.Lock()
+        self._waiting: List[_Waiter] = []
+        self._in_flight = 0
+        self._next_start = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._sequence = itertools.count()
+        # Slots granted to each job divided by its weight, and the value of the last grant.
+        self._virtual: Dict[Hashable, float] = {}
+        self._clock = 0.0
+
+    @property
+    def in_flight(self) -> int:
+        """Number of requests holding a slot."""
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        """Number of requests waiting for a slot."""
+        return len(self._waiting)
+
+    def _key(self, waiter: _Waiter, now: float) -> Any:
+        """Sort key of a waiting request, the smallest served first."""
+        aged = int((now - waiter.enqueued) / self.aging) if self.aging else 0
+        return (waiter.priority - aged, self._virtual[waiter.job], waiter.sequence)
+
+    def _dispatch(self):
+        """Grant free slots to the first waiting requests.
+
+        If the rate limit holds back a free slot, a timer dispatches again once it allows the next
+        start, since no request may be acquired or released until then.
+
+        """
+        while self._waiting and self._in_flight < self.max_concurrent:
+            now = time.monotonic()
+            if self.rate and now < self._next_start:
+                if self._timer is None:
+                    self._timer = threading.Timer(self._next_start - now, self._on_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            waiter = min(self._waiting, key=lambda waiter: self._key(waiter, now))
+            self._waiting.remove(waiter)
+            self._in_flight += 1
+            self._clock = self._virtual[waiter.job]
+            self._virtual[waiter.job] += 1 / waiter.weight
+            self.granted[waiter.job] += 1
+            if self.rate:
+                self._next_start = max(self._next_start, now) + 1 / self.rate
+            waiter.event.set()
+
+    def _on_timer(self):
+        """Dispatch once the rate limit allows the next start."""
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def acquire(self, priority: Optional[int] = None, job: Optional[Hashable] = None,
+                weight: Optional[float] = None):
+        """Wait for a slot.  Defaults to the priority, job and weight set by scheduling."""
+        default_priority, default_job, default_weight = \
+            getattr(_schedule, 'current', _DEFAULT_SCHEDULE)
+        priority = default_priority if priority is None else priority
+        job = default_job if job is None else job
+        weight = default_weight if weight is None else weight
+        with self._lock:
+            waiter = _Waiter(priority, job, weight, next(self._sequence))
+            # A job that was idle starts from the current virtual time rather than catching up.
+            self._virtual[job] = max(self._virtual.get(job, 0.0), self._clock)
+            self._waiting.append(waiter)
+            self._dispatch()
+        try:
+            waiter.event.wait()
+        except BaseException:
+            with self._lock:
+                if waiter in self._waiting:
+                    self._waiting.remove(waiter)
+                    waiter = None
+            if waiter is not None:
+                self.release()
+            raise
+
+    def release(self):
+        """Free a slot once its request completed."""
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    @contextlib.contextmanager
+    def slot(self, priority: Optional[int] = None, job: Optional[Hashable] = None,
+             weight: Optional[float] = None) -> Iterator[None]:
+        """Hold a slot for the duration of the block (see acquire)."""
+        self.acquire(priority, job, weight)
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,222 @@
+"""Incremental parsing of streamed JSON responses.
+
+A response is normally downloaded in full and decoded before the first item of its list is used.
+In streaming mode the body is read in chunks as it arrives, and each element of the list key (i.e.
+'illusts') is decoded and handed over as soon as its closing bracket is received.  The other keys
+of the response, such as 'next_url', are decoded once the body is complete.
+
+Only the top level object and the list key's array are scanned here; each element is cut out of the
+body as raw bytes and decoded with the decoder set in the decoder module, so at most one element
+and one chunk of the body are held in memory at a time.
+
+Example:
+    >>> with streaming('illusts'):
+    ...     page = models.get_rankings(...)    # A StreamedResponse, not the decoded JSON.
+    >>> for illust in page:
+    ...
+    >>> page.rest['next_url']
+
+"""
+
+import contextlib
+import re
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+
+from pixiv.common import decoder, timeouts
+from pixiv.common.exceptions import DataNotFound
+
+# Characters with a meaning in JSON outside of a string, and inside of a string.
+_STRUCTURE = re.compile(rb'["{}\[\],:]')
+_STRING = re.compile(rb'["\\]')
+
+_CHUNK_SIZE = 16 * 1024
+
+# List key of the streaming block each thread is in.
+_streaming = threading.local()
+
+
+@contextlib.contextmanager
+def streaming(list_key: str):
+    """Make every model call in the block stream its response, parsing the list under list_key."""
+    previous = getattr(_streaming, 'list_key', None)
+    _streaming.list_key = list_key
+    try:
+        yield
+    finally:
+        _streaming.list_key = previous
+
+
+def streamed_list_key() -> Optional[str]:
+    """Get the list key of the enclosing streaming block, None outside of one."""
+    return getattr(_streaming, 'list_key', None)
+
+
+class ListStreamParser:
+    """Split a JSON object into the elements of one of its lists, fed a chunk at a time.
+
+    Attributes:
+        list_key: Key of the list whose elements are split out.
+        rest: The raw bytes of every other top level key, complete once the object is closed.  The
+            list key is mapped to b'[]' if it was found and holds a list.
+        done: Whether the closing bracket of the object has been received.
+
+    """
+
+    def __init__(self, list_key: str):
+        """Init ListStreamParser with the key of the list to split."""
+        self.list_key = list_key.encode('utf-8')
+        self.rest: Dict[str, bytes] = {}
+        self.done = False
+        self._buffer = bytearray()
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start = 0
+        self._key = None
+        self._value_start = None
+        self._element_start = None
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """Add the next chunk of the body.
+
+        Returns:
+            The raw bytes of each element of the list completed by the chunk.
+
+        Raises:
+            DataNotFound: The body is not a JSON object.
+
+        """
+        self._buffer += chunk
+        elements = []
+        buffer = self._buffer
+        while not self.done:
+            if self._in_string:
+                match = _STRING.search(buffer, self._pos)
+                if match is None:
+                    break
+                if buffer[match.start()] == 0x5C:   # Backslash, skip the escaped character.
+                    self._pos = match.start() + 2
+                    continue
+                self._pos = match.end()
+                self._in_string = False
+                if self._depth == 1 and self._value_start is None:
+                    self._key = bytes(buffer[self._string_start + 1:match.start()])
+                continue
+
+            match = _STRUCTURE.search(buffer, self._pos)
+            if match is None:
+                break
+            position = match.start()
+            char = buffer[position:position + 1]
+            self._pos = position + 1
+
+            if self._depth == 0:
+                if char != b'{' or buffer[:position].strip():
+                    raise DataNotFound('The streamed JSON response is not an object.')
+                self._depth = 1
+            elif char == b'"':
+                self._in_string = True
+                self._string_start = position
+            elif char == b':':
+                if self._depth == 1:
+                    self._value_start = self._pos
+            elif char in b'{[':
+                if self._depth == 1 and char == b'[' and self._key == self.list_key and \
+                        not buffer[self._value_start:position].strip():
+                    self.rest[self._key.decode('utf-8')] = b'[]'
+                    self._value_start = None
+                    self._element_start = self._pos
+                self._depth += 1
+            elif self._element_start is not None and self._depth == 2:
+                # ',' or ']' ending an element of the list.
+                element = bytes(buffer[self._element_start:position]).strip()
+                if element:
+                    elements.append(element)
+                if char == b',':
+                    self._element_start = self._pos
+                else:
+                    self._element_start = None
+                    self._depth = 1
+            elif char in b'}]':
+                if self._depth == 1:
+                    self._end_value(position)
+                    self.done = True
+                self._depth -= 1
+            elif char == b',' and self._depth == 1:
+                self._end_value(position)
+        self._compact()
+        return elements
+
+    def _end_value(self, position: int):
+        """Keep the raw bytes of the top level value ending at position."""
+        if self._value_start is not None:
+            self.rest[self._key.decode('utf-8')] = bytes(self._buffer[self._value_start:position])
+            self._value_start = None
+
+    def _compact(self):
+        """Drop the part of the buffer that has been fully parsed."""
+        starts = [self._pos]
+        for start in (self._element_start, self._value_start):
+            if start is not None:
+                starts.append(start)
+        if self._in_string:
+            starts.append(self._string_start)
+        cut = min(starts)
+        if cut <= 0:
+            return
+        del self._buffer[:cut]
+        self._pos -= cut
+        self._string_start -= cut
+        if self._element_start is not None:
+            self._element_start -= cut
+        if self._value_start is not None:
+            self._value_start -= cut
+
+
+class StreamedResponse:
+    """Response whose list is parsed while its body is downloaded.
+
+    Iterating over the response yields each decoded element of the list as it arrives.  The other
+    top level keys are available from 'rest' once the iteration is complete.  If the request was
+    made under a deadline (see the timeouts module), the iteration raises DeadlineExceeded once it
+    has passed, and it raises RequestTimeout if the body stalls for longer than the read timeout.
+
+    Attributes:
+        list_key: Key of the list whose elements are yielded.
+        rest: The other top level keys of the response, decoded.  Maps the list key to an empty list
+            if the list was found.  Empty until the iteration is complete.
+
+    """
+
+    def __init__(self, response: Any, list_key: str, chunk_size: int = _CHUNK_SIZE):
+        """Init StreamedResponse with a requests.Response made with stream=True."""
+        self.list_key = list_key
+        self.rest: Dict[str, Any] = {}
+        self._response = response
+        self._chunk_size = chunk_size
+        self._consumed = False
+        # The body may be read outside of the deadline_at block the request was made in.
+        self._expires = timeouts.current_deadline()
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._consumed:
+            raise RuntimeError('A streamed response can only be iterated over once.')
+        self._consumed = True
+        parser = ListStreamParser(self.list_key)
+        try:
+            for chunk in self._response.iter_content(self._chunk_size):
+                timeouts.remaining(self._expires)
+                for element in parser.feed(chunk):
+                    yield decoder.decode(element)
+        except requests.RequestException as ex:
+            timeouts.raise_if_timeout(
+                ex, self._expires, 'Timed out while reading the body of the response.')
+            raise
+        finally:
+            self._response.close()
+        if not parser.done:
+            raise DataNotFound('The streamed JSON response ended before it was complete.')
+        self.rest = {key: decoder.decode(value) for key, value in parser.rest.items()}
@@ -0,0 +1,124 @@
+"""Request timeouts and deadlines.
+
+Every model call is sent with a connect timeout and a read timeout (see set_timeout), so a
+stalled connection raises RequestTimeout instead of blocking its thread forever.
+
+A deadline bounds the total time of every model call made in a block, including retries, token
+renewals and the pages of an API function (see the deadline argument of the API functions).  Each
+request is sent with its timeouts shortened to the time left, and once the deadline has passed
+no more requests are sent and DeadlineExceeded is raised.  Waiting for a token or scheduler slot
+is not interrupted, but a request is not sent past the deadline.
+
+Example:
+    >>> set_timeout(connect=3.05, read=20)
+    >>> with deadline_after(5):
+    ...     json = models.get_rankings(...)
+
+"""
+
+import contextlib
+import threading
+import time
+from typing import Optional, Tuple
+
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from pixiv.common.exceptions import DeadlineExceeded, RequestTimeout
+
+# (connect, read) timeouts in seconds.
+DEFAULT_TIMEOUT = (10.0, 60.0)
+
+_timeout = DEFAULT_TIMEOUT
+
+# Deadline of the deadline_at block each thread is in.
+_deadline = threading.local()
+
+
+def set_timeout(connect: Optional[float] = None, read: Optional[float] = None):
+    """Set the connect and read timeouts of every model call, None to restore a default."""
+    global _timeout  # pylint: disable=global-statement
+    _timeout = (
+        DEFAULT_TIMEOUT[0] if connect is None else connect,
+        DEFAULT_TIMEOUT[1] if read is None else read
+    )
+
+
+def get_timeout() -> Tuple[float, float]:
+    """Get the (connect, read) timeouts of every model call."""
+    return _timeout
+
+
+@contextlib.contextmanager
+def deadline_at(expires: Optional[float]):
+    """Bound the model calls made in the block by a time.monotonic() deadline, None for none.
+
+    A deadline already set by an enclosing block is kept if it is earlier.
+
+    """
+    current = getattr(_deadline, 'expires', None)
+    if expires is None or (current is not None and current <= expires):
+        expires = current
+    _deadline.expires = expires
+    try:
+        yield
+    finally:
+        _deadline.expires = current
+
+
+def deadline_after(seconds: float):
+    """Bound the model calls made in the block to a number of seconds from now."""
+    return deadline_at(time.monotonic() + seconds)
+
+
+def current_deadline() -> Optional[float]:
+    """Get the time.monotonic() deadline of the enclosing block, None outside of one."""
+    return getattr(_deadline, 'expires', None)
+
+
+def remaining(expires: Optional[float]) -> Optional[float]:
+    """Get the seconds left until a deadline, None for no deadline.
+
+    Raises:
+        DeadlineExceeded: The deadline has passed.
+
+    """
+    if expires is None:
+        return None
+    left = expires - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded('The deadline of the request was exceeded.')
+    return left
+
+
+def raise_if_timeout(error: requests.RequestException, expires: Optional[float], message: str):
+    """Raise an error of requests as RequestTimeout if it was caused by a timeout.
+
+    A read timeout while the body is downloaded, either by Session.send or by iter_content, is
+    raised by requests as a ConnectionError wrapping urllib3's ReadTimeoutError rather than as a
+    requests.Timeout.  Returns if the error was not caused by a timeout.
+
+    Raises:
+        RequestTimeout: The error was caused by a timeout.
+        DeadlineExceeded: The error was caused by a timeout shortened by a deadline, which passed.
+
+    """
+    if isinstance(error, requests.Timeout) or (
+            isinstance(error, requests.ConnectionError) and
+            any(isinstance(arg, ReadTimeoutError) for arg in error.args)):
+        remaining(expires)
+        raise RequestTimeout(message) from error
+
+
+def request_timeout() -> Tuple[float, float]:
+    """Get the (connect, read) timeouts of a request, shortened to the time left until the deadline.
+
+    Raises:
+        DeadlineExceeded: The deadline has passed.
+
+    """
+    connect, read = _timeout
+    left = remaining(current_deadline())
+    if left is None:
+        return connect, read
+    return min(connect, left), min(read, left)
@@ -1,8 +1,170 @@
-"""Validation for API JSON response data."""
+"""Validation for API JSON response data.
 
-from typing import Dict, Any
+Each endpoint declares the schema of its response, which is compiled once into a validator.  A
+schema is built from:
+    A type, or a tuple of types: The value must be an instance of one of them ('object' accepts
+        any value).
+    A dictionary: The value must be a dictionary holding every key of the schema, each value
+        matching the schema it is mapped to.
+    A list holding a single schema: The value must be a list, each item matching the schema.
+    optional(schema): The key may be missing or mapped to None.
 
-from pixiv.common.exceptions import DataNotFound
+Example:
+    >>> PAGE = Schema({'illusts': [{'id': int, 'title': str}], 'next_url': optional(str)})
+    >>> PAGE(res_json)
+
+How much of a response is validated is set for all schemas with set_mode (see SCHEMA_MODE).
+
+"""
+
+from typing import Dict, Any, Callable, Tuple
+
+from pixiv.common.exceptions import SchemaMismatch
+
+
+class SCHEMA_MODE:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods,invalid-name
+    """Options for how much of each response is validated."""
+
+    STRICT = 'strict'       # Validate the whole schema, including every item of each list.
+    LENIENT = 'lenient'     # Validate the whole schema, except for the items of lists.
+    OFF = 'off'             # Do not validate responses.
+
+
+_mode = SCHEMA_MODE.LENIENT
+
+
+def set_mode(mode: str):
+    """Set how much of each response is validated, one of the SCHEMA_MODE options."""
+    global _mode  # pylint: disable=global-statement
+    if mode not in (SCHEMA_MODE.STRICT, SCHEMA_MODE.LENIENT, SCHEMA_MODE.OFF):
+        raise ValueError(f"Unknown schema mode '{mode}'.")
+    _mode = mode
+
+
+def get_mode() -> str:
+    """Get how much of each response is validated."""
+    return _mode
+
+
+class _Optional:    # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods
+    """Schema of a key which may be missing or mapped to None."""
+
+    __slots__ = ['schema']
+    def __init__(self, schema: Any):
+        self.schema = schema
+
+
+def optional(schema: Any) -> _Optional:
+    """Mark the schema of a key as optional: the key may be missing or mapped to None."""
+    return _Optional(schema)
+
+
+def _accept(value: Any, response: Any):
+    """Accept any value."""
+
+
+def _compile(schema: Any, strict: bool, path: str) -> Callable[[Any, Any], None]:
+    """Compile a schema into a function validating a value within a response.
+
+    Args:
+        schema: The schema of the value.
+        strict: Whether the items of lists are validated.
+        path: Path of the value in the response, used in error messages.
+
+    Returns:
+        Function called as check(value, response), raising SchemaMismatch if the value does not
+        match the schema.
+
+    """
+    if isinstance(schema, _Optional):
+        check_value = _compile(schema.schema, strict, path)
+        if check_value is _accept:
+            return _accept
+        def check_optional(value, response):
+            if value is not None:
+                check_value(value, response)
+        return check_optional
+
+    if isinstance(schema, dict):
+        keys: Tuple[Tuple[str, bool, Callable], ...] = tuple(
+            (key, isinstance(value_schema, _Optional),
+             _compile(value_schema, strict, f'{path}.{key}' if path else key))
+            for key, value_schema in schema.items()
+        )
+        def check_dict(value, response):
+            if not isinstance(value, dict):
+                raise SchemaMismatch(path or '<response>', dict, value, response)
+            for key, is_optional, check_key in keys:
+                if key in value:
+                    check_key(value[key], response)
+                elif not is_optional:
+                    raise SchemaMismatch(f'{path}.{key}' if path else key, None, None, response)
+        return check_dict
+
+    if isinstance(schema, list):
+        (item_schema,) = schema
+        check_item = _compile(item_schema, strict, f'{path}[]')
+        check_items = strict and check_item is not _accept
+        def check_list(value, response):
+            if not isinstance(value, list):
+                raise SchemaMismatch(path or '<response>', list, value, response)
+            if check_items:
+                for item in value:
+                    check_item(item, response)
+        return check_list
+
+    types = schema if isinstance(schema, tuple) else (schema,)
+    if object in types:
+        return _accept
+    def check_type(value, response):
+        if not isinstance(value, types):
+            raise SchemaMismatch(path or '<response>', schema, value, response)
+    return check_type
+
+
+class Schema:
+    """Schema of a response, compiled into a validator for each mode.
+
+    Calling the schema with a response validates it according to the current mode.
+
+    """
+
+    def __init__(self, schema: Any):
+        """Init Schema by compiling the schema for the strict and lenient modes."""
+        self.schema = schema
+        self._validators = {
+            SCHEMA_MODE.STRICT: _compile(schema, True, ''),
+            SCHEMA_MODE.LENIENT: _compile(schema, False, '')
+        }
+        self._items: Dict[str, Callable[[Any, Any], None]] = {}
+
+    def __call__(self, response: Any):
+        """Validate a response.
+
+        Raises:
+            SchemaMismatch: The response does not match the schema.
+
+        """
+        if _mode != SCHEMA_MODE.OFF:
+            self._validators[_mode](response, response)
+
+    def validate_item(self, key: str, item: Any):
+        """Validate a single item of the list under a key, i.e. a streamed item.
+
+        Items are only validated in strict mode, like the items of a list in a whole response.
+
+        Raises:
+            SchemaMismatch: The item does not match the schema of the list's items.
+
+        """
+        if _mode != SCHEMA_MODE.STRICT:
+            return
+        if key not in self._items:
+            list_schema = self.schema[key]
+            if isinstance(list_schema, _Optional):
+                list_schema = list_schema.schema
+            self._items[key] = _compile(list_schema[0], True, f'{key}[]')
+        self._items[key](item, item)
 
 
 def response_contains_key(res_json: Dict[str, Any], key: str):
@@ -17,10 +179,7 @@ def response_contains_key(res_json: Dict[str, Any], key: str):
 
     """
     if key not in res_json.keys():
-        raise DataNotFound(
-            f"Could not find key '{key}' in the JSON response.\n"+
-            f"Got Keys: {res_json.keys()}"
-        )
+        raise SchemaMismatch(key, None, None, res_json)
 
 
 def response_key_mapping(res_json: Dict[str, Any], key: str, _type: type):
@@ -39,8 +198,4 @@ def response_key_mapping(res_json: Dict[str, Any], key: str, _type: type):
 
     """
     if _type != type(res_json[key]):
-        raise DataNotFound(
-            f"Failed to find the expected type for key '{key}.'\n"+
-            f"Expected type: {_type} | Got type: {type(res_json[key])}.\n"+
-            f"Full response: {res_json}"
-        )
+        raise SchemaMismatch(key, _type, res_json[key], res_json)
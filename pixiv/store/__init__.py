@@ -0,0 +1,15 @@
+"""python-pixiv storage package initialization."""
+
+from .sqlite import (
+    SqliteStore
+)
+
+from .archive import (
+    ArchiveWriter,
+    ArchiveReader
+)
+
+from .export import (
+    JsonlExporter,
+    COMPRESSION
+)
@@ -0,0 +1,259 @@
+"""Compact, memory-mapped archive of illustrations.
+
+An archive is made of two files.  The data file holds packed, append-only illustration records;
+each record is a fixed size header of numeric fields followed by the UTF-8 title and the full JSON
+of the illustration.  The index file ('<path>.idx') is a hash table mapping each illustration ID to
+the offset of its newest record, written when the ArchiveWriter is closed.
+
+ArchiveReader memory-maps both files, so opening an archive does not read it and finding a record
+by ID takes a constant number of probes into the index, independent of the size of the archive.
+The numeric fields of a record are unpacked straight from the mapped file and the JSON is exposed
+as a memoryview, so nothing is copied until it is used.
+
+Example:
+    >>> with ArchiveWriter('illusts.pxa') as writer:
+    ...     writer.write_all(api.get_rankings(token))
+    >>> archive = ArchiveReader('illusts.pxa')
+    >>> archive[73458694].total_bookmarks
+
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from pixiv.common.dates import create_time
+
+_DATA_MAGIC = b'PXARC001'
+_INDEX_MAGIC = b'PXIDX001'
+
+# id, user_id, create_time, total_view, total_bookmarks, width, height, page_count, x_restrict,
+# sanity_level, title length, JSON length
+_RECORD = struct.Struct('<QQqIIIIHBBII')
+# magic, number of records, number of slots
+_INDEX_HEADER = struct.Struct('<8sQQ')
+# illust ID (0 for an empty slot), record offset
+_SLOT = struct.Struct('<QQ')
+
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK_64 = (1 << 64) - 1
+
+
+def _slot_of(illust_id: int, mask: int) -> int:
+    """Hash an illustration ID to its first slot in the index."""
+    return ((illust_id * _HASH_MULTIPLIER) & _MASK_64) >> 32 & mask
+
+
+class ArchiveRecord:
+    """View of a single record in a memory-mapped archive.
+
+    Numeric fields are unpacked from the archive on access; nothing is copied when the record is
+    looked up.
+
+    """
+
+    __slots__ = ['_buffer', '_offset', '_fields']
+    def __init__(self, buffer: Any, offset: int):
+        """Init ArchiveRecord with the mapped data file and the offset of the record."""
+        self._buffer = buffer
+        self._offset = offset
+        self._fields = _RECORD.unpack_from(buffer, offset)
+
+    id = property(lambda self: self._fields[0])
+    user_id = property(lambda self: self._fields[1])
+    create_time = property(lambda self: self._fields[2])
+    total_view = property(lambda self: self._fields[3])
+    total_bookmarks = property(lambda self: self._fields[4])
+    width = property(lambda self: self._fields[5])
+    height = property(lambda self: self._fields[6])
+    page_count = property(lambda self: self._fields[7])
+    x_restrict = property(lambda self: self._fields[8])
+    sanity_level = property(lambda self: self._fields[9])
+
+    @property
+    def title(self) -> str:
+        """The title of the illustration."""
+        start = self._offset + _RECORD.size
+        return str(self._buffer[start:start + self._fields[10]], 'utf-8')
+
+    @property
+    def raw(self) -> memoryview:
+        """The JSON of the illustration as a zero-copy view into the archive."""
+        start = self._offset + _RECORD.size + self._fields[10]
+        return memoryview(self._buffer)[start:start + self._fields[11]]
+
+    def json(self) -> Dict[str, Any]:
+        """Decode the illustration in JSON format."""
+        return json.loads(bytes(self.raw))
+
+
+class ArchiveWriter:
+    """Append illustrations to an archive, creating it if it does not exist.
+
+    Records written for an ID that is already in the archive replace the old record in the index.
+    The index is only written by close, so an archive being written cannot be read until then.
+
+    """
+
+    def __init__(self, path: str):
+        """Init ArchiveWriter with the path of the archive's data file."""
+        self.path = path
+        self._ids = array('Q')
+        self._offsets = array('Q')
+        if os.path.exists(path):
+            with ArchiveReader(path, index=False) as archive:
+                for record in archive:
+                    self._ids.append(record.id)
+                    self._offsets.append(record._offset)  # pylint: disable=protected-access
+            self._file = open(path, 'ab')
+        else:
+            self._file = open(path, 'wb')
+            self._file.write(_DATA_MAGIC)
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, illust: Dict[str, Any]):
+        """Append an illustration in JSON format."""
+        title = (illust.get('title') or '').encode('utf-8')
+        raw = json.dumps(illust, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self._ids.append(illust['id'])
+        self._offsets.append(self._file.tell())
+        self._file.write(_RECORD.pack(
+            illust['id'],
+            illust.get('user', {}).get('id', 0),
+            create_time(illust.get('create_date')),
+            illust.get('total_view', 0),
+            illust.get('total_bookmarks', 0),
+            illust.get('width', 0),
+            illust.get('height', 0),
+            illust.get('page_count', 0),
+            illust.get('x_restrict', 0),
+            illust.get('sanity_level', 0),
+            len(title),
+            len(raw)
+        ))
+        self._file.write(title)
+        self._file.write(raw)
+
+    def write_all(self, illusts: Iterable[Dict[str, Any]]) -> int:
+        """Append every illustration of an iterable, i.e. an API generator.
+
+        Returns:
+            The number of illustrations written.
+
+        """
+        count = 0
+        for illust in illusts:
+            self.write(illust)
+            count += 1
+        return count
+
+    def close(self):
+        """Write the index and close the archive."""
+        if self._file.closed:
+            return
+        self._file.close()
+
+        # Power of two number of slots, at most half of them used
+        slots = 1
+        while slots < 2 * len(self._ids):
+            slots *= 2
+        mask = slots - 1
+        table = array('Q', bytes(16 * slots))
+        count = 0
+        for illust_id, offset in zip(self._ids, self._offsets):
+            slot = _slot_of(illust_id, mask)
+            while table[2 * slot] not in (0, illust_id):
+                slot = (slot + 1) & mask
+            count += table[2 * slot] == 0
+            table[2 * slot] = illust_id
+            table[2 * slot + 1] = offset
+        if sys.byteorder == 'big':
+            table.byteswap()
+
+        with open(self.path + '.idx.tmp', 'wb') as index_file:
+            index_file.write(_INDEX_HEADER.pack(_INDEX_MAGIC, count, slots))
+            table.tofile(index_file)
+        os.replace(self.path + '.idx.tmp', self.path + '.idx')
+
+
+class ArchiveReader:
+    """Memory-mapped, read-only view of an archive.
+
+    Supports lookups by illustration ID (archive[illust_id], get, in) and iterating over every
+    record in the order they were written, including records replaced by a newer one.
+
+    """
+
+    def __init__(self, path: str, index: bool = True):
+        """Init ArchiveReader by mapping the archive's data file and, optionally, its index."""
+        with open(path, 'rb') as data_file:
+            self._data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._data[:len(_DATA_MAGIC)] != _DATA_MAGIC:
+            raise ValueError(f"'{path}' is not an illustration archive.")
+        self._index = None
+        self._count = 0
+        self._mask = 0
+        if index:
+            with open(path + '.idx', 'rb') as index_file:
+                self._index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self._count, slots = _INDEX_HEADER.unpack_from(self._index, 0)
+            if magic != _INDEX_MAGIC:
+                raise ValueError(f"'{path}.idx' is not an illustration archive index.")
+            self._mask = slots - 1
+
+    def __enter__(self) -> 'ArchiveReader':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Unmap the archive.  Views returned by ArchiveRecord.raw must be released first."""
+        self._data.close()
+        if self._index is not None:
+            self._index.close()
+
+    def _find(self, illust_id: int) -> Optional[int]:
+        """Find the offset of the newest record of an illustration in the data file."""
+        slot = _slot_of(illust_id, self._mask)
+        while True:
+            slot_id, offset = _SLOT.unpack_from(self._index, _INDEX_HEADER.size + _SLOT.size * slot)
+            if slot_id == illust_id:
+                return offset
+            if slot_id == 0:
+                return None
+            slot = (slot + 1) & self._mask
+
+    def get(self, illust_id: int) -> Optional[ArchiveRecord]:
+        """Get the record of an illustration, or None if it is not in the archive."""
+        offset = self._find(int(illust_id))
+        return None if offset is None else ArchiveRecord(self._data, offset)
+
+    def __getitem__(self, illust_id: int) -> ArchiveRecord:
+        record = self.get(illust_id)
+        if record is None:
+            raise KeyError(illust_id)
+        return record
+
+    def __contains__(self, illust_id: int) -> bool:
+        return self._find(int(illust_id)) is not None
+
+    def __len__(self) -> int:
+        """Number of illustrations in the archive."""
+        return self._count
+
+    def __iter__(self) -> Iterator[ArchiveRecord]:
+        offset = len(_DATA_MAGIC)
+        while offset < len(self._data):
+            record = ArchiveRecord(self._data, offset)
+            yield record
+            offset += _RECORD.size + record._fields[10] + record._fields[11]  # pylint: disable=protected-access
@@ -0,0 +1,178 @@
+"""Streaming newline-delimited JSON export.
+
+JsonlExporter writes each item of an API generator as one line of JSON as soon as it is yielded,
+so an export of any size runs in constant memory.  Output can be compressed while it is written
+and split into several files by size or age.  Each file is written under a temporary name and only
+renamed to its final name once it is complete, so a file with a final name is never partial.  If
+the with block of the exporter exits with an exception, the current file is closed but keeps its
+temporary name.
+
+Example:
+    >>> with JsonlExporter('dumps', 'rankings', compression='gzip', max_bytes=2**30) as exporter:
+    ...     exporter.write_all(api.get_rankings(token))
+    >>> exporter.files
+
+"""
+
+import bz2
+import datetime
+import gzip
+import json
+import lzma
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+class COMPRESSION:  # Ignore Reason: Dataclass | pylint: disable=too-few-public-methods,invalid-name
+    """Compression options for exported files."""
+
+    NONE = None
+    GZIP = 'gzip'
+    BZ2 = 'bz2'
+    XZ = 'xz'
+
+
+_EXTENSIONS = {
+    COMPRESSION.NONE: '.jsonl',
+    COMPRESSION.GZIP: '.jsonl.gz',
+    COMPRESSION.BZ2: '.jsonl.bz2',
+    COMPRESSION.XZ: '.jsonl.xz'
+}
+
+_BUFFER_SIZE = 1 << 20
+
+
+class JsonlExporter:
+    """Write items as newline-delimited JSON, rotating between files.
+
+    A new file is started once the current one holds 'max_bytes' bytes of (uncompressed) JSON or
+    has been open for 'max_seconds' seconds.  Writes are buffered, and every 'fsync_interval'
+    seconds the buffers are flushed and the file is synced to disk.
+
+    Attributes:
+        directory: Directory the files are written to.
+        prefix: Start of the name of each file.
+        compression: Compression option.
+        max_bytes: Optional maximum number of bytes of JSON per file.
+        max_seconds: Optional maximum number of seconds a file is written to.
+        fsync_interval: Seconds between syncing the current file to disk.
+        on_finalize: Optional callback, called with the path of each completed file.
+        files: Paths of the completed files.
+
+    """
+
+    def __init__(self, directory: str, prefix: str, compression: Optional[str] = COMPRESSION.NONE,
+                 max_bytes: Optional[int] = None, max_seconds: Optional[float] = None,
+                 fsync_interval: float = 10.0,
+                 on_finalize: Optional[Callable[[str], None]] = None):
+        """Init JsonlExporter, creating the output directory if it does not exist."""
+        if compression not in _EXTENSIONS:
+            raise ValueError(f"Unknown compression option '{compression}'.")
+        self.directory = directory
+        self.prefix = prefix
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.fsync_interval = fsync_interval
+        self.on_finalize = on_finalize
+        self.files: List[str] = []
+        os.makedirs(directory, exist_ok=True)
+        self._raw = None
+        self._stream = None
+        self._path = None
+        self._bytes = 0
+        self._opened_at = 0.0
+        self._synced_at = 0.0
+        self._sequence = 0
+
+    def __enter__(self) -> 'JsonlExporter':
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self._abandon()
+
+    def _open(self):
+        """Start a new file under a temporary name."""
+        timestamp = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+        name = f'{self.prefix}-{timestamp}-{self._sequence:05d}{_EXTENSIONS[self.compression]}'
+        self._sequence += 1
+        self._path = os.path.join(self.directory, name)
+        self._raw = open(self._path + '.tmp', 'wb', buffering=_BUFFER_SIZE)
+        if self.compression == COMPRESSION.GZIP:
+            self._stream = gzip.GzipFile(filename=name, mode='wb', fileobj=self._raw)
+        elif self.compression == COMPRESSION.BZ2:
+            self._stream = bz2.BZ2File(self._raw, mode='wb')
+        elif self.compression == COMPRESSION.XZ:
+            self._stream = lzma.LZMAFile(self._raw, mode='wb')
+        else:
+            self._stream = self._raw
+        self._bytes = 0
+        self._opened_at = self._synced_at = time.monotonic()
+
+    def _sync(self):
+        """Flush the buffers of the current file and sync it to disk."""
+        self._stream.flush()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._synced_at = time.monotonic()
+
+    def _finalize(self):
+        """Complete the current file and give it its final name."""
+        # Closing a compressed stream writes its trailer but leaves the raw file open
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        os.replace(self._path + '.tmp', self._path)
+        self.files.append(self._path)
+        self._raw = self._stream = None
+        if self.on_finalize is not None:
+            self.on_finalize(self._path)
+
+    def _abandon(self):
+        """Close the current file, leaving it under its temporary name as it is incomplete."""
+        if self._stream is None:
+            return
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+        self._raw = self._stream = None
+
+    def write(self, item: Dict[str, Any]):
+        """Write an item as a single line of JSON."""
+        now = time.monotonic()
+        if self._stream is not None and (
+                (self.max_bytes is not None and self._bytes >= self.max_bytes) or
+                (self.max_seconds is not None and now - self._opened_at >= self.max_seconds)):
+            self._finalize()
+        if self._stream is None:
+            self._open()
+
+        line = json.dumps(item, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+        self._stream.write(line)
+        self._bytes += len(line)
+        if now - self._synced_at >= self.fsync_interval:
+            self._sync()
+
+    def write_all(self, items: Iterable[Dict[str, Any]]) -> int:
+        """Write every item of an iterable, i.e. an API generator.
+
+        Returns:
+            The number of items written.
+
+        """
+        count = 0
+        for item in items:
+            self.write(item)
+            count += 1
+        return count
+
+    def close(self):
+        """Complete the current file, if any."""
+        if self._stream is not None:
+            self._finalize()
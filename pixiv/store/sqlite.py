@@ -0,0 +1,374 @@
+"""Local SQLite store for crawled data.
+
+Consumes the output of the API functions and upserts it into a normalized schema so the data can
+be analysed offline without making any more requests.  Items are written in batches, one
+transaction per batch, with the database in WAL mode so readers are not blocked by the writer.
+
+Example:
+    >>> with SqliteStore('pixiv.db') as store:
+    ...     store.add_illusts(api.get_bookmarks(token, user_id), bookmarked_by=user_id)
+    ...     store.tag_counts(limit=10)
+
+"""
+
+import itertools
+import json
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT,
+    account     TEXT,
+    profile_image_url TEXT
+);
+CREATE TABLE IF NOT EXISTS illusts (
+    id              INTEGER PRIMARY KEY,
+    user_id         INTEGER,
+    title           TEXT,
+    type            TEXT,
+    caption         TEXT,
+    create_date     TEXT,
+    page_count      INTEGER,
+    width           INTEGER,
+    height          INTEGER,
+    sanity_level    INTEGER,
+    x_restrict      INTEGER,
+    total_view      INTEGER,
+    total_bookmarks INTEGER,
+    raw             TEXT
+);
+CREATE INDEX IF NOT EXISTS illusts_user ON illusts (user_id);
+CREATE INDEX IF NOT EXISTS illusts_create_date ON illusts (create_date);
+CREATE TABLE IF NOT EXISTS tags (
+    id              INTEGER PRIMARY KEY,
+    name            TEXT NOT NULL UNIQUE,
+    translated_name TEXT
+);
+CREATE TABLE IF NOT EXISTS illust_tags (
+    illust_id   INTEGER NOT NULL,
+    tag_id      INTEGER NOT NULL,
+    PRIMARY KEY (illust_id, tag_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS illust_tags_tag ON illust_tags (tag_id);
+CREATE TABLE IF NOT EXISTS comments (
+    id          INTEGER PRIMARY KEY,
+    illust_id   INTEGER,
+    parent_id   INTEGER,
+    user_id     INTEGER,
+    comment     TEXT,
+    date        TEXT
+);
+CREATE INDEX IF NOT EXISTS comments_illust ON comments (illust_id);
+CREATE TABLE IF NOT EXISTS bookmarks (
+    user_id     INTEGER NOT NULL,
+    illust_id   INTEGER NOT NULL,
+    restrict    TEXT,
+    PRIMARY KEY (user_id, illust_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bookmarks_illust ON bookmarks (illust_id);
+CREATE TABLE IF NOT EXISTS bookmark_tags (
+    user_id     INTEGER NOT NULL,
+    restrict    TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    count       INTEGER,
+    PRIMARY KEY (user_id, restrict, name)
+) WITHOUT ROWID;
+"""
+
+# Each upsert is an UPDATE of every row of a batch, followed by an INSERT OR IGNORE of every row,
+# which only adds the rows the UPDATE did not find, rather than an INSERT ... ON CONFLICT DO UPDATE
+# which needs SQLite 3.24.  The numbered parameters of the UPDATE refer to the INSERT's columns.
+_UPSERT_USER = (
+    'UPDATE users SET name = ?2, account = ?3, profile_image_url = ?4 WHERE id = ?1',
+    'INSERT OR IGNORE INTO users (id, name, account, profile_image_url) VALUES (?, ?, ?, ?)'
+)
+
+_UPSERT_ILLUST = (
+    """
+UPDATE illusts SET
+    user_id = ?2,
+    title = ?3,
+    type = ?4,
+    caption = ?5,
+    create_date = ?6,
+    page_count = ?7,
+    width = ?8,
+    height = ?9,
+    sanity_level = ?10,
+    x_restrict = ?11,
+    total_view = ?12,
+    total_bookmarks = ?13,
+    raw = ?14
+WHERE id = ?1
+""",
+    """
+INSERT OR IGNORE INTO illusts (id, user_id, title, type, caption, create_date, page_count, width,
+                               height, sanity_level, x_restrict, total_view, total_bookmarks, raw)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+)
+
+_UPSERT_TAG = (
+    'UPDATE tags SET translated_name = coalesce(?2, translated_name) WHERE name = ?1',
+    'INSERT OR IGNORE INTO tags (name, translated_name) VALUES (?, ?)'
+)
+
+_DELETE_ILLUST_TAGS = 'DELETE FROM illust_tags WHERE illust_id = ?'
+
+_INSERT_ILLUST_TAG = """
+INSERT OR IGNORE INTO illust_tags (illust_id, tag_id)
+SELECT ?, id FROM tags WHERE name = ?
+"""
+
+_UPSERT_COMMENT = (
+    # The date of a stored comment is kept, and only filled in if it was missing.
+    'UPDATE comments SET comment = ?5, parent_id = coalesce(?3, parent_id), '
+    'date = coalesce(date, ?6) WHERE id = ?1',
+    'INSERT OR IGNORE INTO comments (id, illust_id, parent_id, user_id, comment, date) '
+    'VALUES (?, ?, ?, ?, ?, ?)'
+)
+
+_UPSERT_BOOKMARK = (
+    'UPDATE bookmarks SET restrict = ?3 WHERE user_id = ?1 AND illust_id = ?2',
+    'INSERT OR IGNORE INTO bookmarks (user_id, illust_id, restrict) VALUES (?, ?, ?)'
+)
+
+_UPSERT_BOOKMARK_TAG = (
+    'UPDATE bookmark_tags SET count = ?4 WHERE user_id = ?1 AND restrict = ?2 AND name = ?3',
+    'INSERT OR IGNORE INTO bookmark_tags (user_id, restrict, name, count) VALUES (?, ?, ?, ?)'
+)
+
+
+def _batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Split an iterable into lists of at most 'size' items."""
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _user_row(user: Dict[str, Any]) -> Tuple:
+    """Convert a user in JSON format to a row of the users table."""
+    return (
+        user['id'],
+        user.get('name'),
+        user.get('account'),
+        user.get('profile_image_urls', {}).get('medium')
+    )
+
+
+class SqliteStore:
+    """Normalized SQLite database of illustrations, users, tags, comments and bookmarks.
+
+    Every add_* method consumes an iterable of items in the JSON format yielded by the matching API
+    function, and returns the number of items written.
+
+    Attributes:
+        batch_size: Number of items written per transaction.
+
+    """
+
+    def __init__(self, path: str, batch_size: int = 500):
+        """Init SqliteStore, creating the database and its schema if they do not exist."""
+        self.batch_size = batch_size
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self) -> 'SqliteStore':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the database."""
+        self._db.close()
+
+    def _upsert(self, upsert: Tuple[str, str], rows: Iterable[Tuple]):
+        """Upsert rows with one executemany of the UPDATE and one of the INSERT of an upsert."""
+        update, insert = upsert
+        rows = list(rows)
+        self._db.executemany(update, rows)
+        # Inserted last row first, so a key repeated in the batch keeps its last row, as it would
+        # if each row was upserted in turn.
+        self._db.executemany(insert, reversed(rows))
+
+    def _write(self, items: Iterable[Dict[str, Any]], write_batch) -> int:
+        """Write items in batches, one transaction per batch."""
+        count = 0
+        for batch in _batches(items, self.batch_size):
+            with self._db:
+                write_batch(batch)
+            count += len(batch)
+        return count
+
+    # --------------------------------------- Writers ---------------------------------------
+    def _write_illusts(self, illusts: List[Dict[str, Any]]):
+        """Upsert a batch of illustrations along with their users and tags.
+
+        The tags of an illustration are replaced, so tags removed since it was stored are dropped.
+
+        """
+        self._upsert(_UPSERT_USER, (_user_row(illust['user']) for illust in illusts))
+        self._upsert(_UPSERT_ILLUST, (
+            (
+                illust['id'],
+                illust['user']['id'],
+                illust.get('title'),
+                illust.get('type'),
+                illust.get('caption'),
+                illust.get('create_date'),
+                illust.get('page_count'),
+                illust.get('width'),
+                illust.get('height'),
+                illust.get('sanity_level'),
+                illust.get('x_restrict'),
+                illust.get('total_view'),
+                illust.get('total_bookmarks'),
+                json.dumps(illust, ensure_ascii=False)
+            )
+            for illust in illusts
+        ))
+        tags = [(illust['id'], tag) for illust in illusts for tag in illust.get('tags', [])]
+        # One row per tag, keeping a translation even if a later illustration lacks it.
+        translations: Dict[str, Optional[str]] = {}
+        for _, tag in tags:
+            if tag.get('translated_name') is not None or tag['name'] not in translations:
+                translations[tag['name']] = tag.get('translated_name')
+        self._upsert(_UPSERT_TAG, translations.items())
+        self._db.executemany(_DELETE_ILLUST_TAGS, ((illust['id'],) for illust in illusts))
+        self._db.executemany(_INSERT_ILLUST_TAG, (
+            (illust_id, tag['name']) for illust_id, tag in tags))
+
+    def add_illusts(self, illusts: Iterable[Dict[str, Any]], bookmarked_by: Optional[str] = None,
+                    restrict: Optional[str] = None) -> int:
+        """Upsert illustrations, i.e. from get_bookmarks, get_rankings or search_illust.
+
+        Args:
+            illusts: Illustrations in JSON format.
+            bookmarked_by: Optional user ID, records each illustration as bookmarked by the user.
+            restrict: Work restriction option of the bookmarks.
+
+        Returns:
+            The number of illustrations written.
+
+        """
+        def write_batch(batch):
+            self._write_illusts(batch)
+            if bookmarked_by is not None:
+                self._upsert(_UPSERT_BOOKMARK, (
+                    (int(bookmarked_by), illust['id'], restrict) for illust in batch))
+        return self._write(illusts, write_batch)
+
+    def add_users(self, previews: Iterable[Dict[str, Any]]) -> int:
+        """Upsert users from user previews, i.e. from get_following or get_followers.
+
+        Args:
+            previews: User previews in JSON format.
+
+        Returns:
+            The number of users written.
+
+        """
+        def write_batch(batch):
+            self._upsert(_UPSERT_USER, (_user_row(preview['user']) for preview in batch))
+            illusts = [illust for preview in batch for illust in preview.get('illusts', [])]
+            if illusts:
+                self._write_illusts(illusts)
+        return self._write(previews, write_batch)
+
+    def add_comments(self, comments: Iterable[Dict[str, Any]], illust_id: str,
+                     parent_id: Optional[str] = None) -> int:
+        """Upsert the comments on an illustration, or the replies to a comment.
+
+        Args:
+            comments: Comments in JSON format.
+            illust_id: Pixiv illustration ID the comments are on.
+            parent_id: Optional comment ID the comments are replies to.
+
+        Returns:
+            The number of comments written.
+
+        """
+        parent_id = None if parent_id is None else int(parent_id)
+
+        def write_batch(batch):
+            self._upsert(_UPSERT_USER, (_user_row(comment['user']) for comment in batch))
+            self._upsert(_UPSERT_COMMENT, (
+                (comment['id'], int(illust_id), parent_id, comment['user']['id'],
+                 comment.get('comment'), comment.get('date'))
+                for comment in batch
+            ))
+        return self._write(comments, write_batch)
+
+    def add_bookmark_tags(self, bookmark_tags: Iterable[Dict[str, Any]], user_id: str,
+                          restrict: str) -> int:
+        """Upsert a user's bookmark tags, i.e. from get_bookmark_tags.
+
+        Args:
+            bookmark_tags: Bookmark tags in JSON format.
+            user_id: Pixiv user ID the bookmark tags belong to.
+            restrict: Work restriction option of the bookmark tags.
+
+        Returns:
+            The number of bookmark tags written.
+
+        """
+        def write_batch(batch):
+            self._upsert(_UPSERT_BOOKMARK_TAG, (
+                (int(user_id), restrict, tag['name'], tag.get('count')) for tag in batch))
+        return self._write(bookmark_tags, write_batch)
+
+    # ---------------------------------------- Queries ----------------------------------------
+    def illust(self, illust_id: str) -> Optional[Dict[str, Any]]:
+        """Get an illustration, in the JSON format it was retrieved in, or None if not stored."""
+        row = self._db.execute('SELECT raw FROM illusts WHERE id = ?', (int(illust_id),)).fetchone()
+        return None if row is None else json.loads(row['raw'])
+
+    def illusts_by_tag(self, name: str) -> Iterator[Dict[str, Any]]:
+        """Iterate over the stored illustrations with a tag, newest first."""
+        rows = self._db.execute(
+            'SELECT illusts.raw FROM illusts '
+            'JOIN illust_tags ON illust_tags.illust_id = illusts.id '
+            'JOIN tags ON tags.id = illust_tags.tag_id '
+            'WHERE tags.name = ? ORDER BY illusts.create_date DESC',
+            (name,)
+        )
+        return (json.loads(row['raw']) for row in rows)
+
+    def bookmarks(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        """Iterate over the stored illustrations bookmarked by a user."""
+        rows = self._db.execute(
+            'SELECT illusts.raw FROM illusts '
+            'JOIN bookmarks ON bookmarks.illust_id = illusts.id '
+            'WHERE bookmarks.user_id = ?',
+            (int(user_id),)
+        )
+        return (json.loads(row['raw']) for row in rows)
+
+    def comments(self, illust_id: str) -> List[Dict[str, Any]]:
+        """Get the stored comments and replies on an illustration as rows of the comments table."""
+        rows = self._db.execute(
+            'SELECT * FROM comments WHERE illust_id = ? ORDER BY date', (int(illust_id),))
+        return [dict(row) for row in rows]
+
+    def tag_counts(self, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Count the stored illustrations per tag, most used tag first."""
+        rows = self._db.execute(
+            'SELECT tags.name, COUNT(*) AS count FROM illust_tags '
+            'JOIN tags ON tags.id = illust_tags.tag_id '
+            'GROUP BY tags.id ORDER BY count DESC, tags.name LIMIT ?',
+            (-1 if limit is None else limit,)
+        )
+        return [(row['name'], row['count']) for row in rows]
+
+    def query(self, sql: str, parameters: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        """Run an arbitrary SQL query against the store."""
+        return [dict(row) for row in self._db.execute(sql, tuple(parameters))]
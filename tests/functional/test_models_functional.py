@@ -72,6 +72,7 @@ _MODEL_TEST_INFO = [
         'valid_kwargs': {
             'filter': FILTER.FOR_ANDROID,
             'category': ARTICLE_CATEGORY.ALL,
+            'offset': None,
             'auth_token': config.CACHED_TOKEN
         }
     },
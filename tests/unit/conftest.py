@@ -0,0 +1,18 @@
+"""Fixtures shared by the unit tests."""
+
+import tracemalloc
+from typing import Any, Callable
+
+import pytest
+
+
+@pytest.fixture
+def allocated() -> Callable[[Callable[[], Any]], int]:
+    """Function measuring the bytes held by the objects another function creates."""
+    def measure(create: Callable[[], Any]) -> int:
+        tracemalloc.start()
+        created = create()  # pylint: disable=unused-variable
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size
+    return measure
@@ -0,0 +1,277 @@
+"""Test cases for the analytics package.
+
+The illustrations of the valid API testcases are used as input, so the results can be compared
+against the same computation done directly on the dictionaries.
+
+"""
+
+import os
+import itertools
+import json
+import pickle
+import random
+from collections import Counter
+from typing import Any, Dict, List
+
+import pytest
+
+from pixiv import analytics
+
+
+# ------------------------------------ Helper Functions -------------------------------------
+_TESTCASE_DIR = os.path.dirname(__file__) + '/api_testcases'
+
+
+def load_illusts() -> List[Dict[str, Any]]:
+    """Load every illustration of the valid ranking, related and recommended testcases."""
+    illusts = []
+    for name in ('get_rankings_valid.json', 'get_related_valid.json', 'get_recommended_valid.json'):
+        with open(f'{_TESTCASE_DIR}/{name}', encoding='utf-8') as testcase:
+            for line in testcase:
+                illusts.extend(json.loads(line)['illusts'])
+    return illusts
+
+
+# --------------------------------------- Test Cases ----------------------------------------
+@pytest.mark.parametrize("chunk_size", [1, 7, 65536])
+def test_to_columns(chunk_size: int):
+    """Test that the chunks hold every field of every illustration, whatever the chunk size."""
+    illusts = load_illusts()
+    chunks = list(analytics.to_columns(iter(illusts), chunk_size=chunk_size))
+    assert [len(chunk) for chunk in chunks[:-1]] == [chunk_size] * (len(chunks) - 1)
+    assert len({id(chunk.dictionary) for chunk in chunks}) == 1
+
+    rows = [(chunk, index) for chunk in chunks for index in range(len(chunk))]
+    assert len(rows) == len(illusts)
+    for illust, (chunk, index) in zip(illusts, rows):
+        assert chunk.id[index] == illust['id']
+        assert chunk.user_id[index] == illust['user']['id']
+        assert chunk.total_bookmarks[index] == illust['total_bookmarks']
+        assert chunk.page_count[index] == illust['page_count']
+        assert chunk.strings('type')[index] == illust['type']
+        assert chunk.strings('user_name')[index] == illust['user']['name']
+        assert chunk.tags(index) == [tag['name'] for tag in illust['tags']]
+        assert chunk.create_time[index] > 0
+
+
+def test_columns_aggregation():
+    """Test aggregating chunks against the same aggregation over the dictionaries."""
+    illusts = load_illusts()
+    tag_counts = Counter()
+    views = 0
+    for chunk in analytics.to_columns(illusts, chunk_size=10):
+        tag_counts.update(chunk.tag_counts())
+        views += sum(chunk.total_view)
+    assert views == sum(illust['total_view'] for illust in illusts)
+    assert tag_counts == Counter(tag['name'] for illust in illusts for tag in illust['tags'])
+
+
+def test_columns_missing_fields():
+    """Test that missing fields are stored as zero or the empty string."""
+    chunk, = analytics.to_columns([{'id': 5}])
+    assert (chunk.id[0], chunk.user_id[0], chunk.create_time[0], chunk.width[0]) == (5, 0, 0, 0)
+    assert chunk.strings('type') == ['']
+    assert chunk.tags(0) == []
+
+
+def test_columns_memory(allocated):
+    """Test that a chunk takes a small fraction of the memory of the dictionaries."""
+    texts = [json.dumps(illust) for illust in load_illusts()] * 4
+
+    dict_size = allocated(lambda: [json.loads(text) for text in texts])
+    column_size = allocated(lambda: next(analytics.to_columns(
+        (json.loads(text) for text in texts), chunk_size=len(texts)
+    )))
+    assert column_size < dict_size / 10
+
+
+def test_columns_to_numpy():
+    """Test that the numpy arrays share the values of the chunk."""
+    numpy = pytest.importorskip('numpy')
+    illusts = load_illusts()
+    chunk, = analytics.to_columns(illusts)
+    arrays = chunk.to_numpy()
+    assert arrays['id'].dtype == numpy.uint64
+    assert arrays['total_view'].sum() == sum(illust['total_view'] for illust in illusts)
+    assert numpy.bincount(arrays['tag_codes']).sum() == len(chunk.tag_codes)
+
+
+def test_tag_stats_exact():
+    """Test that the statistics are exact when the budget holds every tag and pair."""
+    illusts = load_illusts()
+    stats = analytics.TagStats(memory_budget=16 * 2**20)
+    stats.add_illusts(illusts)
+
+    tag_counts = Counter(tag for illust in illusts for tag in {t['name'] for t in illust['tags']})
+    pair_counts = Counter(
+        pair for illust in illusts
+        for pair in itertools.combinations(sorted({t['name'] for t in illust['tags']}), 2)
+    )
+    assert stats.illusts == len(illusts)
+    assert dict(stats.top_tags(len(tag_counts))) == dict(tag_counts)
+    assert dict(stats.top_pairs(len(pair_counts))) == dict(pair_counts)
+    for tag, count in tag_counts.items():
+        assert stats.tag_count(tag) == count
+    for (first, second), count in pair_counts.items():
+        assert stats.pair_count(second, first) == count
+
+    from_columns = analytics.TagStats(memory_budget=16 * 2**20)
+    for chunk in analytics.to_columns(illusts, chunk_size=5):
+        from_columns.add_columns(chunk)
+    assert from_columns.top_pairs(20) == stats.top_pairs(20)
+
+
+def zipf_tags(seed: int, illusts: int) -> List[List[str]]:
+    """Generate the tags of illustrations, tag i being picked with a weight of 1 / (i + 1)."""
+    generator = random.Random(seed)
+    names = [f'tag{i}' for i in range(5000)]
+    weights = [1 / (i + 1) for i in range(len(names))]
+    return [generator.choices(names, weights, k=6) for _ in range(illusts)]
+
+
+def test_tag_stats_bounded():
+    """Test the error bounds of the sketches when the input does not fit in the budget."""
+    tags = zipf_tags(1, 3000)
+    stats = analytics.TagStats(memory_budget=64 * 1024)
+    for illust_tags in tags:
+        stats.add_tags(illust_tags)
+    assert stats.tag_sketch.nbytes + stats.pair_sketch.nbytes <= 64 * 1024 // 2
+    assert len(stats.pairs.top()) <= stats.pairs.capacity
+
+    tag_counts = Counter(tag for illust_tags in tags for tag in set(illust_tags))
+    for tag, count in tag_counts.most_common(200):
+        assert count - stats.tags.error <= stats.tags.estimate(tag) <= count
+        assert count <= stats.tag_count(tag) <= count + 2 * stats.tag_sketch.total // \
+            stats.tag_sketch.width
+    assert [tag for tag, _ in stats.top_tags(3)] == [tag for tag, _ in tag_counts.most_common(3)]
+
+
+def test_tag_stats_merge():
+    """Test that merging the statistics of two shards equals the statistics of all input."""
+    tags = zipf_tags(2, 2000)
+    whole = analytics.TagStats(memory_budget=64 * 1024)
+    shards = [analytics.TagStats(memory_budget=64 * 1024) for _ in range(2)]
+    for index, illust_tags in enumerate(tags):
+        whole.add_tags(illust_tags)
+        shards[index % 2].add_tags(illust_tags)
+    merged = pickle.loads(pickle.dumps(shards[0]))
+    merged.merge(shards[1])
+
+    assert merged.illusts == whole.illusts
+    assert merged.tag_sketch._table == whole.tag_sketch._table  # pylint: disable=protected-access
+    assert merged.pair_sketch._table == whole.pair_sketch._table  # pylint: disable=protected-access
+    tag_counts = Counter(tag for illust_tags in tags for tag in set(illust_tags))
+    for tag, count in tag_counts.most_common(50):
+        assert count - merged.tags.error <= merged.tags.estimate(tag) <= count
+    with pytest.raises(ValueError):
+        merged.merge(analytics.TagStats(memory_budget=1024))
+
+
+def test_tag_stats_bookmark_tags():
+    """Test counting the tags of get_bookmark_tags by their number of bookmarks."""
+    stats = analytics.TagStats(memory_budget=2**16)
+    stats.add_bookmark_tags([{'name': 'a', 'count': 5}, {'name': 'b', 'count': 2}])
+    stats.add_bookmark_tags([{'name': 'a', 'count': 1}])
+    assert stats.top_tags() == [('a', 6), ('b', 2)]
+    assert stats.tag_count('a') >= 6
+
+
+_DAY = 86400.0
+
+
+def ranking(seed: int, size: int = 50) -> List[Dict[str, Any]]:
+    """Create a ranking of illustrations drawn from a fixed pool, with growing counts."""
+    rand = random.Random(seed)
+    ids = rand.sample(range(90_000_000, 90_000_100), size)
+    return [
+        {'id': illust_id, 'total_view': illust_id % 1000 * 10 + seed * 100,
+         'total_bookmarks': illust_id % 100 + seed * 10}
+        for illust_id in ids
+    ]
+
+
+def test_snapshot_encoding():
+    """Test that snapshots round trip, and are smaller delta-encoded than in JSON."""
+    unique = {illust['id']: illust for illust in load_illusts()}
+    entries = [(illust['id'], illust['total_view'], illust['total_bookmarks'])
+               for illust in list(unique.values())[:100]]
+    keyframe = analytics.trends.encode_snapshot(entries)
+    base = analytics.trends.decode_snapshot(keyframe)
+    assert list(base) == [entry[0] for entry in entries]
+    assert [base[entry[0]] for entry in entries] == \
+        [(rank, views, bookmarks) for rank, (_, views, bookmarks) in enumerate(entries, 1)]
+    assert len(keyframe) < len(json.dumps(entries)) / 2
+
+    grown = [(illust_id, views + 7, bookmarks + 1) for illust_id, views, bookmarks in entries]
+    grown.reverse()
+    delta = analytics.trends.encode_snapshot(grown, base)
+    assert len(delta) < len(keyframe)
+    decoded = analytics.trends.decode_snapshot(delta, base)
+    assert [(illust_id, *decoded[illust_id][1:]) for illust_id in decoded] == grown
+
+
+def test_ranking_tracker_movement(tmp_path):
+    """Test rank movement and velocities between two snapshots."""
+    with analytics.RankingTracker(str(tmp_path / 'trends.db')) as tracker:
+        first = [{'id': 1, 'total_view': 100, 'total_bookmarks': 10},
+                 {'id': 2, 'total_view': 200, 'total_bookmarks': 20},
+                 {'id': 3, 'total_view': 300, 'total_bookmarks': 30}]
+        movements = tracker.add_snapshot('day', first, taken_at=0)
+        assert [(move.rank, move.previous_rank, move.rank_change) for move in movements] == \
+            [(1, None, 0), (2, None, 0), (3, None, 0)]
+
+        second = [{'id': 3, 'total_view': 500, 'total_bookmarks': 50},
+                  {'id': 4, 'total_view': 10, 'total_bookmarks': 1},
+                  {'id': 1, 'total_view': 150, 'total_bookmarks': 12}]
+        movements = tracker.add_snapshot('day', second, taken_at=7200)
+        assert [(move.illust_id, move.previous_rank, move.rank_change) for move in movements] == \
+            [(3, 3, 2), (4, None, 2), (1, 1, -2)]
+        assert movements[0].bookmark_velocity == 10.0
+        assert movements[0].view_velocity == 100.0
+        assert movements[1].bookmark_velocity is None
+
+        movers = tracker.top_movers('day', days=1, until=7200)
+        assert [(mover.illust_id, mover.rank_gain) for mover in movers] == \
+            [(3, 2), (4, 2), (2, 0), (1, -2)]
+        assert (movers[0].best_rank, movers[0].last_rank) == (1, 1)
+        movers = tracker.top_movers('day', by='view_gain', limit=1, until=7200)
+        assert [(mover.illust_id, mover.view_gain) for mover in movers] == [(3, 200)]
+        assert tracker.top_movers('week', until=7200) == []
+        with pytest.raises(ValueError):
+            tracker.top_movers('day', by='title')
+
+
+def test_ranking_tracker_history(tmp_path):
+    """Test keyframes, resuming from the database and top movers over several days."""
+    path = str(tmp_path / 'trends.db')
+    rankings = [ranking(seed) for seed in range(10)]
+    with analytics.RankingTracker(path, keyframe_interval=3) as tracker:
+        for seed in range(5):
+            tracker.add_snapshot('day', rankings[seed], taken_at=seed * _DAY / 2)
+    with analytics.RankingTracker(path, keyframe_interval=3) as tracker:
+        for seed in range(5, 10):
+            tracker.add_snapshot('day', rankings[seed], taken_at=seed * _DAY / 2)
+        snapshots = tracker.snapshots('day')
+        assert len(snapshots) == 10
+        bases = [row[0] for row in tracker._db.execute(  # pylint: disable=protected-access
+            'SELECT base_id FROM snapshots ORDER BY id')]
+        assert bases.count(None) == 4
+        for (snapshot_id, _), illusts in zip(snapshots, rankings):
+            assert tracker.snapshot(snapshot_id) == {
+                illust['id']: (rank, illust['total_view'], illust['total_bookmarks'])
+                for rank, illust in enumerate(illusts, 1)
+            }
+
+        # Recompute the gains of the last three days (snapshots 4 to 9) from the snapshots, the
+        # first of them diffed against the snapshot of the day before.
+        until = 9 * _DAY / 2
+        gains = Counter()
+        for previous, current in zip(rankings[3:], rankings[4:]):
+            previous = {illust['id']: illust for illust in previous}
+            for illust in current:
+                if illust['id'] in previous:
+                    gains[illust['id']] += illust['total_bookmarks'] - \
+                        previous[illust['id']]['total_bookmarks']
+        movers = tracker.top_movers('day', days=3, by='bookmark_gain', limit=100, until=until)
+        assert {mover.illust_id: mover.bookmark_gain for mover in movers if mover.bookmark_gain} \
+            == {illust_id: gain for illust_id, gain in gains.items() if gain}
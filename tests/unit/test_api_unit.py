@@ -22,14 +22,21 @@ API functions.
 import os
 import copy
 import json
+import time
 from typing import Dict, Any
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import pytest
 
+from pixiv.api.decors import compile_fields
+from pixiv.api.data import ON_DEADLINE
 from pixiv.api.exceptions import ApiError
+from pixiv.common import timeouts, validate
 from pixiv.common.data import AuthToken
+from pixiv.common.exceptions import DeadlineExceeded
 from pixiv import api
+# Imported directly, the tests above leave patches on the models module in place.
+from pixiv.api.models import get_rankings as get_rankings_model
 
 
 # -------------------------------------- Test Mapping ---------------------------------------
@@ -90,6 +97,38 @@ _API_TEST_INFO = [
         'valid_json':   f'{_TESTCASE_DIR}/get_rankings_valid.json',
         'valid_args':   [AuthToken('access', 'refresh', 3600)],
         'list_key':     'illusts'
+    },
+    {
+        'name': 'search_illust',
+        'api_fn': api.search_illust,
+        'invalid_json': f'{_TESTCASE_DIR}/search_illust_invalid.json',
+        'valid_json':   f'{_TESTCASE_DIR}/search_illust_valid.json',
+        'valid_args':   [AuthToken('access', 'refresh', 3600), 'Fate'],
+        'list_key':     'illusts'
+    },
+    {
+        'name': 'get_following',
+        'api_fn': api.get_following,
+        'invalid_json': f'{_TESTCASE_DIR}/get_following_invalid.json',
+        'valid_json':   f'{_TESTCASE_DIR}/get_following_valid.json',
+        'valid_args':   [AuthToken('access', 'refresh', 3600), '12345'],
+        'list_key':     'user_previews'
+    },
+    {
+        'name': 'get_followers',
+        'api_fn': api.get_followers,
+        'invalid_json': f'{_TESTCASE_DIR}/get_followers_invalid.json',
+        'valid_json':   f'{_TESTCASE_DIR}/get_followers_valid.json',
+        'valid_args':   [AuthToken('access', 'refresh', 3600), '12345'],
+        'list_key':     'user_previews'
+    },
+    {
+        'name': 'get_comment_replies',
+        'api_fn': api.get_comment_replies,
+        'invalid_json': f'{_TESTCASE_DIR}/get_comment_replies_invalid.json',
+        'valid_json':   f'{_TESTCASE_DIR}/get_comment_replies_valid.json',
+        'valid_args':   [AuthToken('access', 'refresh', 3600), '12345'],
+        'list_key':     'comments'
     }
 ]
 
@@ -165,3 +204,196 @@ def test_api_gen_valid_json(test_info: Dict[str, Any], valid_json: Dict[str, Any
     for expected_data_item in valid_data_items:
         data_item = next(generator)
         assert expected_data_item == data_item, 'Mismatching data items!'
+
+
+def test_compile_fields():
+    """Test projecting an item onto top level, nested and list field paths."""
+    item = {
+        'id': 1,
+        'title': 'title',
+        'caption': 'caption',
+        'user': {'id': 2, 'name': 'name', 'profile_image_urls': {'medium': 'url'}},
+        'tags': [{'name': 'a', 'translated_name': None}, {'name': 'b'}]
+    }
+    assert compile_fields(['id', 'user.id', 'tags.name'])(item) == {
+        'id': 1, 'user': {'id': 2}, 'tags': [{'name': 'a'}, {'name': 'b'}]
+    }
+    # A parent path keeps the whole object whichever order the paths are in.
+    for fields in (['user', 'user.id'], ['user.id', 'user']):
+        assert compile_fields(fields)(item) == {'user': item['user']}
+    # Missing keys are left out rather than raising.
+    assert compile_fields(['id', 'series.id', 'user.account'])(item) == {'id': 1, 'user': {}}
+
+
+def test_api_fields():
+    """Test that an API function yields trimmed items across every page of the response."""
+    with open(f'{_TESTCASE_DIR}/get_rankings_valid.json', encoding='utf-8') as testcase:
+        page = json.loads(testcase.readline())
+    pages = [
+        dict(copy.deepcopy(page), next_url='https://app-api.pixiv.net/v1/illust/ranking?mode=day'
+                                           '&filter=for_ios&offset=30'),
+        dict(copy.deepcopy(page), next_url=None)
+    ]
+    with patch('pixiv.api.models.get_rankings', side_effect=pages) as model:
+        illusts = list(api.get_rankings(
+            AuthToken('access', 'refresh', 3600), fields=['id', 'user.id']
+        ))
+
+    expected = [{'id': illust['id'], 'user': {'id': illust['user']['id']}}
+                for illust in page['illusts']]
+    assert illusts == expected * 2
+    assert model.call_count == 2
+    assert model.call_args[1]['offset'] == '30'
+    # Each raw page is released once its items are trimmed.
+    assert pages == [{}, {}]
+
+
+def test_api_stream():
+    """Test that a streamed API function yields each item before its response is fully read."""
+    with open(f'{_TESTCASE_DIR}/get_rankings_valid.json', encoding='utf-8') as testcase:
+        page = dict(json.loads(testcase.readline()), next_url=None)
+    body = json.dumps(page).encode('utf-8')
+    chunks_read = []
+
+    def iter_content(chunk_size):
+        for start in range(0, len(body), chunk_size):
+            chunks_read.append(start)
+            yield body[start:start + chunk_size]
+
+    response = MagicMock(status_code=200, iter_content=iter_content)
+    with patch('requests.Session') as session_mock, \
+            patch('pixiv.api.models.get_rankings', get_rankings_model):
+        session_mock.return_value = MagicMock(send=MagicMock(return_value=response))
+        generator = api.get_rankings(
+            AuthToken('access', 'refresh', 3600), stream=True, fields=['id']
+        )
+        assert next(generator) == {'id': page['illusts'][0]['id']}
+        assert len(chunks_read) < len(range(0, len(body), 16 * 1024))
+        assert [illust['id'] for illust in generator] == \
+            [illust['id'] for illust in page['illusts'][1:]]
+
+    assert session_mock.return_value.send.call_args[1] == \
+        {'stream': True, 'timeout': timeouts.DEFAULT_TIMEOUT}
+    response.close.assert_called_once()
+    response.json.assert_not_called()
+
+
+def test_api_stream_invalid():
+    """Test that a streamed response missing the list key raises an ApiError once complete."""
+    response = MagicMock(status_code=200, iter_content=lambda _: iter([b'{"next_url": null}']))
+    with patch('requests.Session') as session_mock, \
+            patch('pixiv.api.models.get_rankings', get_rankings_model):
+        session_mock.return_value = MagicMock(send=MagicMock(return_value=response))
+        with pytest.raises(ApiError):
+            list(api.get_rankings(AuthToken('access', 'refresh', 3600), stream=True))
+
+
+@pytest.mark.parametrize(
+    "test_info, valid_json",
+    [
+        (test_info, json.loads(json_testcase))
+        for test_info in _API_TEST_INFO
+        for json_testcase in open(test_info['valid_json'], encoding='utf-8').readlines()
+    ]
+)
+def test_api_strict_schema(test_info: Dict[str, Any], valid_json: Dict[str, Any]):
+    """Test that every item of the valid responses matches the schema of its endpoint."""
+    with patch(f"pixiv.api.models.{test_info['name']}",
+               return_value=dict(valid_json, next_url=None)):
+        try:
+            validate.set_mode(validate.SCHEMA_MODE.STRICT)
+            items = list(test_info['api_fn'](*test_info['valid_args']))
+        finally:
+            validate.set_mode(validate.SCHEMA_MODE.LENIENT)
+    assert items == valid_json[test_info['list_key']]
+
+
+def test_api_strict_schema_invalid_item():
+    """Test that a malformed item only raises an ApiError in strict mode."""
+    page = {'illusts': [{'id': 1, 'title': None}], 'next_url': None}
+    with patch('pixiv.api.models.get_rankings', side_effect=lambda **_: copy.deepcopy(page)):
+        assert list(api.get_rankings(AuthToken('access', 'refresh', 3600))) == page['illusts']
+        try:
+            validate.set_mode(validate.SCHEMA_MODE.STRICT)
+            with pytest.raises(ApiError) as ex:
+                list(api.get_rankings(AuthToken('access', 'refresh', 3600)))
+        finally:
+            validate.set_mode(validate.SCHEMA_MODE.LENIENT)
+    assert ex.value.__cause__.path == 'illusts[].title'
+
+
+def test_api_pages():
+    """Test that an API function yields whole pages with their next_url and transfer info."""
+    with open(f'{_TESTCASE_DIR}/get_rankings_valid.json', encoding='utf-8') as testcase:
+        page = json.loads(testcase.readline())
+    next_url = 'https://app-api.pixiv.net/v1/illust/ranking?mode=day&filter=for_ios&offset=30'
+    bodies = [
+        json.dumps(dict(page, next_url=next_url)).encode('utf-8'),
+        json.dumps(dict(page, next_url=None)).encode('utf-8')
+    ]
+    responses = [MagicMock(status_code=200, content=body) for body in bodies]
+    with patch('requests.Session') as session_mock, \
+            patch('pixiv.api.models.get_rankings', get_rankings_model):
+        session_mock.return_value = MagicMock(send=MagicMock(side_effect=responses))
+        pages = list(api.get_rankings(AuthToken('access', 'refresh', 3600), pages=True))
+
+    assert [page.next_url for page in pages] == [next_url, None]
+    assert [page.size for page in pages] == [len(body) for body in bodies]
+    assert all(page.elapsed >= 0 for page in pages)
+    for result in pages:
+        assert result.items == page['illusts']
+        assert len(result) == len(page['illusts'])
+
+
+def test_api_pages_options():
+    """Test combining pages with the other options of the API functions."""
+    page = {'illusts': [{'id': 1, 'title': 'a'}, {'id': 2, 'title': 'b'}], 'next_url': None}
+    with patch('pixiv.api.models.get_rankings', side_effect=lambda **_: copy.deepcopy(page)):
+        result, = api.get_rankings(AuthToken('access', 'refresh', 3600), pages=True,
+                                   fields=['id'])
+        assert result.items == [{'id': 1}, {'id': 2}]
+        # The patched model makes no request, so there is no transfer info.
+        assert result.elapsed is None and result.size is None
+
+        result, = api.get_rankings(AuthToken('access', 'refresh', 3600), pages=True,
+                                   as_records=True)
+        assert [illust.title for illust in result] == ['a', 'b']
+
+        with pytest.raises(TypeError):
+            next(api.get_rankings(AuthToken('access', 'refresh', 3600), pages=True, stream=True))
+
+
+@pytest.mark.parametrize("on_deadline", [ON_DEADLINE.STOP, ON_DEADLINE.RAISE])
+def test_api_deadline(on_deadline: str):
+    """Test that a deadline ends an API function between pages, or raises if requested."""
+    next_url = 'https://app-api.pixiv.net/v1/illust/ranking?mode=day&filter=for_ios&offset=30'
+    page = {'illusts': [{'id': 1}, {'id': 2}], 'next_url': next_url}
+    with patch('pixiv.api.models.get_rankings', side_effect=lambda **_: copy.deepcopy(page)):
+        generator = api.get_rankings(AuthToken('access', 'refresh', 3600), deadline=0.05,
+                                     on_deadline=on_deadline)
+        assert [next(generator), next(generator)] == page['illusts']
+        time.sleep(0.1)
+        if on_deadline == ON_DEADLINE.STOP:
+            assert not list(generator)
+        else:
+            with pytest.raises(ApiError) as ex:
+                next(generator)
+            assert isinstance(ex.value.__cause__, DeadlineExceeded)
+
+
+def test_api_deadline_streamed():
+    """Test that a deadline also bounds a streamed response read after its request was sent."""
+    body = json.dumps({'illusts': [{'id': 1}, {'id': 2}], 'next_url': None}).encode('utf-8')
+    response = MagicMock(status_code=200, iter_content=lambda size: iter([body[:20], body[20:]]))
+    with patch('requests.Session') as session_mock, \
+            patch('pixiv.api.models.get_rankings', get_rankings_model):
+        session_mock.return_value = MagicMock(send=MagicMock(return_value=response))
+        generator = api.get_rankings(AuthToken('access', 'refresh', 3600), stream=True,
+                                     deadline=0.05, on_deadline=ON_DEADLINE.RAISE)
+        assert next(generator) == {'id': 1}
+        time.sleep(0.1)
+        with pytest.raises(ApiError):
+            list(generator)
+    timeout = session_mock.return_value.send.call_args[1]['timeout']
+    assert 0 < timeout[0] <= 0.05 and 0 < timeout[1] <= 0.05
+    response.close.assert_called_once()
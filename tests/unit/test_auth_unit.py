@@ -23,14 +23,17 @@ and converting the string into into a dictionary using json.
 
 import os
 import json
-from typing import Callable, Dict, Any
-from unittest.mock import patch
+import collections
+from typing import Callable, Dict, List, Any
+from unittest.mock import patch, MagicMock
 
 import pytest
 
 from pixiv.auth.exceptions import AuthError
-from pixiv.common.data import AuthToken
+from pixiv.common.data import AuthToken, TokenProvider
 from pixiv import auth
+# Imported directly, the API unit tests leave the model functions in the module patched.
+from pixiv.api.models import get_rankings
 
 
 # -------------------------------------- Test Mapping ---------------------------------------
@@ -51,6 +54,43 @@ _AUTH_TEST_INFO = {
 }
 
 
+# ------------------------------------ Helper Functions -------------------------------------
+def create_pool(status_codes: List[List[int]], **kwargs) -> auth.AccountPool:
+    """Create an account pool whose sessions respond with fixed status codes.
+
+    Args:
+        status_codes: For each account, the status codes its session responds with in turn.  The
+            last status code is repeated once the list runs out.
+        kwargs: Other AccountPool arguments.
+
+    Returns:
+        The pool, with each account's token set to 'access-<account index>'.
+
+    """
+    sessions = []
+    for codes in status_codes:
+        codes = collections.deque(codes)
+
+        def send(prepared_request, codes=codes, **_):
+            code = codes.popleft() if len(codes) > 1 else codes[0]
+            return MagicMock(status_code=code, content=b'{}', json=MagicMock(return_value={}))
+        sessions.append(MagicMock(send=MagicMock(side_effect=send)))
+    with patch('requests.Session', side_effect=sessions):
+        return auth.AccountPool(
+            [AuthToken(f'access-{i}', 'refresh', 3600) for i in range(len(status_codes))],
+            **kwargs
+        )
+
+
+def sent_tokens(pool: auth.AccountPool) -> List[str]:
+    """Get the access token of each account, repeated once per request sent with its session."""
+    return [
+        account.token.access_token
+        for account in pool.accounts
+        for _ in range(account.session.send.call_count)
+    ]
+
+
 # --------------------------------------- Test Cases ----------------------------------------
 @pytest.mark.parametrize(
     "auth_fn, args, invalid_json",
@@ -117,3 +157,60 @@ def test_auth_valid_json(auth_fn: Callable, args: Any, valid_json: Dict[str, Any
         'Refresh token did not match expected')
     assert valid_json['response']['expires_in'] == auth_token.ttl, (
         'Token expiration time did not match expected')
+
+
+def test_pool_round_robin():
+    """Test that a pool takes turns between its accounts."""
+    pool = create_pool([[200], [200], [200]])
+    for _ in range(6):
+        get_rankings('for_android', 'day', None, pool)
+    assert collections.Counter(sent_tokens(pool)) == {
+        'access-0': 2, 'access-1': 2, 'access-2': 2}
+    for account in pool.accounts:
+        request = account.session.send.call_args[0][0]
+        assert request.headers['authorization'] == f'Bearer {account.token.access_token}'
+
+
+def test_pool_least_loaded():
+    """Test that a least loaded pool avoids accounts with requests in flight."""
+    pool = create_pool([[200], [200]], strategy=auth.POOL_STRATEGY.LEAST_LOADED)
+    lease = pool.acquire()
+    for _ in range(3):
+        get_rankings('for_android', 'day', None, pool)
+    pool.release(lease, None)
+    assert lease.owner.session.send.call_count == 0
+    assert len(sent_tokens(pool)) == 3
+
+
+def test_pool_quarantines_throttled_account():
+    """Test that a throttled account is quarantined and the request retried on another account."""
+    pool = create_pool([[429, 200], [200]])
+    for _ in range(4):
+        get_rankings('for_android', 'day', None, pool)
+    throttled, healthy = pool.accounts
+    assert throttled.session.send.call_count == 1
+    assert throttled.throttled == 1
+    assert healthy.session.send.call_count == 4
+    assert pool.healthy() == [healthy]
+
+
+def test_pool_renews_expired_token():
+    """Test that a pool renews the token of an account once it has expired."""
+    pool = create_pool([[200]])
+    pool.accounts[0].token = AuthToken('expired', 'refresh', 0)
+    renewed = AuthToken('renewed', 'refresh', 3600)
+    with patch('pixiv.auth.pool.renew_auth_token', return_value=renewed):
+        get_rankings('for_android', 'day', None, pool)
+        get_rankings('for_android', 'day', None, pool)
+    assert pool.accounts[0].token is renewed
+    assert sent_tokens(pool) == ['renewed', 'renewed']
+
+
+def test_token_provider_abstract():
+    """Test that a token provider missing a method cannot be instantiated."""
+    class AcquireOnly(TokenProvider):   # Ignore Reason: Incomplete on purpose | pylint: disable=abstract-method
+        def acquire(self):
+            return None
+
+    with pytest.raises(TypeError):
+        AcquireOnly()
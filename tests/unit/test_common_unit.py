@@ -1,11 +1,30 @@
 """Test cases for Pixiv common modules."""
 
-from typing import Dict, Any, Optional
+import json as jsonlib
+import pickle
+import random
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Any, Iterator, List, Optional
+from unittest.mock import MagicMock, patch
 
 import pytest
+import requests
+from urllib3.exceptions import ReadTimeoutError
 
-from pixiv.common import validate
-from pixiv.common.exceptions import DataNotFound, PixivError
+# Imported directly, the API unit tests leave patches on the models module in place.
+from pixiv.api.models import get_rankings
+from pixiv.common import decoder, stream, timeouts, validate
+from pixiv.common.concurrency import broadcast, tee
+from pixiv.common.hedging import HedgingPolicy, set_hedging
+from pixiv.common.idset import IdSet, dedup
+from pixiv.common.pipeline import ON_ERROR, Pipeline
+from pixiv.common.scheduler import PRIORITY, RequestScheduler, scheduling, set_scheduler
+from pixiv.common.data import AuthToken, TokenLease, TokenProvider
+from pixiv.common.exceptions import (
+    DataNotFound, DeadlineExceeded, PixivError, RequestTimeout, RetryError, SchemaMismatch
+)
 
 
 @pytest.mark.parametrize(
@@ -72,3 +91,643 @@ def test_validate_response_typing(fn_kwargs: Dict[str, Any], error: Optional[Pix
     else:
         with pytest.raises(DataNotFound):
             validate.response_key_mapping(**fn_kwargs)
+
+
+@pytest.mark.parametrize("decode", [decoder.stdlib_decode, decoder.DEFAULT_DECODER])
+def test_decoder_decodes_bytes(decode: Callable[[bytes], Any]):
+    """Test that the stdlib and default decoders decode UTF-8 bytes to the same JSON."""
+    content = '{"illusts":[{"id":1,"title":"無間","tags":[]}],"next_url":null}'.encode()
+    assert decode(content) == {
+        'illusts': [{'id': 1, 'title': '無間', 'tags': []}], 'next_url': None
+    }
+
+
+def test_decoder_hook():
+    """Test that a custom decoder is used for every model response until it is unset."""
+    calls = []
+    def custom_decode(content: bytes) -> Any:
+        calls.append(content)
+        return decoder.stdlib_decode(content)
+
+    response = MagicMock(status_code=200, content=b'{"illusts":[]}')
+    with patch('requests.Session') as session_mock:
+        session_mock.return_value = MagicMock(send=MagicMock(return_value=response))
+        try:
+            decoder.set_decoder(custom_decode)
+            assert decoder.get_decoder() is custom_decode
+            assert get_rankings(
+                'for_ios', 'day', None, AuthToken('access', 'refresh', 3600)
+            ) == {'illusts': []}
+        finally:
+            decoder.set_decoder(None)
+    assert calls == [b'{"illusts":[]}']
+    assert decoder.get_decoder() is decoder.DEFAULT_DECODER
+    # The body is decoded from its bytes, never through response.json()
+    response.json.assert_not_called()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 64, 1 << 20])
+def test_list_stream_parser(chunk_size: int):
+    """Test splitting a response into the elements of its list whatever the chunk boundaries."""
+    page = {
+        'next_url': 'https://app-api.pixiv.net/v1/illust/ranking?offset=30',
+        'before': {'illusts': [1, 2], 'text': 'a "quoted" [bracket], {brace}: \\'},
+        'illusts': [{'id': 1, 'tags': [{'name': '無間'}]}, {'id': 2, 'title': '\\"}],'}, [], 3],
+        'after': None
+    }
+    body = jsonlib.dumps(page, indent=1, ensure_ascii=False).encode('utf-8')
+    parser = stream.ListStreamParser('illusts')
+    elements = []
+    for start in range(0, len(body), chunk_size):
+        elements.extend(parser.feed(body[start:start + chunk_size]))
+
+    assert parser.done
+    assert [jsonlib.loads(element) for element in elements] == page['illusts']
+    assert {key: jsonlib.loads(value) for key, value in parser.rest.items()} == \
+        dict(page, illusts=[])
+
+
+@pytest.mark.parametrize("body, list_key, rest", [
+    (b'{"illusts": [], "next_url": null}', 'illusts', {'illusts': [], 'next_url': None}),
+    (b'{"illusts": null}', 'illusts', {'illusts': None}),
+    (b'{"comments": [{"id": 1}]}', 'illusts', {'comments': [{'id': 1}]})
+])
+def test_list_stream_parser_no_list(body: bytes, list_key: str, rest: Dict[str, Any]):
+    """Test that a list key that is empty, not a list or missing yields nothing."""
+    parser = stream.ListStreamParser(list_key)
+    assert parser.feed(body) == []
+    assert parser.done
+    assert {key: jsonlib.loads(value) for key, value in parser.rest.items()} == rest
+
+
+def test_list_stream_parser_invalid():
+    """Test that a body which is not a JSON object raises DataNotFound."""
+    with pytest.raises(DataNotFound):
+        stream.ListStreamParser('illusts').feed(b'[{"id": 1}]')
+
+
+@pytest.fixture
+def schema_mode():
+    """Restore the default schema mode after a test changes it."""
+    yield validate.set_mode
+    validate.set_mode(validate.SCHEMA_MODE.LENIENT)
+
+
+_PAGE_SCHEMA = validate.Schema({
+    'illusts': [{'id': int, 'user': {'id': int}, 'series': validate.optional({'id': int})}],
+    'next_url': validate.optional(str),
+    'extra': object
+})
+
+
+@pytest.mark.parametrize(
+    "response, lenient_path, strict_path",
+    [
+        (   # Valid response
+            {'illusts': [{'id': 1, 'user': {'id': 2}, 'series': None}], 'extra': [1]}, None, None
+        ),
+        (   # Missing required key
+            {'illusts': [], 'next_url': None}, 'extra', 'extra'
+        ),
+        (   # Wrong type at the top level
+            {'illusts': {}, 'extra': 1}, 'illusts', 'illusts'
+        ),
+        (   # Optional key with the wrong type
+            {'illusts': [], 'extra': 1, 'next_url': 1}, 'next_url', 'next_url'
+        ),
+        (   # Items of a list are only checked in strict mode
+            {'illusts': [{'id': 1, 'user': {'id': '2'}}], 'extra': 1}, None, 'illusts[].user.id'
+        ),
+        (
+            {'illusts': [{'id': 1, 'user': {'id': 2}, 'series': {}}], 'extra': 1},
+            None, 'illusts[].series.id'
+        )
+    ]
+)
+def test_schema(schema_mode: Callable[[str], None], response: Dict[str, Any],
+                lenient_path: Optional[str], strict_path: Optional[str]):
+    """Test validating responses against a compiled schema in each mode."""
+    for mode, path in [(validate.SCHEMA_MODE.LENIENT, lenient_path),
+                       (validate.SCHEMA_MODE.STRICT, strict_path)]:
+        schema_mode(mode)
+        if path is None:
+            _PAGE_SCHEMA(response)
+        else:
+            with pytest.raises(SchemaMismatch) as ex:
+                _PAGE_SCHEMA(response)
+            assert ex.value.path == path
+    schema_mode(validate.SCHEMA_MODE.OFF)
+    _PAGE_SCHEMA(response)
+
+
+def test_schema_streamed_items(schema_mode: Callable[[str], None]):
+    """Test that single items are validated in strict mode only."""
+    item = {'id': 1, 'user': {}}
+    _PAGE_SCHEMA.validate_item('illusts', item)
+    schema_mode(validate.SCHEMA_MODE.STRICT)
+    with pytest.raises(SchemaMismatch) as ex:
+        _PAGE_SCHEMA.validate_item('illusts', item)
+    assert ex.value.path == 'illusts[].user.id'
+
+
+def test_schema_mismatch_message():
+    """Test that the error message is built lazily and the response in it is capped."""
+    class Response(dict):
+        """Response counting the times it is formatted."""
+        formatted = 0
+        def __repr__(self):
+            Response.formatted += 1
+            return super().__repr__()
+
+    response = Response(illusts=[{'id': i, 'title': 'x' * 1000} for i in range(10000)])
+    with pytest.raises(SchemaMismatch) as ex:
+        _PAGE_SCHEMA(response)
+    assert Response.formatted == 0
+    message = str(ex.value)
+    assert message.startswith("Could not find key 'extra' in the JSON response.")
+    assert len(message) < SchemaMismatch.payload_limit + 200
+    with pytest.raises(ValueError):
+        validate.set_mode('loose')
+
+
+@pytest.mark.parametrize("spread", [100, 2**16, 2**20, 2**40])
+def test_id_set(spread: int):
+    """Test IdSet against a set, with sparse and dense containers."""
+    rand = random.Random(spread)
+    values = [rand.randrange(spread) for _ in range(20000)]
+    ids, expected = IdSet(), set()
+    for value in values:
+        assert ids.add(value) == (value not in expected)
+        expected.add(value)
+    assert len(ids) == len(expected)
+    assert list(ids) == sorted(expected)
+    assert all(value in ids for value in values[:1000])
+    assert -1 not in ids and spread not in ids and 'id' not in ids
+    for value in values[:5000]:
+        ids.discard(value)
+        expected.discard(value)
+    ids.discard(spread)
+    assert len(ids) == len(expected)
+    assert list(ids) == sorted(expected)
+    assert IdSet.from_bytes(ids.to_bytes()) == ids
+    assert pickle.loads(pickle.dumps(ids)) == ids
+
+
+def test_id_set_algebra():
+    """Test the set operations across sparse and dense containers."""
+    rand = random.Random(0)
+    first = {rand.randrange(2**18) for _ in range(30000)} | set(range(2**20, 2**20 + 100))
+    second = {rand.randrange(2**18) for _ in range(30000)} | set(range(2**21, 2**21 + 100))
+    first_ids, second_ids = IdSet(first), IdSet(second)
+    assert list(first_ids | second_ids) == sorted(first | second)
+    assert list(first_ids & second_ids) == sorted(first & second)
+    assert list(first_ids - second_ids) == sorted(first - second)
+    assert len(first_ids - second_ids) == len(first - second)
+    first_ids |= second_ids
+    assert list(first_ids) == sorted(first | second)
+    first_ids &= IdSet(range(1000))
+    assert list(first_ids) == sorted((first | second) & set(range(1000)))
+    first_ids -= IdSet(range(500))
+    assert list(first_ids) == sorted((first | second) & set(range(500, 1000)))
+
+
+def test_id_set_compact(tmp_path):
+    """Test that dense IDs take about a bit each, on disk as in memory."""
+    ids = IdSet(range(10**7, 10**7 + 10**6, 2))
+    assert ids.nbytes < 10**6 / 8 + 2 * 8192
+    path = str(tmp_path / 'seen.ids')
+    ids.save(path)
+    loaded = IdSet.load(path)
+    assert len(loaded) == 5 * 10**5 and 10**7 + 2 in loaded and 10**7 + 1 not in loaded
+    # Bitmaps emptied below the array size are written as arrays.
+    for value in range(10**7, 10**7 + 10**6 - 2000, 2):
+        ids.discard(value)
+    assert IdSet.from_bytes(ids.to_bytes()) == ids
+    with pytest.raises(ValueError):
+        IdSet.from_bytes(b'\0' * 16)
+
+
+def test_dedup():
+    """Test filtering repeated items out of several generators sharing the same IdSet."""
+    seen = IdSet()
+    first = [{'id': 1}, {'id': 2}, {'id': 1}]
+    second = [{'id': 2}, {'id': 3}]
+    assert list(dedup(first, seen)) == [{'id': 1}, {'id': 2}]
+    assert list(dedup(second, seen)) == [{'id': 3}]
+    assert list(dedup([(4, 'a'), (4, 'b')], key=lambda item: item[0])) == [(4, 'a')]
+
+
+def counted(count: int, produced: List[int]) -> Iterator[int]:
+    """Generate numbers, counting how many have been produced."""
+    for number in range(count):
+        produced[0] += 1
+        yield number
+
+
+def test_tee_threads():
+    """Test that every iterator gets every item, each item being produced once."""
+    produced = [0]
+    results = [None] * 3
+    iterators = tee(counted(500, produced), 3, buffer_size=8)
+
+    def consume(index):
+        results[index] = list(iterators[index])
+
+    threads = [threading.Thread(target=consume, args=(index,)) for index in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert results == [list(range(500))] * 3
+    assert produced[0] == 500
+
+
+def test_broadcast_backpressure():
+    """Test that the fastest consumer is held back by the slowest, and early stops."""
+    produced = [0]
+    lags = []
+
+    def slow(items):
+        total = 0
+        for consumed, number in enumerate(items, 1):
+            lags.append(produced[0] - consumed)
+            time.sleep(0.0005)
+            total += number
+        return total
+
+    def early(items):
+        return [number for number, _ in zip(items, range(3))]
+
+    def count(items):
+        return sum(1 for _ in items)
+
+    assert broadcast(counted(300, produced), [slow, sum, early, count], buffer_size=5) == \
+        [sum(range(300)), sum(range(300)), [0, 1, 2], 300]
+    assert max(lags) <= 5
+
+
+def test_broadcast_error():
+    """Test that an exception of the iterator reaches every consumer."""
+    def failing():
+        yield 1
+        raise ValueError('page failed')
+
+    seen = []
+
+    def consumer(items):
+        try:
+            for item in items:
+                seen.append(item)
+        except ValueError:
+            seen.append('error')
+            raise
+
+    with pytest.raises(ValueError):
+        broadcast(failing(), [consumer, consumer], buffer_size=1)
+    assert sorted(seen, key=str) == [1, 1, 'error', 'error']
+
+
+def test_pipeline_run():
+    """Test that every item goes through every stage, with several workers per stage."""
+    stored = []
+    lock = threading.Lock()
+
+    def store(item):
+        with lock:
+            stored.append(item)
+
+    pipeline = (
+        Pipeline(range(1000), queue_size=4)
+        .filter(lambda number: number % 2 == 0, workers=2)
+        .map(lambda number: number * 10, workers=3, name='times ten')
+        .flat_map(lambda number: [number, number + 1])
+        .sink(store, workers=2)
+    )
+    metrics = pipeline.run()
+    assert sorted(stored) == sorted(
+        value for number in range(0, 1000, 2) for value in (number * 10, number * 10 + 1))
+    assert [(stage.name, stage.processed) for stage in metrics] == [
+        ('source', 1000), ('filter-1', 1000), ('times ten', 500), ('flat_map-3', 500),
+        ('sink-4', 1000)
+    ]
+    assert all(stage.queue_depth in (None, 0) and stage.errors == 0 for stage in metrics)
+    with pytest.raises(RuntimeError):
+        pipeline.run()
+
+
+def test_pipeline_backpressure():
+    """Test that the source is held back by a slow stage instead of filling memory."""
+    produced = [0]
+    lags = []
+
+    def slow_store(number):
+        lags.append(produced[0] - number)
+        time.sleep(0.0005)
+
+    metrics = Pipeline(counted(300, produced), queue_size=3).map(lambda number: number) \
+        .sink(slow_store, name='store').run()
+    # Two queues of 3 items, plus one item held by each stage.
+    assert max(lags) <= 3 + 3 + 3
+    assert metrics[-1].utilization > metrics[1].utilization
+
+
+@pytest.mark.parametrize("on_error", [ON_ERROR.RAISE, ON_ERROR.SKIP])
+def test_pipeline_errors(on_error: str):
+    """Test that a failing stage either stops the pipeline or drops the item."""
+    def check(number):
+        if number == 5:
+            raise ValueError('bad item')
+        return number
+
+    pipeline = Pipeline(range(20)).map(check, workers=2, on_error=on_error)
+    if on_error == ON_ERROR.RAISE:
+        with pytest.raises(ValueError):
+            list(pipeline)
+    else:
+        assert sorted(pipeline) == [number for number in range(20) if number != 5]
+        assert pipeline.metrics()[1].errors == 1
+
+
+def test_pipeline_invalid_stage():
+    """Test that a stage without workers, or with an unknown error option, is rejected."""
+    with pytest.raises(ValueError):
+        Pipeline(range(20)).map(lambda number: number, workers=0)
+    with pytest.raises(ValueError):
+        Pipeline(range(20)).map(lambda number: number, on_error='ignore')
+
+
+def test_pipeline_iterate_cancel():
+    """Test that stopping iteration early cancels every stage and closes the source."""
+    closed = []
+
+    def source():
+        try:
+            yield from range(10**9)
+        finally:
+            closed.append(True)
+
+    pipeline = Pipeline(source(), queue_size=2).map(lambda number: number + 1, workers=2)
+    for number in pipeline:
+        if number >= 10:
+            break
+    assert pipeline.join(timeout=5)
+    assert closed == [True]
+
+
+def grant_order(scheduler: RequestScheduler, requests: List[Dict[str, Any]]) -> List[Any]:
+    """Queue requests behind a held slot, then release it and record the order of the grants."""
+    order = []
+    scheduler.acquire()
+    threads = []
+    for request in requests:
+        def run(request=request):
+            with scheduling(request.get('priority', PRIORITY.NORMAL), request.get('job'),
+                            request.get('weight', 1.0)):
+                with scheduler.slot():
+                    order.append(request['name'])
+        threads.append(threading.Thread(target=run))
+        threads[-1].start()
+        # Wait for the request to be queued, so arrival order is deterministic.
+        while scheduler.waiting < len(threads):
+            time.sleep(0.001)
+        if 'delay' in request:
+            time.sleep(request['delay'])
+    scheduler.release()
+    for thread in threads:
+        thread.join(timeout=10)
+    return order
+
+
+def test_scheduler_priority():
+    """Test that interactive requests are served before queued bulk requests."""
+    scheduler = RequestScheduler(max_concurrent=1)
+    requests = [{'name': f'bulk-{i}', 'priority': PRIORITY.BULK, 'job': 'backfill'}
+                for i in range(5)]
+    requests += [{'name': 'lookup', 'priority': PRIORITY.INTERACTIVE},
+                 {'name': 'normal', 'priority': PRIORITY.NORMAL}]
+    assert grant_order(scheduler, requests) == \
+        ['lookup', 'normal'] + [f'bulk-{i}' for i in range(5)]
+    assert scheduler.in_flight == 0 and scheduler.granted['backfill'] == 5
+
+
+def test_scheduler_fair_share():
+    """Test that the jobs of a class share the slots by weight, whatever their queue length."""
+    scheduler = RequestScheduler(max_concurrent=1)
+    requests = [{'name': 'a', 'job': 'a', 'weight': 2.0} for _ in range(12)]
+    requests += [{'name': 'b', 'job': 'b'} for _ in range(6)]
+    order = grant_order(scheduler, requests)
+    assert order[:9].count('a') == 6 and order[:9].count('b') == 3
+    assert len(order) == 18
+
+
+def test_scheduler_aging():
+    """Test that a bulk request which waited long enough is served before newer requests."""
+    scheduler = RequestScheduler(max_concurrent=1, aging=0.05)
+    order = grant_order(scheduler, [
+        {'name': 'bulk', 'priority': PRIORITY.BULK, 'delay': 0.2},
+        {'name': 'lookup', 'priority': PRIORITY.INTERACTIVE}
+    ])
+    assert order == ['bulk', 'lookup']
+
+
+def test_scheduler_rate_and_requests():
+    """Test the rate limit, and that every model call waits for a slot of the scheduler."""
+    scheduler = RequestScheduler(max_concurrent=2, rate=50.0)
+    response = MagicMock(status_code=200, content=b'{"illusts":[]}')
+    started = time.monotonic()
+    with patch('requests.Session') as session_mock:
+        session_mock.return_value = MagicMock(send=MagicMock(return_value=response))
+        try:
+            set_scheduler(scheduler)
+            with scheduling(PRIORITY.BULK, job='rankings'):
+                for _ in range(6):
+                    get_rankings('for_ios', 'day', None, AuthToken('access', 'refresh', 3600))
+        finally:
+            set_scheduler(None)
+    assert time.monotonic() - started >= 5 / 50.0 * 0.9
+    assert scheduler.granted == Counter({'rankings': 6})
+    assert scheduler.in_flight == 0
+
+
+def test_scheduler_slot_after_lease():
+    """Test that a request leases its token before it takes a slot of the scheduler."""
+    scheduler = RequestScheduler(max_concurrent=1)
+    session = MagicMock(send=MagicMock(
+        return_value=MagicMock(status_code=200, content=b'{"illusts":[]}')))
+    slots_held = []
+
+    class SlowProvider(TokenProvider):
+        """Provider waiting before it hands out a token, like an AccountPool on min_interval."""
+
+        def acquire(self):
+            slots_held.append(scheduler.in_flight)
+            time.sleep(0.05)
+            return TokenLease(AuthToken('access', 'refresh', 3600), session)
+
+        def release(self, lease, response):
+            pass
+
+    try:
+        set_scheduler(scheduler)
+        threads = [threading.Thread(target=get_rankings,
+                                    args=('for_ios', 'day', None, SlowProvider()))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+    finally:
+        set_scheduler(None)
+    assert slots_held == [0] * 4 and session.send.call_count == 4
+    assert scheduler.in_flight == 0
+
+
+def test_scheduler_rate_contention():
+    """Test that requests queued behind a busy slot are woken up once the rate limit allows."""
+    scheduler = RequestScheduler(max_concurrent=1, rate=20.0)
+    started = time.monotonic()
+    order = grant_order(scheduler, [{'name': i} for i in range(4)])
+    assert order == [0, 1, 2, 3]
+    assert time.monotonic() - started >= 4 / 20.0 * 0.9
+    assert scheduler.in_flight == 0 and scheduler.waiting == 0
+
+
+def test_request_timeouts():
+    """Test that every model call is sent with the timeouts, shortened under a deadline."""
+    # Under a deadline the body is read in chunks, so it cannot outlast the deadline.
+    response = MagicMock(status_code=200, content=b'{"illusts":[]}',
+                         iter_content=lambda _: iter([b'{"illusts":', b'[]}']))
+    token = AuthToken('access', 'refresh', 3600)
+    with patch('requests.Session') as session_mock:
+        send = session_mock.return_value.send
+        send.return_value = response
+        try:
+            timeouts.set_timeout(connect=3.05, read=20)
+            get_rankings('for_ios', 'day', None, token)
+            assert send.call_args[1] == {'timeout': (3.05, 20)}
+            with timeouts.deadline_after(5):
+                # Outer deadlines that come earlier are kept.
+                with timeouts.deadline_after(60):
+                    assert get_rankings('for_ios', 'day', None, token) == {'illusts': []}
+            connect, read = send.call_args[1]['timeout']
+            assert connect == 3.05 and 4 < read <= 5
+        finally:
+            timeouts.set_timeout()
+        assert timeouts.get_timeout() == timeouts.DEFAULT_TIMEOUT
+
+        send.reset_mock()
+        with timeouts.deadline_at(time.monotonic() - 1):
+            with pytest.raises(DeadlineExceeded):
+                get_rankings('for_ios', 'day', None, token)
+        send.assert_not_called()
+
+        send.side_effect = requests.ConnectTimeout()
+        with pytest.raises(RequestTimeout):
+            get_rankings('for_ios', 'day', None, token)
+        assert send.call_count == 2
+
+
+def test_request_body_timeouts():
+    """Test that a read timeout while the body is downloaded raises RequestTimeout."""
+    # requests raises a stalled body as a ConnectionError wrapping urllib3's ReadTimeoutError.
+    def stalled():
+        return requests.ConnectionError(ReadTimeoutError(None, None, 'Read timed out.'))
+
+    def stalled_body(_):
+        yield b'{"illusts":['
+        raise stalled()
+
+    token = AuthToken('access', 'refresh', 3600)
+    with patch('requests.Session') as session_mock:
+        send = session_mock.return_value.send
+        send.side_effect = stalled()
+        with pytest.raises(RequestTimeout):
+            get_rankings('for_ios', 'day', None, token)
+        assert send.call_count == 2
+
+        send.side_effect = None
+        send.return_value = MagicMock(status_code=200, iter_content=stalled_body)
+        with timeouts.deadline_after(60):
+            with pytest.raises(RequestTimeout):
+                get_rankings('for_ios', 'day', None, token)
+        with stream.streaming('illusts'):
+            page = get_rankings('for_ios', 'day', None, token)
+        with pytest.raises(RequestTimeout):
+            list(page)
+
+        # Other connection errors are not timeouts.
+        send.side_effect = requests.ConnectionError('Connection refused.')
+        with pytest.raises(RetryError):
+            get_rankings('for_ios', 'day', None, token)
+
+
+def slow_session(seconds: float, body: bytes) -> MagicMock:
+    """Create a session whose requests are answered with the body after some seconds."""
+    def send(prepared_request, **_):
+        time.sleep(seconds)
+        return MagicMock(status_code=200, content=body)
+    return MagicMock(send=MagicMock(side_effect=send))
+
+
+def test_hedging_policy():
+    """Test that a slow GET request is hedged, and that the first response is used."""
+    with HedgingPolicy(min_samples=5, min_delay=0.0, max_ratio=1.0) as policy:
+        for _ in range(5):
+            policy.record(0.01)
+        assert policy.delay() == 0.01
+        prepared = requests.Request('GET', 'https://app-api.pixiv.net/v1/illust/ranking').prepare()
+        with patch('requests.Session', return_value=slow_session(0.0, b'hedge')):
+            response = policy.send(slow_session(0.3, b'first'), prepared, timeout=(1, 1))
+            assert response.content == b'hedge'
+            assert policy.hedged == 1 and policy.hedge_wins == 1
+
+            # Answered before the delay, so no hedge.
+            assert policy.send(slow_session(0.0, b'first'), prepared).content == b'first'
+            # Never hedged, a POST request may not be idempotent.
+            post = requests.Request('POST', 'https://oauth.secure.pixiv.net/auth/token').prepare()
+            assert policy.send(slow_session(0.05, b'first'), post).content == b'first'
+            assert policy.hedged == 1 and policy.requests == 3
+        # The latency of the request which lost is recorded once it is answered.
+        time.sleep(0.4)
+        assert max(policy._latencies) >= 0.3  # pylint: disable=protected-access
+
+
+def test_hedging_threads():
+    """Test that only a request which can be hedged leaves the caller's thread, timed once sent."""
+    threads = []
+
+    def send(prepared_request, **_):
+        threads.append(threading.current_thread())
+        return MagicMock(status_code=200, content=b'first')
+
+    prepared = requests.Request('GET', 'https://app-api.pixiv.net/v1/illust/ranking').prepare()
+    with HedgingPolicy(min_samples=1, min_delay=0.0, max_ratio=0.0, max_workers=1) as policy:
+        policy.record(1.0)
+        assert policy.send(MagicMock(send=send), prepared).content == b'first'
+        assert threads == [threading.current_thread()] and policy.hedged == 0
+
+    with HedgingPolicy(min_samples=1, min_delay=0.0, max_ratio=1.0, max_workers=1) as policy:
+        policy.record(1.0)
+        policy._executor.submit(time.sleep, 0.2)  # pylint: disable=protected-access
+        assert policy.send(MagicMock(send=send), prepared).content == b'first'
+        assert threads[-1] is not threading.current_thread() and policy.hedged == 0
+        assert min(policy._latencies) < 0.1  # pylint: disable=protected-access
+
+
+def test_hedging_budget_and_requests():
+    """Test that the hedge volume is capped, and that model calls are hedged."""
+    policy = HedgingPolicy(percentile=50, min_samples=1, min_delay=0.0, max_ratio=0.25,
+                           burst=1.0)
+    for _ in range(100):
+        policy.record(0.01)
+    token = AuthToken('access', 'refresh', 3600)
+    with patch('requests.Session') as session_mock:
+        session_mock.return_value = slow_session(0.05, b'{"illusts":[]}')
+        try:
+            set_hedging(policy)
+            for _ in range(8):
+                assert get_rankings('for_ios', 'day', None, token) == {'illusts': []}
+        finally:
+            set_hedging(None)
+            policy.close()
+    assert policy.requests == 8 and policy.hedged == 2
@@ -0,0 +1,479 @@
+"""Test cases for the concurrent crawl functions and the follow graph crawler.
+
+The model functions are mocked with fakes that serve responses from a generated, in-memory data
+set so the crawls can be checked for completeness without making any requests.
+
+"""
+
+import datetime
+import os
+import time
+import urllib.parse as urlparse
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Iterator, Dict, List, Any
+from unittest.mock import patch
+
+import pytest
+
+from pixiv import api
+from pixiv.api import crawl
+from pixiv.api import graph as crawl_graph
+from pixiv.api import jobs as crawl_jobs
+from pixiv.api import sharding
+from pixiv.api.exceptions import ApiError
+from pixiv.common.data import AuthToken
+
+
+# ------------------------------------ Helper Functions -------------------------------------
+def create_search_corpus(start: datetime.date, days: int, per_day: int) -> List[Dict[str, Any]]:
+    """Create a fake set of illustrations, with 'per_day' illustrations uploaded every day."""
+    return [
+        {
+            'id': day * per_day + i,
+            'create_date': (start + datetime.timedelta(days=day)).isoformat() + 'T12:00:00+09:00'
+        }
+        for day in range(days)
+        for i in range(per_day)
+    ]
+
+
+def create_search_model(corpus: List[Dict[str, Any]], page_size: int = 30):
+    """Create a fake search model which pages through the matching part of the corpus."""
+    def search_illust(word, search_target, sort, start_date, end_date, filter, offset, auth_token):
+        matches = sorted(
+            (illust for illust in corpus
+             if start_date <= illust['create_date'][:10] <= end_date),
+            key=lambda illust: illust['create_date'],
+            reverse=True
+        )
+        offset = int(offset or 0)
+        assert offset <= crawl.MAX_SEARCH_OFFSET, 'Requested past the search offset cap.'
+        next_offset = offset + page_size
+        next_url = None
+        if next_offset < len(matches):
+            next_url = 'https://app-api.pixiv.net/v1/search/illust?' + urlparse.urlencode(
+                {'word': word, 'offset': next_offset})
+        return {'illusts': matches[offset:next_offset], 'next_url': next_url}
+    return search_illust
+
+
+def create_following_model(graph: Dict[int, List[int]], page_size: int = 30):
+    """Create a fake following model which pages through the adjacency lists of a graph."""
+    def get_following(user_id, restrict, offset, auth_token):
+        following = graph.get(int(user_id), [])
+        offset = int(offset or 0)
+        next_offset = offset + page_size
+        next_url = None
+        if next_offset < len(following):
+            next_url = f'https://app-api.pixiv.net/v1/user/following?offset={next_offset}'
+        return {
+            'user_previews': [{'user': {'id': user}} for user in following[offset:next_offset]],
+            'next_url': next_url
+        }
+    return get_following
+
+
+def create_follow_graph(users: int, degree: int) -> Dict[int, List[int]]:
+    """Create a fake follow graph where each user follows the 'degree' users after them."""
+    return {
+        user: [(user + step) % users for step in range(1, degree + 1)]
+        for user in range(users)
+    }
+
+
+def create_comment_models(comments: int, page_size: int = 30):
+    """Create fake comment and reply models, where every third comment has replies.
+
+    Replies are served slower for earlier comments so they complete out of order.
+
+    """
+    def get_illust_comments(illust_id, offset, auth_token):
+        offset = int(offset or 0)
+        next_offset = offset + page_size
+        next_url = None
+        if next_offset < comments:
+            next_url = f'https://app-api.pixiv.net/v2/illust/comments?offset={next_offset}'
+        return {
+            'comments': [
+                {'id': f'{illust_id}-{i}', 'has_replies': i % 3 == 0}
+                for i in range(offset, min(next_offset, comments))
+            ],
+            'next_url': next_url
+        }
+
+    def get_comment_replies(comment_id, offset, auth_token):
+        index = int(comment_id.split('-')[1])
+        time.sleep(0.001 * ((comments - index) % 7))
+        return {
+            'comments': [{'id': f'{comment_id}-reply-{i}'} for i in range(index % 4 + 1)],
+            'next_url': None
+        }
+    return get_illust_comments, get_comment_replies
+
+
+def create_articles_model(articles: Dict[str, List[int]], page_size: int = 10):
+    """Create a fake article model which pages through the article IDs of each category."""
+    def get_articles(filter, category, offset, auth_token):
+        listed = articles[category]
+        offset = int(offset or 0)
+        next_offset = offset + page_size
+        next_url = None
+        if next_offset < len(listed):
+            next_url = ('https://app-api.pixiv.net/v1/spotlight/articles?'
+                        f'filter={filter}&category={category}&offset={next_offset}')
+        return {
+            'spotlight_articles': [
+                {'id': article, 'category': category}
+                for article in listed[offset:next_offset]
+            ],
+            'next_url': next_url
+        }
+    return get_articles
+
+
+def fake_listing(auth_token: Any, task: int, count: int) -> Iterator[Dict[str, Any]]:
+    """Fake API function for the sharded crawl, run in the worker processes."""
+    for i in range(count):
+        if count == 13 and i == 7:
+            raise ApiError('Failed on purpose.')
+        yield {'task': task, 'i': i, 'token': auth_token.accounts[0].token.access_token}
+
+
+def dying_listing(auth_token: Any) -> Iterator[Dict[str, Any]]:
+    """Fake API function whose worker process dies."""
+    os._exit(1)  # pylint: disable=protected-access
+    yield {}
+
+
+# --------------------------------------- Test Cases ----------------------------------------
+@pytest.mark.parametrize(
+    "days, per_day, max_workers",
+    [
+        (10, 5, 1),     # Whole corpus fits under the cap
+        (30, 20, 2),    # Requires splitting the date range
+        (64, 9, 4),     # Requires several levels of splitting
+    ]
+)
+@patch('pixiv.api.crawl.MAX_SEARCH_OFFSET', 60)
+def test_search_partitioned_complete(days: int, per_day: int, max_workers: int):
+    """Test that a partitioned search retrieves every matching illustration exactly once.
+
+    Args:
+        days: Number of days in the fake corpus.
+        per_day: Number of illustrations uploaded per day.
+        max_workers: Maximum number of windows searched at the same time.
+
+    """
+    start = datetime.date(2019, 1, 1)
+    corpus = create_search_corpus(start, days, per_day)
+    with patch('pixiv.api.models.search_illust', side_effect=create_search_model(corpus)):
+        results = list(crawl.search_illust_partitioned(
+            AuthToken('access', 'refresh', 3600), 'tag',
+            start_date=start,
+            end_date=start + datetime.timedelta(days=days - 1),
+            max_workers=max_workers
+        ))
+    ids = [illust['id'] for illust in results]
+    assert len(ids) == len(set(ids)), 'Duplicate illustrations yielded.'
+    assert set(ids) == {illust['id'] for illust in corpus}, 'Missing illustrations.'
+
+
+@patch('pixiv.api.crawl.MAX_SEARCH_OFFSET', 60)
+def test_search_partitioned_single_day_over_cap():
+    """Test that a day with more results than the offset cap is truncated with a warning."""
+    start = datetime.date(2019, 1, 1)
+    corpus = create_search_corpus(start, 1, 100)
+    with patch('pixiv.api.models.search_illust', side_effect=create_search_model(corpus)):
+        with pytest.warns(UserWarning):
+            results = list(crawl.search_illust_partitioned(
+                AuthToken('access', 'refresh', 3600), 'tag', start_date=start, end_date=start
+            ))
+    assert len(results) == 60
+
+
+@pytest.mark.parametrize(
+    "max_depth, expected_sources",
+    [
+        (1, {0}),
+        (2, set(range(41)))
+    ]
+)
+def test_follow_graph_crawl_depth(tmp_path, max_depth: int, expected_sources: set):
+    """Test that the crawler only expands users below the maximum depth.
+
+    Args:
+        tmp_path: Temporary directory for the crawl database.
+        max_depth: Maximum depth of the crawl.
+        expected_sources: Users whose following list should have been crawled.
+
+    """
+    graph = create_follow_graph(users=1000, degree=40)
+    with patch('pixiv.api.models.get_following', side_effect=create_following_model(graph)):
+        crawler = crawl_graph.FollowGraphCrawler(
+            AuthToken('access', 'refresh', 3600), str(tmp_path / 'graph.db'),
+            max_depth=max_depth, max_workers=3
+        )
+        crawler.add_seeds(['0'])
+        edges = list(crawler.crawl())
+    assert len(edges) == len(set(edges)), 'Duplicate edges yielded.'
+    assert {source for source, _ in edges} == expected_sources
+    assert set(edges) == {
+        (source, target) for source in expected_sources for target in graph[source]}
+    assert crawler.pending() == 0
+    crawler.close()
+
+
+def test_follow_graph_crawl_resume(tmp_path):
+    """Test that an interrupted crawl resumes from its database without losing edges."""
+    graph = create_follow_graph(users=200, degree=35)
+    path = str(tmp_path / 'graph.db')
+    with patch('pixiv.api.models.get_following', side_effect=create_following_model(graph)):
+        crawler = crawl_graph.FollowGraphCrawler(
+            AuthToken('access', 'refresh', 3600), path, max_depth=2, max_workers=2)
+        crawler.add_seeds(['0'])
+        first = []
+        for edge in crawler.crawl():
+            first.append(edge)
+            if len(first) == 100:
+                break
+        crawler.close()
+
+        crawler = crawl_graph.FollowGraphCrawler(
+            AuthToken('access', 'refresh', 3600), path, max_depth=2, max_workers=2)
+        second = list(crawler.crawl())
+        stored = set(crawler.edges())
+        crawler.close()
+
+    expected = {(source, target) for source in range(36) for target in graph[source]}
+    assert not set(first) & set(second), 'Edges yielded again after resuming.'
+    assert set(first) | set(second) == expected
+    assert stored == expected
+
+
+def test_follow_graph_crawl_shortcut(tmp_path):
+    """Test that a user found deeper first gets the depth of a shorter path found later."""
+    graph = {1: [12], 10: [11], 11: [12], 12: [13]}
+    following = create_following_model(graph)
+
+    def get_following(user_id, restrict, offset, auth_token):
+        if int(user_id) == 1:
+            # The direct path to 12 is found after the longer path through 10 and 11.
+            time.sleep(0.3)
+        return following(user_id, restrict, offset, auth_token)
+
+    with patch('pixiv.api.models.get_following', side_effect=get_following):
+        crawler = crawl_graph.FollowGraphCrawler(
+            AuthToken('access', 'refresh', 3600), str(tmp_path / 'graph.db'),
+            max_depth=2, max_workers=2
+        )
+        crawler.add_seeds(['1', '10'])
+        edges = set(crawler.crawl())
+        crawler.close()
+    assert edges == {(1, 12), (10, 11), (11, 12), (12, 13)}
+
+
+@pytest.mark.parametrize("comments", [0, 10, 95])
+def test_comment_threads_in_order(comments: int):
+    """Test that comment threads are yielded in comment order with all of their replies.
+
+    Args:
+        comments: Number of top-level comments on the illustration.
+
+    """
+    get_illust_comments, get_comment_replies = create_comment_models(comments)
+    with patch('pixiv.api.models.get_illust_comments', side_effect=get_illust_comments), \
+            patch('pixiv.api.models.get_comment_replies', side_effect=get_comment_replies):
+        threads = list(crawl.get_comment_threads(AuthToken('access', 'refresh', 3600), '1'))
+    assert [comment['id'] for comment, _ in threads] == [f'1-{i}' for i in range(comments)]
+    for comment, replies in threads:
+        index = int(comment['id'].split('-')[1])
+        expected = index % 4 + 1 if comment['has_replies'] else 0
+        assert len(replies) == expected, 'Incorrect replies for comment.'
+
+
+def test_comment_threads_many():
+    """Test that threads of many illustrations are each yielded in order."""
+    illust_ids = [str(i) for i in range(6)]
+    get_illust_comments, get_comment_replies = create_comment_models(40)
+    with patch('pixiv.api.models.get_illust_comments', side_effect=get_illust_comments), \
+            patch('pixiv.api.models.get_comment_replies', side_effect=get_comment_replies):
+        threads = list(crawl.get_comment_threads_many(
+            AuthToken('access', 'refresh', 3600), illust_ids, max_workers=3))
+    for illust_id in illust_ids:
+        ordered = [comment['id'] for thread_illust, comment, _ in threads
+                   if thread_illust == illust_id]
+        assert ordered == [f'{illust_id}-{i}' for i in range(40)]
+
+
+def test_articles_pagination():
+    """Test that the article listing pages past the first page using the offset."""
+    articles = {'all': list(range(45, 0, -1))}
+    with patch('pixiv.api.models.get_articles', side_effect=create_articles_model(articles)):
+        ids = [article['id'] for article in api.get_articles(AuthToken('access', 'refresh', 3600))]
+    assert ids == articles['all']
+
+
+@pytest.mark.parametrize(
+    "last_seen, expected",
+    [
+        (None, set(range(1, 61))),      # Full crawl
+        (40, set(range(41, 61))),       # Incremental refresh
+        (60, set())                     # Nothing new
+    ]
+)
+def test_crawl_articles(last_seen: Optional[int], expected: set):
+    """Test that every category is crawled, stopping at the last seen article.
+
+    Args:
+        last_seen: Article ID at which each category stops.
+        expected: Article IDs that should be yielded.
+
+    """
+    articles = {
+        'spotlight': list(range(60, 0, -3)),
+        'illust': list(range(59, 0, -3)),
+        'manga': list(range(58, 0, -3)),
+        'cosplay': list(range(60, 0, -6)),  # Overlaps with 'spotlight'
+    }
+    with patch('pixiv.api.models.get_articles', side_effect=create_articles_model(articles)):
+        ids = [article['id'] for article in crawl.crawl_articles(
+            AuthToken('access', 'refresh', 3600), last_seen=last_seen)]
+    assert len(ids) == len(set(ids)), 'Duplicate articles yielded.'
+    assert set(ids) == expected
+
+
+@pytest.mark.parametrize("ordered", [False, True])
+def test_crawl_sharded(ordered: bool):
+    """Test that a sharded crawl yields every item of every task.
+
+    Args:
+        ordered: Yield items in task order.
+
+    """
+    counts = [250, 0, 31, 120, 5, 64, 1, 99]
+    tasks = [sharding.CrawlTask(fake_listing, task, count=count)
+             for task, count in enumerate(counts)]
+    tokens = [AuthToken(f'access-{i}', 'refresh', 3600) for i in range(2)]
+    progress = []
+    results = list(sharding.crawl_sharded(
+        tasks, tokens, processes=3, ordered=ordered, batch_size=16,
+        progress=lambda done, total: progress.append((done, total))
+    ))
+    assert len(results) == sum(counts)
+    assert all(index == item['task'] for index, item in results)
+    assert {item['token'] for _, item in results} <= {'access-0', 'access-1'}
+    assert progress[-1] == (len(counts), len(counts))
+    if ordered:
+        assert [(item['task'], item['i']) for _, item in results] == [
+            (task, i) for task, count in enumerate(counts) for i in range(count)]
+
+
+def test_crawl_sharded_error():
+    """Test that an exception raised by a task is re-raised in the calling process."""
+    tasks = [sharding.CrawlTask(fake_listing, task, count=count)
+             for task, count in enumerate([40, 13, 40])]
+    with pytest.raises(ApiError):
+        list(sharding.crawl_sharded(tasks, [AuthToken('access', 'refresh', 3600)], processes=2))
+
+
+def test_crawl_sharded_broken_task():
+    """Test that a task which cannot be sent, or whose process dies, raises instead of hanging."""
+    tasks = [sharding.CrawlTask(fake_listing, 0, count=40),
+             sharding.CrawlTask(lambda auth_token: iter([]))]
+    with pytest.raises(Exception) as ex:
+        list(sharding.crawl_sharded(tasks, [AuthToken('access', 'refresh', 3600)], processes=2))
+    assert 'pickle' in repr(ex.value).lower()
+
+    tasks = [sharding.CrawlTask(fake_listing, 0, count=40), sharding.CrawlTask(dying_listing)]
+    with pytest.raises(BrokenProcessPool):
+        list(sharding.crawl_sharded(tasks, [AuthToken('access', 'refresh', 3600)], processes=2))
+
+
+def test_api_cursor():
+    """Test that an API function resumes after the page of a cursor."""
+    graph = create_follow_graph(users=200, degree=100)
+    token = AuthToken('access', 'refresh', 3600)
+    with patch('pixiv.api.models.get_following', side_effect=create_following_model(graph)):
+        pages = list(api.get_following(token, '0', pages=True))
+        resumed = list(api.get_following(token, '0', cursor=pages[1].next_url))
+    assert [len(page) for page in pages] == [30, 30, 30, 10]
+    assert [item['user']['id'] for item in resumed] == graph[0][60:]
+
+
+def test_job_worker(tmp_path):
+    """Test that a worker runs every job of the job_queue to completion on several threads."""
+    graph = create_follow_graph(users=200, degree=100)
+    job_queue = crawl_jobs.JobQueue(str(tmp_path / 'jobs.db'))
+    for user_id in range(5):
+        job_queue.submit(api.get_following, str(user_id))
+    with pytest.raises(ValueError):
+        job_queue.submit(lambda token: [], 1)
+
+    handled = {}
+    def handler(job, page):
+        handled.setdefault(job.args[0], []).extend(item['user']['id'] for item in page)
+
+    with patch('pixiv.api.models.get_following', side_effect=create_following_model(graph)):
+        worker = crawl_jobs.Worker(job_queue, AuthToken('access', 'refresh', 3600), handler,
+                                   concurrency=3, poll_interval=0.01)
+        worker.run(stop_when_idle=True)
+    assert handled == {str(user_id): graph[user_id] for user_id in range(5)}
+    assert job_queue.counts() == {'pending': 0, 'running': 0, 'done': 5, 'failed': 0}
+    assert job_queue.get(1)['items'] == 100
+
+
+def test_job_retry_resumes(tmp_path):
+    """Test that a failed job is retried from its last checkpoint, then marked as failed."""
+    graph = create_follow_graph(users=200, degree=100)
+    job_queue = crawl_jobs.JobQueue(str(tmp_path / 'jobs.db'), retry_delay=0)
+    job_id = job_queue.submit(api.get_following, '0', max_attempts=2)
+    failing_id = job_queue.submit(api.get_following, '1', max_attempts=2)
+
+    handled = []
+    def handler(job, page):
+        if job.id == failing_id or (len(handled) == 60 and job.attempts == 1):
+            raise RuntimeError('store unavailable')
+        handled.extend(item['user']['id'] for item in page)
+
+    with patch('pixiv.api.models.get_following', side_effect=create_following_model(graph)):
+        crawl_jobs.Worker(job_queue, AuthToken('access', 'refresh', 3600), handler,
+                          concurrency=1).run(stop_when_idle=True)
+    assert handled == graph[0]
+    assert job_queue.get(job_id)['state'] == crawl_jobs.JOB_STATE.DONE
+    assert job_queue.get(job_id)['attempts'] == 2
+    failed = job_queue.get(failing_id)
+    assert failed['state'] == crawl_jobs.JOB_STATE.FAILED
+    assert 'store unavailable' in failed['error']
+    assert job_queue.retry_failed() == 1
+    assert job_queue.counts()['pending'] == 1
+
+
+def test_job_lease(tmp_path):
+    """Test that an expired lease is claimed by another worker and the first one is refused."""
+    job_queue = crawl_jobs.JobQueue(str(tmp_path / 'jobs.db'), lease_seconds=0)
+    job_queue.submit(api.get_following, '0')
+    first = job_queue.claim('first')
+    second = job_queue.claim('second')
+    assert first.id == second.id and second.attempts == 2
+    with pytest.raises(crawl_jobs.LeaseLost):
+        job_queue.checkpoint(first, 'https://app-api.pixiv.net/v1/user/following?offset=30', 30)
+    job_queue.checkpoint(second, 'https://app-api.pixiv.net/v1/user/following?offset=30', 30)
+    job_queue.release(second)
+    third = job_queue.claim('third')
+    assert third.cursor.endswith('offset=30') and third.attempts == 2 and third.items == 30
+    assert job_queue.claim('fourth') is not None    # The lease of 'third' expired immediately.
+
+
+def test_job_lease_same_owner(tmp_path):
+    """Test that a stale claim is refused when the job was claimed again by the same worker."""
+    job_queue = crawl_jobs.JobQueue(str(tmp_path / 'jobs.db'), lease_seconds=0)
+    job_queue.submit(api.get_following, '0')
+    first = job_queue.claim('worker')
+    second = job_queue.claim('worker')
+    assert first.id == second.id and first.owner != second.owner
+    with pytest.raises(crawl_jobs.LeaseLost):
+        job_queue.checkpoint(first, 'https://app-api.pixiv.net/v1/user/following?offset=30', 30)
+    with pytest.raises(crawl_jobs.LeaseLost):
+        job_queue.complete(first, 30)
+    job_queue.complete(second, 30)
+    assert job_queue.get(second.id)['state'] == crawl_jobs.JOB_STATE.DONE
@@ -20,6 +20,7 @@ TODO: Add support for when a timeout occurs while sending the request and waitin
 
 """
 
+import json as jsonlib
 from typing import Callable, Dict, List, Optional, Any
 from unittest.mock import patch, MagicMock
 
@@ -72,7 +73,7 @@ _MODEL_TEST_INFO = {
     },
     'get_articles': {
         'fn': apimodels.get_articles,
-        'valid_args':    ['for_android', 'all', AuthToken('access', 'refresh', 3600)],
+        'valid_args':    ['for_android', 'all', None, AuthToken('access', 'refresh', 3600)],
         'valid_codes':   [200],
         'invalid_codes': [-200, 302, 400, 403, 404]
     },
@@ -87,6 +88,31 @@ _MODEL_TEST_INFO = {
         'valid_args':    ['for_android', 'day', None, AuthToken('access', 'refresh', 3600)],
         'valid_codes':   [200],
         'invalid_codes': [-200, 302, 400, 403, 404]
+    },
+    'search_illust': {
+        'fn': apimodels.search_illust,
+        'valid_args':    ['Fate', 'partial_match_for_tags', 'date_desc', None, None,
+                          'for_android', None, AuthToken('access', 'refresh', 3600)],
+        'valid_codes':   [200],
+        'invalid_codes': [-200, 302, 400, 403, 404]
+    },
+    'get_following': {
+        'fn': apimodels.get_following,
+        'valid_args':    ['12345', 'public', None, AuthToken('access', 'refresh', 3600)],
+        'valid_codes':   [200],
+        'invalid_codes': [-200, 302, 400, 403, 404]
+    },
+    'get_followers': {
+        'fn': apimodels.get_followers,
+        'valid_args':    ['12345', 'for_android', None, AuthToken('access', 'refresh', 3600)],
+        'valid_codes':   [200],
+        'invalid_codes': [-200, 302, 400, 403, 404]
+    },
+    'get_comment_replies': {
+        'fn': apimodels.get_comment_replies,
+        'valid_args':    ['12345', None, AuthToken('access', 'refresh', 3600)],
+        'valid_codes':   [200],
+        'invalid_codes': [-200, 302, 400, 403, 404]
     }
 }
 
@@ -107,13 +133,14 @@ def create_mock_response(status_code: int, json: Optional[Dict[str, Any]] = None
         The mocked object, which mocks a requests.Response object.
 
     """
-    # Add the 'json' function for the mocked response, and set return value to the provided
-    # json parameter value
+    # Add the 'json' function and the raw 'content' for the mocked response, both holding the
+    # provided json parameter value
     response_mock = MagicMock(
         json=MagicMock(
             # json member function returns the json value
             return_value=json
-        )
+        ),
+        content=jsonlib.dumps(json).encode('utf-8')
     )
     # Create the status code attribute for the mocked response
     response_mock.status_code = status_code
@@ -0,0 +1,128 @@
+"""Test cases for the compact record classes.
+
+Records are created from the items of the valid API testcases and converted back, which should
+give back the original item.
+
+"""
+
+import os
+import json
+import sys
+import threading
+from typing import Dict, Any
+from unittest.mock import patch
+
+import pytest
+
+from pixiv import api
+from pixiv.api import records
+from pixiv.common.data import AuthToken
+
+
+# -------------------------------------- Test Mapping ---------------------------------------
+_TESTCASE_DIR = os.path.dirname(__file__) + '/api_testcases'
+_RECORD_TEST_INFO = [
+    {'record': records.Illust, 'list_key': 'illusts', 'valid_json': 'get_recommended_valid.json'},
+    {'record': records.Illust, 'list_key': 'illusts', 'valid_json': 'get_rankings_valid.json'},
+    {'record': records.Comment, 'list_key': 'comments',
+     'valid_json': 'get_illust_comments_valid.json'},
+    {'record': records.BookmarkTag, 'list_key': 'bookmark_tags',
+     'valid_json': 'get_bookmark_tags_valid.json'},
+    {'record': records.Article, 'list_key': 'spotlight_articles',
+     'valid_json': 'get_articles_valid.json'},
+]
+
+
+# --------------------------------------- Test Cases ----------------------------------------
+@pytest.mark.parametrize(
+    "record, item",
+    [
+        (test_info['record'], item)
+        for test_info in _RECORD_TEST_INFO
+        for line in open(f"{_TESTCASE_DIR}/{test_info['valid_json']}", encoding='utf-8')
+        for item in json.loads(line)[test_info['list_key']]
+    ]
+)
+def test_record_round_trip(record: type, item: Dict[str, Any]):
+    """Test that a record holds the fields of the item it was created from.
+
+    Args:
+        record: The record class.
+        item: An item in JSON format.
+
+    """
+    converted = record(item)
+    assert all(getattr(converted, name) == item.get(name) for name in record._fields)
+    assert record(converted.to_dict()) == converted, 'Record changed after a round trip.'
+    if record is records.Illust:
+        assert converted.user.id == item['user']['id']
+        assert [tag.name for tag in converted.tags] == [tag['name'] for tag in item['tags']]
+        assert converted.image_urls == item['image_urls']
+        assert converted.meta_pages == item['meta_pages']
+
+
+def test_record_lazy_nested_fields():
+    """Test that nested fields stay packed until one of them is accessed."""
+    line = open(f'{_TESTCASE_DIR}/get_rankings_valid.json', encoding='utf-8').readline()
+    item = json.loads(line)['illusts'][0]
+    illust = records.Illust(item)
+    assert illust._packed, 'Nested fields were unpacked on creation.'
+    assert isinstance(illust.user, records.User)
+    assert illust.user.name == item['user']['name']
+    assert [tag.name for tag in illust.tags] == [tag['name'] for tag in item['tags']]
+    assert not illust._packed, 'Nested fields are still packed after being accessed.'
+
+
+def test_record_unpack_threads():
+    """Test that threads unpacking the same fresh records all see the same nested fields."""
+    with open(f'{_TESTCASE_DIR}/get_rankings_valid.json', encoding='utf-8') as testcase:
+        items = json.loads(testcase.readline())['illusts']
+    illusts = [records.Illust(item) for item in items * 20]
+    barrier = threading.Barrier(4)
+    seen = [[] for _ in range(4)]
+
+    def read(index):
+        barrier.wait()
+        seen[index].extend((illust.user, illust.tags) for illust in illusts)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=read, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    for fields in seen:
+        assert all(user is not None and tags is not None for user, tags in fields)
+        # Each nested field was published once, so every thread got the same objects.
+        for (user, tags), (first_user, first_tags) in zip(fields, seen[0]):
+            assert user is first_user and tags is first_tags
+
+
+def test_records_smaller_than_dicts(allocated):
+    """Test that records take less memory than the dictionaries decoded from the same JSON."""
+    texts = [
+        json.dumps(illust)
+        for line in open(f'{_TESTCASE_DIR}/get_recommended_valid.json', encoding='utf-8')
+        for illust in json.loads(line)['illusts']
+    ]
+
+    dict_size = allocated(lambda: [json.loads(text) for text in texts])
+    record_size = allocated(lambda: [records.Illust(json.loads(text)) for text in texts])
+    assert record_size < dict_size / 2
+
+
+def test_api_as_records():
+    """Test that an API function yields records when called with as_records=True."""
+    line = open(f'{_TESTCASE_DIR}/get_rankings_valid.json', encoding='utf-8').readline()
+    response = json.loads(line)
+    response['next_url'] = None
+    with patch('pixiv.api.models.get_rankings', return_value=response):
+        illusts = list(api.get_rankings(AuthToken('access', 'refresh', 3600), as_records=True))
+    assert illusts == [records.Illust(item) for item in response['illusts']]
+    with pytest.raises(TypeError):
+        next(api.get_following(AuthToken('access', 'refresh', 3600), '1', as_records=True))
@@ -0,0 +1,238 @@
+"""Test cases for the storage sinks.
+
+The sinks are fed with the items of the valid API testcases, the same JSON responses used by the
+API unit tests, and then read back.
+
+"""
+
+import os
+import bz2
+import gzip
+import json
+import lzma
+from collections import Counter
+from typing import Optional, Dict, List, Any
+
+import pytest
+
+from pixiv.store import SqliteStore, ArchiveWriter, ArchiveReader, JsonlExporter
+
+
+# ------------------------------------ Helper Functions -------------------------------------
+_TESTCASE_DIR = os.path.dirname(__file__) + '/api_testcases'
+
+
+def load_items(name: str, list_key: str) -> List[Dict[str, Any]]:
+    """Load every item of a valid API testcase file, dropping items with duplicate IDs."""
+    items = {}
+    for line in open(f'{_TESTCASE_DIR}/{name}_valid.json', encoding='utf-8').readlines():
+        for item in json.loads(line)[list_key]:
+            items.setdefault(item.get('id', item.get('name')), item)
+    return list(items.values())
+
+
+# --------------------------------------- Test Cases ----------------------------------------
+@pytest.mark.parametrize("batch_size", [1, 7, 500])
+def test_sqlite_store_illusts(tmp_path, batch_size: int):
+    """Test that illustrations, their users and tags are stored and can be read back.
+
+    Args:
+        tmp_path: Temporary directory for the database.
+        batch_size: Number of items written per transaction.
+
+    """
+    illusts = load_items('get_recommended', 'illusts')
+    with SqliteStore(str(tmp_path / 'pixiv.db'), batch_size=batch_size) as store:
+        assert store.add_illusts(illusts, bookmarked_by='12345', restrict='public') == len(illusts)
+        # Writing again updates instead of duplicating
+        store.add_illusts(illusts)
+
+        for illust in illusts:
+            assert store.illust(str(illust['id'])) == illust
+        assert len(list(store.bookmarks('12345'))) == len(illusts)
+        assert store.query('SELECT COUNT(*) AS count FROM illusts')[0]['count'] == len(illusts)
+        assert store.query('SELECT COUNT(*) AS count FROM users')[0]['count'] == len(
+            {illust['user']['id'] for illust in illusts})
+
+        tag_counts = {}
+        for illust in illusts:
+            for tag in {tag['name'] for tag in illust['tags']}:
+                tag_counts[tag] = tag_counts.get(tag, 0) + 1
+        assert dict(store.tag_counts()) == tag_counts
+        name, count = store.tag_counts(limit=1)[0]
+        assert len(list(store.illusts_by_tag(name))) == count
+
+
+def test_sqlite_store_retag(tmp_path):
+    """Test that upserting an illustration again replaces its tags and updates its counts."""
+    illust = load_items('get_recommended', 'illusts')[0]
+    with SqliteStore(str(tmp_path / 'pixiv.db')) as store:
+        store.add_illusts([illust])
+        removed, *kept = illust['tags']
+        updated = dict(illust, tags=kept + [{'name': 'new-tag', 'translated_name': None}],
+                       total_bookmarks=illust['total_bookmarks'] + 1)
+        store.add_illusts([updated])
+
+        assert not list(store.illusts_by_tag(removed['name']))
+        assert list(store.illusts_by_tag('new-tag')) == [updated]
+        assert store.illust(str(illust['id']))['total_bookmarks'] == updated['total_bookmarks']
+        assert store.query('SELECT COUNT(*) AS count FROM illust_tags')[0]['count'] == \
+            len({tag['name'] for tag in updated['tags']})
+
+
+class CountingConnection:
+    """Wrap a SQLite connection, counting the statements run with execute and executemany."""
+
+    def __init__(self, db):
+        self.db = db
+        self.calls = Counter()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.db, name)
+
+    def __enter__(self):
+        return self.db.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.db.__exit__(*exc_info)
+
+    def execute(self, *args):
+        self.calls['execute'] += 1
+        return self.db.execute(*args)
+
+    def executemany(self, *args):
+        self.calls['executemany'] += 1
+        return self.db.executemany(*args)
+
+
+def test_sqlite_store_batched(tmp_path):
+    """Test that each batch is written with a fixed number of statements, whatever its size."""
+    illusts = load_items('get_recommended', 'illusts')
+    with SqliteStore(str(tmp_path / 'pixiv.db'), batch_size=len(illusts)) as store:
+        calls = []
+        for _ in range(2):    # Inserted, then updated.
+            store._db = CountingConnection(store._db)  # pylint: disable=protected-access
+            store.add_illusts(illusts, bookmarked_by='12345', restrict='public')
+            calls.append(store._db.calls)  # pylint: disable=protected-access
+            store._db = store._db.db  # pylint: disable=protected-access
+        # An UPDATE and an INSERT for the users, illusts, tags and bookmarks, then the illust tags.
+        assert calls == [Counter(executemany=10)] * 2
+        assert store.query('SELECT COUNT(*) AS count FROM illusts')[0]['count'] == len(illusts)
+
+
+def test_sqlite_store_comments_and_bookmark_tags(tmp_path):
+    """Test that comments, replies and bookmark tags are stored."""
+    comments = load_items('get_illust_comments', 'comments')
+    replies = load_items('get_comment_replies', 'comments')
+    bookmark_tags = load_items('get_bookmark_tags', 'bookmark_tags')
+    with SqliteStore(str(tmp_path / 'pixiv.db')) as store:
+        store.add_comments(comments, illust_id='1')
+        store.add_comments(replies, illust_id='1', parent_id=str(comments[0]['id']))
+        assert store.add_bookmark_tags(bookmark_tags, '12345', 'public') == len(bookmark_tags)
+
+        stored = store.comments('1')
+        assert {row['id'] for row in stored} == {
+            comment['id'] for comment in comments + replies}
+        assert all(row['parent_id'] == comments[0]['id']
+                   for row in stored if row['id'] in {reply['id'] for reply in replies})
+        assert store.query('SELECT COUNT(*) AS count FROM bookmark_tags')[0]['count'] == len(
+            bookmark_tags)
+
+
+def test_archive_lookup(tmp_path):
+    """Test that every archived illustration can be found by ID with its fields intact."""
+    illusts = load_items('get_recommended', 'illusts')
+    path = str(tmp_path / 'illusts.pxa')
+    with ArchiveWriter(path) as writer:
+        assert writer.write_all(illusts) == len(illusts)
+
+    with ArchiveReader(path) as archive:
+        assert len(archive) == len(illusts)
+        for illust in illusts:
+            record = archive[illust['id']]
+            assert record.id == illust['id']
+            assert record.user_id == illust['user']['id']
+            assert record.total_bookmarks == illust['total_bookmarks']
+            assert record.page_count == illust['page_count']
+            assert record.title == illust['title']
+            assert record.json() == illust
+        assert 1 not in archive
+        assert archive.get(1) is None
+        with pytest.raises(KeyError):
+            archive[1]  # pylint: disable=pointless-statement
+        assert [record.id for record in archive] == [illust['id'] for illust in illusts]
+
+
+def test_archive_append(tmp_path):
+    """Test that appending to an archive keeps old records and replaces updated ones."""
+    illusts = load_items('get_recommended', 'illusts')
+    path = str(tmp_path / 'illusts.pxa')
+    with ArchiveWriter(path) as writer:
+        writer.write_all(illusts[:100])
+    updated = dict(illusts[0], total_bookmarks=illusts[0]['total_bookmarks'] + 1)
+    with ArchiveWriter(path) as writer:
+        writer.write_all(illusts[100:])
+        writer.write(updated)
+
+    with ArchiveReader(path) as archive:
+        assert len(archive) == len(illusts)
+        assert archive[updated['id']].total_bookmarks == updated['total_bookmarks']
+        assert all(illust['id'] in archive for illust in illusts)
+
+
+@pytest.mark.parametrize(
+    "compression, opener",
+    [
+        (None, open),
+        ('gzip', gzip.open),
+        ('bz2', bz2.open),
+        ('xz', lzma.open)
+    ]
+)
+@pytest.mark.parametrize("max_bytes", [None, 20000])
+def test_jsonl_export(tmp_path, compression: Optional[str], opener, max_bytes: Optional[int]):
+    """Test that exported files contain every item, one per line, in order.
+
+    Args:
+        tmp_path: Temporary directory for the exported files.
+        compression: Compression option.
+        opener: Function which opens an exported file for reading.
+        max_bytes: Maximum number of bytes of JSON per file.
+
+    """
+    illusts = load_items('get_recommended', 'illusts')
+    finalized = []
+    with JsonlExporter(str(tmp_path), 'recommended', compression=compression,
+                       max_bytes=max_bytes, fsync_interval=0,
+                       on_finalize=finalized.append) as exporter:
+        assert exporter.write_all(illusts) == len(illusts)
+
+    assert finalized == exporter.files
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in finalized)
+    if max_bytes is None:
+        assert len(exporter.files) == 1
+    else:
+        assert len(exporter.files) > 1
+
+    exported = []
+    for path in exporter.files:
+        with opener(path, 'rb') as exported_file:
+            exported.extend(json.loads(line) for line in exported_file)
+    assert exported == illusts
+
+
+def test_jsonl_export_error(tmp_path):
+    """Test that a file being written when the with block raises is not given its final name."""
+    illusts = load_items('get_recommended', 'illusts')
+    finalized = []
+    with pytest.raises(RuntimeError):
+        with JsonlExporter(str(tmp_path), 'recommended', max_bytes=20000,
+                           on_finalize=finalized.append) as exporter:
+            exporter.write_all(illusts)
+            raise RuntimeError('Export interrupted.')
+
+    partial = [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+    assert len(partial) == 1
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [os.path.basename(path) for path in finalized] + partial)
+    assert finalized == exporter.files